@@ -0,0 +1,262 @@
+from hash_index import HashIndex, MAX_LOAD, COMPACT_SLOT, FIRST_REFERENCE
+from mmap_store import RECORD, encode_key
+from serialization import encode_value, decode_value
+from tracing import logger
+
+DEFAULT_CAPACITY = 1 << 10  # Index slots of a new store
+HASH_MASK = (1 << 32) - 1  # Index slots store an unsigned 32-bit hash
+MAX_ARENA_BYTES = (1 << 32) - FIRST_REFERENCE  # Record offsets must fit the 32-bit references of the slots
+COMPACT_MIN_BYTES = 1024 * 1024  # Never compact an arena smaller than this
+COMPACT_RATIO = 2  # Compact once the arena holds this many bytes per live byte
+
+
+class ArenaStore:
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        """
+        A dictionary-like store that packs every key and value into one bytearray arena, in the record format
+        of MmapStore, with a HashIndex of 8-byte slots in a second bytearray mapping key hashes to record
+        offsets. A small entry costs its encoded bytes plus an 8-byte record header and 11 to 22 bytes of index
+        slots, instead of a Python object per key, per value and per dict slot, at the price of encoding on
+        every write and decoding on every read. Values come back as copies, so mutating one does not change
+        the stored value.
+
+        Keys are matched on their encoding, so only the key types of mmap_store.normalize_key() are accepted, and others
+        raise TypeError as unhashable keys do. Equal numbers are one key, as in a dict, and in MmapStore.
+
+        Updates and deletes leave dead records behind, which are dropped by compacting the arena once it
+        holds COMPACT_RATIO times the live bytes.
+
+        Records are addressed with 32-bit offsets, so the arena holds at most 4 GiB of them.
+
+        :param capacity: The initial number of index slots, a power of two. The index doubles as needed.
+        :type capacity: int
+        """
+        self.data = bytearray()
+        self.live_bytes = 0
+        self.count = 0
+        self.deleted_slots = 0
+        self.index = HashIndex(bytearray(HashIndex.size(capacity, COMPACT_SLOT)), 0, capacity, COMPACT_SLOT)
+
+    def key_at(self, offset):
+        """
+        Returns the encoded key of the record at `offset`.
+        """
+        key_length = RECORD.unpack_from(self.data, offset)[0]
+        start = offset + RECORD.size
+        return self.data[start:start + key_length]
+
+    def value_at(self, offset):
+        """
+        Decodes the value of the record at `offset`.
+        """
+        key_length = RECORD.unpack_from(self.data, offset)[0]
+        return decode_value(self.data, offset + RECORD.size + key_length)[0]
+
+    def record_size(self, offset):
+        """
+        Returns the number of bytes the record at `offset` occupies.
+        """
+        key_length, value_length = RECORD.unpack_from(self.data, offset)
+        return RECORD.size + key_length + value_length
+
+    def find(self, encoded_key):
+        """
+        Looks up an encoded key.
+
+        :return: (hash, slot holding the key or -1, first slot a new entry may use).
+        :rtype: tuple
+        """
+        hash_value = hash(encoded_key) & HASH_MASK  # The arena lives in one process, so the seeded hash is fine
+        slot, free = self.index.probe(hash_value, lambda offset: self.key_at(offset) == encoded_key)
+        return hash_value, slot, free
+
+    def __contains__(self, key):
+        try:
+            encoded_key = encode_key(key)
+        except TypeError:
+            return False
+        return self.find(encoded_key)[1] >= 0
+
+    def __getitem__(self, key):
+        _, slot, _ = self.find(encode_key(key))
+        if slot < 0:
+            raise KeyError(key)
+        return self.value_at(self.index.get(slot)[1])
+
+    def get(self, key, default=None):
+        """
+        Returns the value of a key, or `default` if it is not stored.
+        """
+        try:
+            encoded_key = encode_key(key)
+        except TypeError:
+            return default
+        _, slot, _ = self.find(encoded_key)
+        return default if slot < 0 else self.value_at(self.index.get(slot)[1])
+
+    def __setitem__(self, key, val):
+        encoded_key = encode_key(key)
+        out = bytearray(RECORD.size)
+        out += encoded_key
+        encode_value(val, out)
+        RECORD.pack_into(out, 0, len(encoded_key), len(out) - RECORD.size - len(encoded_key))
+        hash_value, slot, free = self.find(encoded_key)
+        if slot < 0 and self.count + self.deleted_slots + 1 > self.index.capacity * MAX_LOAD:
+            self.resize_index(self.index.capacity * 2 if self.count + 1 > self.index.capacity * MAX_LOAD // 2
+                              else self.index.capacity)
+            hash_value, slot, free = self.find(encoded_key)
+
+        if len(self.data) + len(out) > MAX_ARENA_BYTES:
+            self.compact()
+            if len(self.data) + len(out) > MAX_ARENA_BYTES:
+                raise MemoryError("The arena is full: records are limited to 4 GiB.")
+        offset = len(self.data)
+        self.data += out
+        self.live_bytes += len(out)
+        if slot >= 0:
+            self.live_bytes -= self.record_size(self.index.get(slot)[1])
+            self.index.put(slot, hash_value, offset)
+            self.compact_if_sparse()
+        else:
+            if self.index.is_deleted(free):
+                self.deleted_slots -= 1
+            self.index.put(free, hash_value, offset)
+            self.count += 1
+
+    def pop(self, key, *default):
+        """
+        Removes a key and returns its value, or `default` if it is not stored.
+        """
+        try:
+            encoded_key = encode_key(key)
+        except TypeError:
+            if default:
+                return default[0]
+            raise
+        _, slot, _ = self.find(encoded_key)
+        if slot < 0:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        offset = self.index.get(slot)[1]
+        val = self.value_at(offset)
+        self.index.remove(slot)
+        self.count -= 1
+        self.deleted_slots += 1
+        self.live_bytes -= self.record_size(offset)
+        self.compact_if_sparse()
+        return val
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def items(self):
+        """
+        Returns every (key, value) pair, decoding the whole store.
+
+        :rtype: list
+        """
+        return [(decode_value(self.key_at(offset), 0)[0], self.value_at(offset))
+                for _, offset in self.index.entries()]
+
+    def keys(self):
+        """
+        Returns every key.
+
+        :rtype: list
+        """
+        return [decode_value(self.key_at(offset), 0)[0] for _, offset in self.index.entries()]
+
+    def resize_index(self, capacity):
+        """
+        Rebuilds the index with `capacity` slots, dropping deleted markers.
+        """
+        entries = self.index.entries()
+        if capacity != self.index.capacity:
+            self.index = HashIndex(bytearray(HashIndex.size(capacity, COMPACT_SLOT)), 0, capacity, COMPACT_SLOT)
+        self.index.rebuild(entries)
+        self.deleted_slots = 0
+        logger.info("resize_index: Rebuilt arena index with %d slots.", capacity)
+
+    def compact_if_sparse(self):
+        """
+        Compacts the arena once dead records take up most of it.
+        """
+        if len(self.data) > max(COMPACT_MIN_BYTES, COMPACT_RATIO * self.live_bytes):
+            self.compact()
+
+    def compact(self):
+        """
+        Copies the live records into a fresh arena, reclaiming the space left by updates and deletes.
+        """
+        data = bytearray()
+        relocated = []
+        for hash_value, offset in self.index.entries():
+            relocated.append((hash_value, len(data)))
+            data += self.data[offset:offset + self.record_size(offset)]
+        self.data = data
+        self.live_bytes = len(data)
+        self.index.rebuild(relocated)
+        self.deleted_slots = 0
+        logger.info("compact: Kept %d records, %d bytes in use.", len(relocated), len(data))
+
+    def stats(self):
+        """
+        Returns the bytes the store occupies.
+
+        :return: 'arena_bytes' (records, live and dead), 'live_bytes' and 'index_bytes'.
+        :rtype: dict
+        """
+        return {'arena_bytes': len(self.data), 'live_bytes': self.live_bytes,
+                'index_bytes': HashIndex.size(self.index.capacity, COMPACT_SLOT)}
+
+
+if __name__ == '__main__':
+    store = ArenaStore(capacity=8)
+
+    store['a'] = 10
+    assert store['a'] == 10 and 'a' in store, "Failed to set key 'a'"
+    store['a'] = (1, 'x')
+    assert store.get('a') == (1, 'x'), "Failed to update key 'a'"
+    assert store.get('b') is None and 'b' not in store and [] not in store, "Non-existent key 'b' should be missing"
+    assert store.pop('a') == (1, 'x') and store.pop('a', None) is None, "Failed to delete key 'a'"
+
+    # Keys of any hashable type, and the index grows as needed
+    for i in range(1000):
+        store[f'key {i}'] = {'n': i}
+        store[i] = f'int {i}'
+    assert len(store) == 2000 and store.index.capacity > 8, "Index did not grow"
+    assert store['key 42'] == {'n': 42} and store[42] == 'int 42', "Lost a value while growing"
+    assert sorted(store.keys(), key=str)[:2] == [0, 1], "Wrong keys"
+
+    # Keys equal as Python objects are one key, as in a dict, and keys the encoding cannot compare are refused
+    store[True] = 'true'
+    assert store[1] == store[1.0] == 'true' and len(store) == 2000, "Equal numbers were stored as separate keys"
+    store[(1, 'x')] = 'tuple'
+    assert store.get((True, 'x')) == 'tuple' and store.pop((1.0, 'x')) == 'tuple', "Equal tuples did not match"
+    store[1] = 'int 1'
+    try:
+        store[frozenset({1, 2})] = 'set'
+        raise AssertionError("A frozenset key was stored")
+    except TypeError:
+        pass
+    assert frozenset() not in store and store.get(frozenset()) is None, "A frozenset key was found"
+
+    # Overwrites and deletes leave dead records until the arena is compacted
+    for _ in range(3):
+        for i in range(1000):
+            store[f'key {i}'] = 'v' * 500
+    for i in range(500):
+        del store[i]
+    stats = store.stats()
+    assert stats['arena_bytes'] < COMPACT_RATIO * stats['live_bytes'] + 600, "The arena was not compacted"
+    assert len(store) == 1500 and store[999] == 'int 999' and 0 not in store, "Compaction lost a record"
+    assert dict(store.items())['key 7'] == 'v' * 500, "Wrong items"
+
+    print("All assertions passed.")
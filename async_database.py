@@ -0,0 +1,312 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from file_database import FileDatabase
+from sync_database import SyncDatabase
+from tracing import logger
+
+MAX_WORKERS = 4  # Threads doing file I/O for one AsyncDatabase
+
+
+class AsyncReadWriteLock:
+    def __init__(self, prefer_writers=True):
+        """
+        A reader-writer lock for coroutines of one event loop, built like rwlock.ReadWriteLock from a reader count
+        and conditions. Waiting suspends the coroutine instead of blocking the loop's thread. Readers and writers
+        wait on separate conditions, so a release wakes only coroutines that can proceed, which keeps thousands of
+        waiting coroutines cheap.
+
+        :param prefer_writers: If True, new readers queue behind a waiting writer, so writers cannot starve.
+        :type prefer_writers: bool
+        """
+        lock = asyncio.Lock()
+        self.lock = lock
+        self.readers_ok = asyncio.Condition(lock)
+        self.writers_ok = asyncio.Condition(lock)
+        self.readers = 0
+        self.sleeping_readers = 0  # Readers waiting that were not woken yet
+        self.wakeups = 0  # Counts the times every waiting reader was woken
+        self.waiting_writers = 0
+        self.writer = False
+        self.prefer_writers = prefer_writers
+
+    def wake(self):
+        """
+        Wakes one writer if one can enter, otherwise every waiting reader. Called holding the lock.
+        """
+        if self.waiting_writers and not self.readers:
+            self.writers_ok.notify(1)
+        elif self.sleeping_readers and (not self.waiting_writers or not self.prefer_writers):
+            # notify_all() scans every waiter, including those already woken that have not run yet,
+            # so waking them again as each reader leaves would cost quadratic time
+            self.sleeping_readers = 0
+            self.wakeups += 1
+            self.readers_ok.notify_all()
+
+    async def acquire_read(self):
+        """
+        Suspends until shared read access is granted.
+        """
+        async with self.lock:
+            while self.writer or (self.prefer_writers and self.waiting_writers):
+                self.sleeping_readers += 1
+                wakeups = self.wakeups
+                try:
+                    await self.readers_ok.wait()
+                except BaseException:
+                    if self.wakeups == wakeups:  # Cancelled before being woken
+                        self.sleeping_readers -= 1
+                    raise
+            self.readers += 1
+
+    async def release_read(self):
+        """
+        Ends shared read access, waking a waiting writer when the last reader leaves.
+        """
+        async with self.lock:
+            self.readers -= 1
+            if self.readers == 0:
+                self.wake()
+
+    async def acquire_write(self):
+        """
+        Suspends until exclusive write access is granted.
+        """
+        async with self.lock:
+            self.waiting_writers += 1
+            try:
+                while self.writer or self.readers:
+                    await self.writers_ok.wait()
+            except BaseException:
+                self.waiting_writers -= 1
+                if not self.writer:
+                    self.wake()  # Readers may have been waiting only for this writer
+                raise
+            self.waiting_writers -= 1
+            self.writer = True
+
+    async def release_write(self):
+        """
+        Ends exclusive write access.
+        """
+        async with self.lock:
+            self.writer = False
+            self.wake()
+
+
+class AsyncDatabase:
+    def __init__(self, database=None, max_workers=MAX_WORKERS, prefer_writers=True):
+        """
+        Initializes an asyncio front-end to a FileDatabase, so any number of coroutines can share one store
+        without blocking the event loop.
+
+        Coroutines are synchronized by an AsyncReadWriteLock. Writes, and reads that touch the disk (mmap mode),
+        run on a bounded thread pool; reads of an in-memory dictionary are answered on the loop directly, since
+        handing them to a thread would cost more than the lookup. With group commit, a writer releases the lock
+        before waiting for its sync, as SyncDatabase does.
+
+        :param database: The store to wrap, by default a snapshot mode FileDatabase. A SyncDatabase may also be
+                         wrapped when it is shared with threads or processes outside the event loop.
+        :type database: FileDatabase or None
+        :param max_workers: The number of I/O threads, which also bounds how many operations wait on the pool.
+        :type max_workers: int
+        :param prefer_writers: Queue new readers behind waiting writers.
+        :type prefer_writers: bool
+        """
+        self.database = database if database is not None else FileDatabase()
+        self.lock = AsyncReadWriteLock(prefer_writers)
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='async-database')
+        self.slots = asyncio.Semaphore(max_workers)
+        # A SyncDatabase also takes its own lock, which may be held outside the loop and must be waited for on a thread
+        self.shared = isinstance(self.database, SyncDatabase)
+        self.inline_reads = self.database.persistence != 'mmap' and not self.shared
+        logger.info("AsyncDatabase initialized with %d I/O threads.", max_workers)
+
+    async def run(self, function, *args):
+        """
+        Runs a blocking call on the I/O threads, suspending the coroutine until it returns.
+
+        A running call cannot be stopped, so if the coroutine is cancelled it still waits for the call to
+        return before raising CancelledError. Until then, it keeps its I/O slot and the caller keeps its lock,
+        and no other writer can run alongside the call.
+        """
+        async with self.slots:
+            future = asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                while not future.done():
+                    try:
+                        await asyncio.wait([future])
+                    except asyncio.CancelledError:
+                        pass
+                raise
+
+    async def read(self, function, *args):
+        """
+        Runs a read with shared access.
+        """
+        await self.lock.acquire_read()
+        try:
+            if self.inline_reads:
+                return function(*args)
+            return await self.run(function, *args)
+        finally:
+            await self.lock.release_read()
+
+    def apply_shared(self, function, *args):
+        """
+        Runs an apply_* call holding the wrapped SyncDatabase's write lock. Called on an I/O thread.
+        """
+        self.database.get_write_access()
+        try:
+            return function(*args)
+        finally:
+            self.database.end_write()
+
+    async def write(self, function, *args):
+        """
+        Runs an apply_* call with exclusive access, then waits for durability outside the lock.
+        """
+        await self.lock.acquire_write()
+        try:
+            if self.shared:
+                result, ticket = await self.run(self.apply_shared, function, *args)
+            else:
+                result, ticket = await self.run(function, *args)
+        finally:
+            await self.lock.release_write()
+        if ticket is not None:
+            await self.run(self.database.wait_durable, ticket)
+        return result
+
+    async def set_value(self, val, key, ttl=None):
+        """
+        Sets a value for a specified key, expiring after `ttl` seconds if given.
+
+        :return: True if the operation is successful, False otherwise.
+        :rtype: bool
+        """
+        return await self.write(self.database.apply_set, val, key, ttl)
+
+    async def get_value(self, key):
+        """
+        Retrieves the value associated with the specified key.
+
+        :return: The value associated with the key if it exists, otherwise None.
+        :rtype: any or None
+        """
+        return await self.read(self.database.get_value, key)
+
+    async def delete_value(self, key):
+        """
+        Deletes the key-value pair associated with the specified key.
+
+        :return: The value associated with the deleted key if it exists, otherwise None.
+        :rtype: any or None
+        """
+        return await self.write(self.database.apply_delete, key)
+
+    async def set_many(self, items, ttl=None):
+        """
+        Sets many key-value pairs with one lock acquisition and one persist, expiring after `ttl` seconds if given.
+
+        :return: True for each key that was set.
+        :rtype: dict
+        """
+        return await self.write(self.database.apply_set_many, items, ttl)
+
+    async def get_many(self, keys):
+        """
+        Retrieves the values of many keys with one lock acquisition.
+
+        :return: For each key, its value if it exists, otherwise None.
+        :rtype: dict
+        """
+        return await self.read(self.database.get_many, list(keys))
+
+    async def delete_many(self, keys):
+        """
+        Deletes many keys with one lock acquisition and one persist.
+
+        :return: For each key, the deleted value if it existed, otherwise None.
+        :rtype: dict
+        """
+        return await self.write(self.database.apply_delete_many, list(keys))
+
+    async def close(self):
+        """
+        Waits for running operations, then closes the wrapped database and the I/O threads.
+        """
+        await self.lock.acquire_write()
+        try:
+            await self.run(self.database.close)
+        finally:
+            await self.lock.release_write()
+        self.executor.shutdown()
+
+
+if __name__ == '__main__':
+    import time
+
+    async def main():
+        db = AsyncDatabase(FileDatabase('log', file_path='async_database.pkl', log_path='async_database.wal'))
+        assert await db.set_value(10, 'a') == True, "Failed to set key 'a'"
+        assert await db.get_value('a') == 10, "Failed to get value for key 'a'"
+        assert await db.delete_value('a') == 10, "Failed to delete key 'a'"
+        assert await db.get_value('a') is None, "Key 'a' should be deleted and return None"
+        assert await db.set_many({'x': 1, 'y': 2}) == {'x': True, 'y': True}, "Failed to set a batch"
+        assert await db.get_many(['x', 'y']) == {'x': 1, 'y': 2}, "Failed to get a batch"
+        assert await db.delete_many(['x']) == {'x': 1}, "Failed to delete a batch"
+
+        # A waiting writer goes before readers that arrive after it
+        lock = AsyncReadWriteLock()
+        log = []
+
+        async def reader(name):
+            await lock.acquire_read()
+            log.append(name)
+            await asyncio.sleep(0.01)
+            await lock.release_read()
+
+        async def writer():
+            await lock.acquire_write()
+            log.append('writer')
+            await lock.release_write()
+
+        first = asyncio.create_task(reader('first reader'))
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(writer())
+        await asyncio.sleep(0)
+        late = asyncio.create_task(reader('late reader'))
+        await asyncio.gather(first, waiting, late)
+        assert log == ['first reader', 'writer', 'late reader'], f"Writer preference violated: {log}"
+
+        # A cancelled writer keeps the lock until its call returns, so the next writer never runs alongside it
+        running, overlaps = [], []
+
+        def slow_write():
+            running.append(1)
+            overlaps.append(len(running) > 1)
+            time.sleep(0.05)
+            running.pop()
+            return True, None
+
+        cancelled = asyncio.create_task(db.write(slow_write))
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        following = asyncio.create_task(db.write(slow_write))
+        try:
+            await cancelled
+            raise AssertionError("The write was not cancelled")
+        except asyncio.CancelledError:
+            pass
+        assert await following == True and overlaps == [False, False], "Writers overlapped after a cancellation"
+
+        await db.close()
+
+    asyncio.run(main())
+    import os
+    os.remove('async_database.pkl')
+    os.remove('async_database.wal')
+    print("All assertions passed.")
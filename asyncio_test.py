@@ -0,0 +1,203 @@
+import asyncio
+import time
+
+from async_database import AsyncDatabase
+
+COROUTINES = 5000  # Concurrent coroutines in the shared store test
+MAX_LOOP_DELAY = 0.25  # Seconds the event loop may be kept from running the heartbeat in that test
+
+
+class AsyncioTest:
+    def __init__(self):
+        """
+        Initializes an instance of the AsyncioTest class, the asyncio counterpart of ThreadingTest.
+        Sets up a list to manage tasks and an AsyncDatabase instance.
+
+        :return: None
+        :rtype: None
+        """
+        self.tasks_list = []
+        self.data_base = AsyncDatabase()
+
+
+    def start(self, coroutine):
+        """
+        Schedules a coroutine as a task and remembers it.
+
+        :return: None
+        :rtype: None
+        """
+        self.tasks_list.append(asyncio.create_task(coroutine))
+
+
+    async def join(self):
+        """
+        Waits for every scheduled task to complete.
+
+        :return: None
+        :rtype: None
+        """
+        await asyncio.gather(*self.tasks_list)
+        self.tasks_list = []
+
+
+    async def test_1(self):
+        """
+        Executes a write test by setting a value in the database.
+
+        :return: None
+        :rtype: None
+        """
+        # Write Test
+        await self.data_base.set_value('complete', 'test 1')
+
+
+    async def test_2(self):
+        """
+        Executes a read test by retrieving a value from the database.
+
+        :return: The value associated with the key 'test 1' if it exists, otherwise None.
+        :rtype: any or None
+        """
+        # Read Test
+        return await self.data_base.get_value('test 1')
+
+
+    async def test_3(self):
+        """
+        Executes a test to read and then write a value concurrently.
+
+        :return: None
+        :rtype: None
+        """
+        self.start(self.data_base.get_value('test 3'))
+        self.start(self.data_base.set_value('complete', 'test 3'))
+        await self.join()
+
+
+    async def test_4(self):
+        """
+        Executes a test to write and then read a value concurrently.
+
+        :return: None
+        :rtype: None
+        """
+        # Write then Read Test
+        self.start(self.data_base.set_value('complete', 'test 4'))
+        self.start(self.data_base.get_value('test 4'))
+        await self.join()
+
+
+    async def test_5(self):
+        """
+        Executes a test with multiple read requests on the same key.
+
+        :return: None
+        :rtype: None
+        """
+        for i in range(1, 15):
+            self.start(self.data_base.get_value('test 5'))
+        await self.join()
+
+
+    async def test_6(self):
+        """
+        Executes a test with multiple concurrent read requests and one write request on the same key.
+
+        :return: None
+        :rtype: None
+        """
+        for i in range(1, 7):
+            self.start(self.data_base.get_value('test 6'))
+
+        self.start(self.data_base.set_value('complete', 'test 6'))
+
+        for i in range(1, 7):
+            self.start(self.data_base.get_value('test 6'))
+        await self.join()
+
+
+    async def test_7(self):
+        """
+        Executes a test with multiple read requests followed by multiple write requests on the same key.
+
+        :return: None
+        :rtype: None
+        """
+        # Multiple Reads, then multiple Writes Test
+        for i in range(1, 3):
+            self.start(self.data_base.get_value('test 7'))
+
+        self.start(self.data_base.set_value('complete 1', 'test 7'))
+        self.start(self.data_base.set_value('complete 2', 'test 7'))
+        await self.join()
+
+
+    async def test_8(self):
+        """
+        Executes a test with thousands of coroutines reading and writing concurrently, while a heartbeat
+        coroutine measures how long the event loop is kept from running it. File I/O runs on the I/O threads,
+        so the delay is bounded by the CPU time of the coroutines that become ready together, not by the disk.
+
+        :return: The seconds the coroutines took and the largest heartbeat delay in seconds.
+        :rtype: tuple
+        """
+        finished = False
+        largest_delay = 0.0
+
+        async def heartbeat():
+            nonlocal largest_delay
+            while not finished:
+                start = time.perf_counter()
+                await asyncio.sleep(0.001)
+                largest_delay = max(largest_delay, time.perf_counter() - start - 0.001)
+
+        async def client(index):
+            if index % 10 == 0:
+                await self.data_base.set_value(index, f'test 8 key {index % 100}')
+            else:
+                await self.data_base.get_value(f'test 8 key {index % 100}')
+
+        beat = asyncio.create_task(heartbeat())
+        start = time.perf_counter()
+        for index in range(COROUTINES):
+            self.start(client(index))
+        await self.join()
+        elapsed = time.perf_counter() - start
+        finished = True
+        await beat
+        return elapsed, largest_delay
+
+
+    async def test_all(self):
+        """
+        Runs all tests sequentially to test the database in various read and write concurrency scenarios.
+
+        :return: None
+        :rtype: None
+        """
+        # Commence all Tests
+        print('-----------------------------------start test 1-----------------------------------')
+        await self.test_1()
+        print('-----------------------------------start test 2-----------------------------------')
+        await self.test_2()
+        print('-----------------------------------start test 3-----------------------------------')
+        await self.test_3()
+        print('-----------------------------------start test 4-----------------------------------')
+        await self.test_4()
+        print('-----------------------------------start test 5-----------------------------------')
+        await self.test_5()
+        print('-----------------------------------start test 6-----------------------------------')
+        await self.test_6()
+        print('-----------------------------------start test 7-----------------------------------')
+        await self.test_7()
+        print('-----------------------------------start test 8-----------------------------------')
+        elapsed, largest_delay = await self.test_8()
+        print(f'{COROUTINES} coroutines in {elapsed:.2f} s, largest event loop delay {largest_delay * 1000:.1f} ms')
+        assert largest_delay < MAX_LOOP_DELAY, f"The event loop was blocked for {largest_delay * 1000:.1f} ms"
+        await self.data_base.close()
+
+
+if __name__ == '__main__':
+    test = AsyncioTest()
+    asyncio.run(test.test_all())
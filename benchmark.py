@@ -0,0 +1,225 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from dict_database import DictDatabase
+from metrics import metrics, enable_metrics, disable_metrics
+from file_database import FileDatabase
+from sync_database import SyncDatabase
+
+TARGETS = ('dict', 'file', 'sync')
+DISTRIBUTIONS = ('uniform', 'zipf')
+PERCENTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+def percentile(samples, fraction):
+    """
+    Returns the value below which `fraction` of the sorted samples fall.
+    """
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def summarize(samples):
+    """
+    Summarizes latency samples in microseconds.
+
+    :param samples: Durations in seconds.
+    :type samples: list
+    :return: The count, mean, percentiles and maximum, or just the count if there are no samples.
+    :rtype: dict
+    """
+    if not samples:
+        return {'count': 0}
+    samples = sorted(samples)
+    summary = {'count': len(samples), 'mean_us': sum(samples) / len(samples) * 1e6}
+    for fraction in PERCENTILES:
+        summary[f'p{fraction * 100:g}_us'] = percentile(samples, fraction) * 1e6
+    summary['max_us'] = samples[-1] * 1e6
+    return summary
+
+
+def key_weights(keys, distribution, skew):
+    """
+    Returns the cumulative weights that make random.choices follow the key distribution.
+    Key i has weight 1 / (i + 1) ** skew under 'zipf', so a few keys take most of the requests.
+
+    :rtype: list or None
+    """
+    if distribution == 'uniform':
+        return None
+    return list(itertools.accumulate(1.0 / (rank + 1) ** skew for rank in range(keys)))
+
+
+def make_workload(seed, operations, keys, read_ratio, cum_weights):
+    """
+    Generates one worker's requests before timing, so their generation is not measured.
+
+    :return: (is_read, key) pairs.
+    :rtype: list
+    """
+    rng = random.Random(seed)
+    ranks = rng.choices(range(keys), cum_weights=cum_weights, k=operations)
+    return [(rng.random() < read_ratio, f'key {rank}') for rank in ranks]
+
+
+def make_database(target, persistence, directory, lock):
+    """
+    Creates the store to measure, with its files in `directory`.
+    """
+    paths = dict(file_path=os.path.join(directory, 'benchmark.pkl'), log_path=os.path.join(directory, 'benchmark.wal'))
+    if target == 'dict':
+        return DictDatabase()
+    if target == 'file':
+        return FileDatabase(persistence, **paths)
+    return SyncDatabase('threading', lock=lock, persistence=persistence, **paths)
+
+
+def time_lock_waits(database, waits):
+    """
+    Wraps a SyncDatabase's lock requests so the time each caller spends waiting for them is recorded in
+    `waits`, a list per thread keyed by thread identifier.
+    """
+    for name in ('get_read_access', 'get_write_access'):
+        acquire = getattr(database, name)
+
+        def timed(acquire=acquire):
+            start = time.perf_counter()
+            acquire()
+            waits[threading.get_ident()].append(time.perf_counter() - start)
+
+        setattr(database, name, timed)
+
+
+def run(target, workers, read_ratio, distribution, skew, keys, value_size, operations, persistence, lock='rwlock',
+        with_metrics=False):
+    """
+    Measures one configuration: `workers` threads each issue `operations` requests against a store preloaded
+    with `keys` keys. DictDatabase and FileDatabase do not synchronize their callers, so their workers take
+    turns under one mutex, whose waits are reported as lock waits like those of SyncDatabase's own lock.
+    With `with_metrics`, the metrics of the measured requests (see metrics.py) are included too.
+
+    :return: The configuration and its throughput, latencies and lock waits.
+    :rtype: dict
+    """
+    directory = tempfile.mkdtemp(prefix='benchmark_')
+    database = make_database(target, persistence, directory, lock)
+    value = 'v' * value_size
+    database.set_many({f'key {rank}': value for rank in range(keys)})
+    cum_weights = key_weights(keys, distribution, skew)
+    workloads = [make_workload(index, operations, keys, read_ratio, cum_weights) for index in range(workers)]
+    reads = [[] for _ in range(workers)]
+    writes = [[] for _ in range(workers)]
+    waits = {}
+    mutex = threading.Lock() if target != 'sync' else None
+    if mutex is None:
+        time_lock_waits(database, waits)
+    barrier = threading.Barrier(workers + 1)
+    if with_metrics:
+        metrics.reset()
+        enable_metrics()
+
+    def worker(index):
+        thread_waits = waits[threading.get_ident()] = []
+        read_samples, write_samples = reads[index], writes[index]
+        barrier.wait()
+        for is_read, key in workloads[index]:
+            start = time.perf_counter()
+            if mutex is not None:
+                mutex.acquire()
+                thread_waits.append(time.perf_counter() - start)
+            try:
+                if is_read:
+                    database.get_value(key)
+                else:
+                    database.set_value(value, key)
+            finally:
+                if mutex is not None:
+                    mutex.release()
+            (read_samples if is_read else write_samples).append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(workers)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if with_metrics:
+        disable_metrics()
+    if hasattr(database, 'close'):
+        database.close()
+    shutil.rmtree(directory)
+
+    all_waits = [sample for thread_waits in waits.values() for sample in thread_waits]
+    lock_wait = summarize(all_waits)
+    lock_wait['total_s'] = sum(all_waits)
+    lock_wait['fraction_of_worker_time'] = sum(all_waits) / (elapsed * workers)
+    result = {
+        'target': target,
+        'persistence': persistence if target != 'dict' else None,
+        'lock': lock if target == 'sync' else None,
+        'workers': workers,
+        'read_ratio': read_ratio,
+        'distribution': distribution,
+        'skew': skew if distribution == 'zipf' else None,
+        'keys': keys,
+        'value_size': value_size,
+        'operations': workers * operations,
+        'elapsed_s': elapsed,
+        'throughput_ops_s': workers * operations / elapsed,
+        'read_latency': summarize([sample for samples in reads for sample in samples]),
+        'write_latency': summarize([sample for samples in writes for sample in samples]),
+        'lock_wait': lock_wait,
+    }
+    if with_metrics:
+        result['metrics'] = metrics.snapshot()
+    return result
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Measures throughput, latency and lock waits of the stores under '
+                                                 'concurrent mixed workloads, and prints the results as JSON.')
+    parser.add_argument('--targets', nargs='+', choices=TARGETS, default=list(TARGETS))
+    parser.add_argument('--workers', nargs='+', type=int, default=[1, 4, 16])
+    parser.add_argument('--read-ratios', nargs='+', type=float, default=[0.9, 0.5])
+    parser.add_argument('--distributions', nargs='+', choices=DISTRIBUTIONS, default=list(DISTRIBUTIONS))
+    parser.add_argument('--skew', type=float, default=0.99, help='Zipf exponent.')
+    parser.add_argument('--value-sizes', nargs='+', type=int, default=[100])
+    parser.add_argument('--keys', type=int, default=1000)
+    parser.add_argument('--operations', type=int, default=2000, help='Requests per worker.')
+    parser.add_argument('--persistence', default='log', help='FileDatabase persistence mode of file and sync.')
+    parser.add_argument('--locks', nargs='+', choices=('rwlock', 'semaphores', 'mvcc'), default=['rwlock'],
+                        help='SyncDatabase lock modes.')
+    parser.add_argument('--metrics', action='store_true', help='Include lock, serialize, write and sync metrics.')
+    parser.add_argument('--output', help='Write the JSON to this file instead of standard output.')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    arguments = parse_arguments()
+    results = []
+    stores = [(target, lock) for target in arguments.targets
+              for lock in (arguments.locks if target == 'sync' else ['rwlock'])]
+    for (target, lock), workers, read_ratio, distribution, value_size in itertools.product(
+            stores, arguments.workers, arguments.read_ratios, arguments.distributions, arguments.value_sizes):
+        results.append(run(target, workers, read_ratio, distribution, arguments.skew, arguments.keys, value_size,
+                           arguments.operations, arguments.persistence, lock, arguments.metrics))
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'results': results,
+    }
+    if arguments.output:
+        with open(arguments.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,330 @@
+import threading
+from collections import OrderedDict
+
+from tracing import logger
+
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+
+class LRUPolicy:
+    def __init__(self, capacity):
+        """
+        Least recently used eviction under a byte budget.
+
+        :param capacity: The byte budget.
+        :type capacity: int
+        """
+        self.capacity = capacity
+        self.entries = OrderedDict()  # Key -> (entry, size), least recently used first
+        self.bytes = 0
+
+    def get(self, key):
+        """
+        Returns the cached entry of a key and marks it recently used, or None.
+        """
+        item = self.entries.get(key)
+        if item is None:
+            return None
+        self.entries.move_to_end(key)
+        return item[0]
+
+    def put(self, key, entry, size):
+        """
+        Caches an entry, evicting others until it fits.
+
+        :return: The number of entries evicted.
+        :rtype: int
+        """
+        self.remove(key)
+        if size > self.capacity:
+            return 0  # Would evict everything and still not fit
+        self.entries[key] = (entry, size)
+        self.bytes += size
+        evicted = 0
+        while self.bytes > self.capacity:
+            _, (_, old_size) = self.entries.popitem(last=False)
+            self.bytes -= old_size
+            evicted += 1
+        return evicted
+
+    def remove(self, key):
+        """
+        Drops a key from the cache.
+        """
+        item = self.entries.pop(key, None)
+        if item is not None:
+            self.bytes -= item[1]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class ARCPolicy:
+    def __init__(self, capacity):
+        """
+        Adaptive replacement cache eviction under a byte budget. Keys seen once (recency, T1) and keys seen again
+        (frequency, T2) are kept in separate LRU lists, and the budget split between them adapts to hits on
+        recently evicted keys (the ghost lists B1 and B2), so a scan of cold keys cannot flush the hot set.
+
+        :param capacity: The byte budget.
+        :type capacity: int
+        """
+        self.capacity = capacity
+        self.target = 0  # Bytes T1 aims to hold, the rest goes to T2
+        self.t1, self.t2 = OrderedDict(), OrderedDict()  # Key -> (entry, size)
+        self.b1, self.b2 = OrderedDict(), OrderedDict()  # Key -> size of an evicted entry
+        self.t1_bytes = self.t2_bytes = self.b1_bytes = self.b2_bytes = 0
+
+    @property
+    def bytes(self):
+        return self.t1_bytes + self.t2_bytes
+
+    def get(self, key):
+        """
+        Returns the cached entry of a key and promotes it to the frequency list, or None.
+        """
+        item = self.t1.pop(key, None)
+        if item is not None:
+            self.t1_bytes -= item[1]
+            self.t2[key] = item
+            self.t2_bytes += item[1]
+            return item[0]
+        item = self.t2.get(key)
+        if item is None:
+            return None
+        self.t2.move_to_end(key)
+        return item[0]
+
+    def put(self, key, entry, size):
+        """
+        Caches an entry, evicting others until it fits.
+
+        :return: The number of entries evicted.
+        :rtype: int
+        """
+        self.remove(key)
+        if size > self.capacity:
+            return 0
+        if key in self.b1:
+            # Evicted from T1 too early: give recency more room
+            self.target = min(self.capacity, self.target + max(size, size * self.b2_bytes // max(self.b1_bytes, 1)))
+            self.b1_bytes -= self.b1.pop(key)
+            self.t2[key] = (entry, size)
+            self.t2_bytes += size
+        elif key in self.b2:
+            # Evicted from T2 too early: give frequency more room
+            self.target = max(0, self.target - max(size, size * self.b1_bytes // max(self.b2_bytes, 1)))
+            self.b2_bytes -= self.b2.pop(key)
+            self.t2[key] = (entry, size)
+            self.t2_bytes += size
+        else:
+            self.t1[key] = (entry, size)
+            self.t1_bytes += size
+        evicted = 0
+        while self.bytes > self.capacity:
+            self.replace()
+            evicted += 1
+        self.trim_ghosts()
+        return evicted
+
+    def replace(self):
+        """
+        Evicts the least recently used entry of T1 if it is over its target, otherwise of T2,
+        remembering the key in the matching ghost list.
+        """
+        if self.t1 and (self.t1_bytes > self.target or not self.t2):
+            key, (_, size) = self.t1.popitem(last=False)
+            self.t1_bytes -= size
+            self.b1[key] = size
+            self.b1_bytes += size
+        else:
+            key, (_, size) = self.t2.popitem(last=False)
+            self.t2_bytes -= size
+            self.b2[key] = size
+            self.b2_bytes += size
+
+    def trim_ghosts(self):
+        """
+        Bounds the ghost lists to the budget, so remembering evicted keys costs at most as much as the cache.
+        """
+        while self.b1 and self.t1_bytes + self.b1_bytes > self.capacity:
+            self.b1_bytes -= self.b1.popitem(last=False)[1]
+        while self.b2 and self.bytes + self.b1_bytes + self.b2_bytes > 2 * self.capacity:
+            self.b2_bytes -= self.b2.popitem(last=False)[1]
+
+    def remove(self, key):
+        """
+        Drops a key from the cache. Ghost entries are kept, since they describe past accesses.
+        """
+        item = self.t1.pop(key, None)
+        if item is not None:
+            self.t1_bytes -= item[1]
+            return
+        item = self.t2.pop(key, None)
+        if item is not None:
+            self.t2_bytes -= item[1]
+
+    def __len__(self):
+        return len(self.t1) + len(self.t2)
+
+
+POLICIES = {'lru': LRUPolicy, 'arc': ARCPolicy}
+
+
+class CachedStore:
+    def __init__(self, store, capacity=DEFAULT_CACHE_BYTES, policy='lru'):
+        """
+        Fronts an MmapStore with a bounded in-memory cache of decoded values, so hot keys skip decoding
+        while cold values stay on disk. Behaves like the store it wraps.
+
+        Each cached value remembers the store generation and record offset it was decoded from. A lookup still
+        probes the on-disk index, and the cached value is only used if the key's record is the same one, so a
+        change made by any thread or process through any handle invalidates it.
+
+        :param store: The store holding every value.
+        :type store: MmapStore
+        :param capacity: The cache budget in bytes, counted as the encoded size of the cached records.
+        :type capacity: int
+        :param policy: The eviction policy, 'lru' or 'arc'.
+        :type policy: str
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Cache policy must be one of {tuple(POLICIES)}.")
+        self.store = store
+        self.policy = POLICIES[policy](capacity)
+        self.lock = threading.Lock()  # Readers share the database lock but all update the recency lists
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        logger.info("CachedStore initialized with a %d byte %s cache.", capacity, policy)
+
+    def __getitem__(self, key):
+        offset = self.store.locate(key)
+        if offset < 0:
+            with self.lock:
+                self.policy.remove(key)
+            raise KeyError(key)
+        version = (self.store.generation, offset)
+        with self.lock:
+            entry = self.policy.get(key)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        val = self.store.value_at(offset)
+        size = self.store.record_size(offset)
+        with self.lock:
+            self.evictions += self.policy.put(key, (version, val), size)
+        return val
+
+    def get(self, key, default=None):
+        """
+        Returns the value of a key, or `default` if it is not stored.
+        """
+        try:
+            return self[key]
+        except (KeyError, TypeError):
+            return default
+
+    def __contains__(self, key):
+        return key in self.store
+
+    def __setitem__(self, key, val):
+        self.store[key] = val
+        with self.lock:
+            self.policy.remove(key)
+
+    def pop(self, key, *default):
+        """
+        Removes a key and returns its value, or `default` if it is not stored.
+        """
+        with self.lock:
+            try:
+                self.policy.remove(key)
+            except TypeError:
+                pass
+        return self.store.pop(key, *default)
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+    def __len__(self):
+        return len(self.store)
+
+    def items(self):
+        return self.store.items()
+
+    def keys(self):
+        return self.store.keys()
+
+    def refresh(self):
+        self.store.refresh()
+
+    def flush(self):
+        self.store.flush()
+
+    def close(self):
+        self.store.close()
+
+    def stats(self):
+        """
+        Returns cache statistics.
+
+        :return: Hits, misses, evictions, cached entries and cached bytes.
+        :rtype: dict
+        """
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.policy),
+                'bytes': self.policy.bytes,
+            }
+
+
+if __name__ == '__main__':
+    import os
+    from mmap_store import MmapStore, index_path
+
+    # LRU keeps the most recently used entries within the budget
+    lru = LRUPolicy(30)
+    for key in 'abc':
+        lru.put(key, key, 10)
+    lru.get('a')
+    assert lru.put('d', 'd', 10) == 1 and lru.get('b') is None, "LRU evicted the wrong entry"
+
+    # ARC keeps a re-used key through a scan of keys used once
+    arc = ARCPolicy(40)
+    arc.put('hot', 'hot', 10)
+    arc.get('hot')
+    for i in range(20):
+        arc.put(i, i, 10)
+    assert arc.get('hot') == 'hot', "A scan flushed the frequently used key"
+    assert arc.bytes <= 40, "ARC exceeded its budget"
+
+    test_path = 'cache_test.dat'
+    for policy in POLICIES:
+        store = MmapStore(test_path)
+        cached = CachedStore(store, capacity=1024, policy=policy)
+        store['a'] = 'x' * 100
+        assert cached['a'] == 'x' * 100 and cached['a'] == 'x' * 100, "Failed to read through the cache"
+        assert cached.stats()['hits'] == 1 and cached.stats()['misses'] == 1, "Expected one miss then one hit"
+
+        # A write through another handle, as another process would make, invalidates the cached value
+        other = MmapStore(test_path)
+        other['a'] = 'y'
+        assert cached['a'] == 'y', "Stale value served after another handle changed it"
+        other.pop('a')
+        assert cached.get('a') is None, "Deleted key served from the cache"
+
+        for i in range(50):
+            cached[f'key {i}'] = 'z' * 100
+            cached[f'key {i}']
+        assert cached.stats()['evictions'] > 0 and cached.stats()['bytes'] <= 1024, "Budget not enforced"
+        other.close()
+        store.close()
+        os.remove(test_path)
+        os.remove(index_path(test_path))
+
+    print("All assertions passed.")
@@ -0,0 +1,98 @@
+import random
+import threading
+import time
+from collections import deque
+
+FEED_CAPACITY = 100000  # Batches kept for readers catching up; one further behind must start from a snapshot
+FEED_BATCH = 1000  # Most batches returned by one read
+POLL_TIMEOUT = 0.5  # Seconds a read waits for new batches
+
+
+class ChangeFeed:
+    def __init__(self, capacity=FEED_CAPACITY):
+        """
+        A change data capture stream: the committed changes of a database, in commit order, one batch per
+        commit. Each batch is (sequence, commit time, records), where sequences count up from 1 without gaps,
+        the commit time is time.time_ns() so readers in other processes can measure their lag, and records
+        are ('s', key, value) for a set or ('d', key) for a delete.
+
+        The newest `capacity` batches are kept in memory. A reader that falls further behind is told so
+        and must start again from a snapshot taken together with its sequence.
+
+        Sequences start again from 1 in every new feed, e.g. when the primary restarts, so each feed has a
+        random epoch: a reader that finds the epoch changed must start again from a snapshot too, since
+        sequences of the new feed say nothing about what it applied from the old one.
+
+        :param capacity: The number of batches kept.
+        :type capacity: int
+        """
+        self.entries = deque(maxlen=capacity)
+        self.sequence = 0  # Of the newest batch
+        self.epoch = random.getrandbits(63)
+        self.changed = threading.Condition()
+
+    def append(self, records):
+        """
+        Adds the records of one commit and wakes the waiting readers.
+
+        :param records: ('s', key, value) and ('d', key) tuples, in order.
+        :type records: list
+        :return: The batch's sequence.
+        :rtype: int
+        """
+        with self.changed:
+            self.sequence += 1
+            self.entries.append((self.sequence, time.time_ns(), records))
+            self.changed.notify_all()
+            return self.sequence
+
+    def read(self, after, timeout=POLL_TIMEOUT, limit=FEED_BATCH):
+        """
+        Returns the batches committed after sequence `after`, waiting up to `timeout` seconds for one if
+        there are none yet.
+
+        :param after: The sequence of the last batch the reader has applied, 0 for none.
+        :type after: int
+        :param timeout: Seconds to wait, or 0 to return at once.
+        :type timeout: float
+        :param limit: The most batches to return, or None for all of them.
+        :type limit: int or None
+        :return: The batches in order, possibly none, or None if the ones following `after` are no longer
+                 kept, or `after` is ahead of this feed.
+        :rtype: list or None
+        """
+        with self.changed:
+            if self.sequence == after and timeout:
+                self.changed.wait_for(lambda: self.sequence != after, timeout)
+            entries = self.entries
+            missing = self.sequence - after
+            if missing < 0 or missing > len(entries):
+                return None
+            count = missing if limit is None else min(missing, limit)
+            first = len(entries) - missing
+            return [entries[i] for i in range(first, first + count)]  # Near the end, where deque indexing is fast
+
+
+if __name__ == '__main__':
+    feed = ChangeFeed(capacity=3)
+    assert feed.read(0, timeout=0) == [], "An empty feed returned batches"
+    for i in range(4):
+        feed.append([('s', f'key {i}', i)])
+    batches = feed.read(1, timeout=0)
+    assert [batch[0] for batch in batches] == [2, 3, 4], "Wrong batches after sequence 1"
+    assert batches[-1][2] == [('s', 'key 3', 3)] and batches[0][1] <= batches[-1][1], "Wrong batch contents"
+    assert [batch[0] for batch in feed.read(2, timeout=0, limit=1)] == [3], "Limit ignored"
+    assert feed.read(0, timeout=0) is None, "A reader behind the kept batches was not told to resynchronize"
+    assert feed.read(5, timeout=0) is None, "A reader ahead of the feed was not told to resynchronize"
+    assert ChangeFeed().epoch != feed.epoch, "Two feeds share an epoch"
+
+    # A waiting reader wakes up on the next commit
+    results = []
+    reader = threading.Thread(target=lambda: results.append(feed.read(4, timeout=5)))
+    reader.start()
+    time.sleep(0.05)
+    feed.append([('d', 'key 0')])
+    reader.join()
+    assert results == [[(5, results[0][0][1], [('d', 'key 0')])]], "The waiting reader missed the commit"
+
+    print("All assertions passed.")
@@ -0,0 +1,233 @@
+import os
+import threading
+import time
+
+from serialization import JsonCodec, detect_codec, MAGIC_SIZE
+from tracing import logger
+
+DIRTY_THRESHOLD = 1000  # Checkpoint once this many keys changed
+CHECKPOINT_INTERVAL = 5.0  # Checkpoint at least this often (seconds) while there are changes
+
+TOMBSTONE = object()  # Marks a key deleted since the last checkpoint
+
+
+class CheckpointEngine:
+    def __init__(self, path, dirty_threshold=DIRTY_THRESHOLD, interval=CHECKPOINT_INTERVAL, codec=JsonCodec):
+        """
+        Initializes a checkpoint engine that tracks changed keys and periodically writes a
+        point-in-time snapshot of all live keys from a background thread.
+
+        Writers only record the changed key in a dirty map. A checkpoint swaps that map for an empty one,
+        which is the only moment it contends with writers, then merges it into its own private copy of the
+        data and writes it to a temporary file that atomically replaces the previous snapshot.
+
+        :param path: The snapshot file.
+        :type path: str
+        :param dirty_threshold: Number of changed keys that triggers a checkpoint.
+        :type dirty_threshold: int
+        :param interval: Maximum number of seconds changes wait before being checkpointed.
+        :type interval: float
+        :param codec: The serialization codec snapshots are written with.
+        :type codec: type
+        """
+        self.path = path
+        self.codec = codec
+        self.dirty_threshold = dirty_threshold
+        self.interval = interval
+        self.base = {}  # Snapshot state, touched only while holding checkpoint_lock
+        self.dirty = {}
+        self.dirty_lock = threading.Lock()
+        self.checkpoint_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = False
+        self.checkpoints = 0
+        self.last_duration = 0.0
+        self.last_bytes = 0
+        self.total_bytes = 0
+        self.thread = None
+        self.pid = None
+        self.start()
+
+    def start(self):
+        """
+        Starts the background checkpoint thread for the current process.
+        """
+        self.pid = os.getpid()
+        self.thread = threading.Thread(target=self.run, name='checkpoint', daemon=True)
+        self.thread.start()
+
+    def ensure_running(self):
+        """
+        Restarts the background thread in a forked child, which does not inherit the parent's threads.
+        """
+        if self.pid != os.getpid() and not self.stopped:
+            self.dirty_lock = threading.Lock()
+            self.checkpoint_lock = threading.Lock()
+            self.wakeup = threading.Event()
+            self.start()
+
+    def load(self):
+        """
+        Reads the last snapshot from disk.
+
+        :return: A new dictionary holding the snapshot contents, empty if there is no snapshot yet.
+        :rtype: dict
+        :raises ValueError: If the snapshot is unreadable, rather than losing every key by starting empty.
+        """
+        with self.checkpoint_lock:
+            try:
+                with open(self.path, 'rb') as snapshot_file:
+                    codec = detect_codec(snapshot_file.read(MAGIC_SIZE), self.codec)
+                    snapshot_file.seek(0)
+                    self.base = codec.load(snapshot_file.read)
+            except FileNotFoundError:
+                self.base = {}
+            except ValueError as error:
+                logger.error("load: Snapshot %s is unreadable: %s", self.path, error)
+                raise
+            self.dirty = {}
+            return dict(self.base)
+
+    def mark_set(self, val, key):
+        """
+        Records that a key was set since the last checkpoint.
+
+        :param val: The new value.
+        :type val: any
+        :param key: The changed key.
+        :type key: str
+        """
+        self.ensure_running()
+        with self.dirty_lock:
+            self.dirty[key] = val
+            pending = len(self.dirty)
+        if pending >= self.dirty_threshold:
+            self.wakeup.set()
+
+    def mark_delete(self, key):
+        """
+        Records that a key was deleted since the last checkpoint.
+
+        :param key: The deleted key.
+        :type key: str
+        """
+        self.mark_set(TOMBSTONE, key)
+
+    def checkpoint(self):
+        """
+        Writes a snapshot containing every change recorded so far.
+
+        :return: True if a snapshot was written, False if there was nothing to write.
+        :rtype: bool
+        """
+        with self.checkpoint_lock:
+            with self.dirty_lock:
+                dirty, self.dirty = self.dirty, {}  # The only step that excludes writers
+            if not dirty:
+                return False
+            start = time.perf_counter()
+            try:
+                for key, val in dirty.items():
+                    if val is TOMBSTONE:
+                        self.base.pop(key, None)
+                    else:
+                        self.base[key] = val
+                data = self.codec.dump(self.base)
+                temp_path = f'{self.path}.{os.getpid()}.tmp'
+                with open(temp_path, 'wb') as temp_file:
+                    temp_file.write(data)
+                    temp_file.flush()
+                    os.fsync(temp_file.fileno())
+                os.replace(temp_path, self.path)  # Readers of the file see either the old or the new snapshot
+            except BaseException:
+                # Nothing was written: keep the changes for the next checkpoint, under those made since the swap
+                with self.dirty_lock:
+                    dirty.update(self.dirty)
+                    self.dirty = dirty
+                raise
+            self.checkpoints += 1
+            self.last_duration = time.perf_counter() - start
+            self.last_bytes = len(data)
+            self.total_bytes += len(data)
+        logger.info("checkpoint: Wrote %d changed keys, %d bytes in %.2f ms.",
+                    len(dirty), self.last_bytes, self.last_duration * 1000)
+        return True
+
+    def run(self):
+        """
+        Background loop that checkpoints when the dirty threshold is reached or the interval elapses.
+        """
+        while not self.stopped:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            try:
+                self.checkpoint()
+            except Exception as error:  # Keep checkpointing: the changes are retried next time
+                logger.error("checkpoint: Failed to write snapshot: %r", error)
+
+    def stats(self):
+        """
+        Returns checkpoint statistics.
+
+        :return: Number of checkpoints, pending dirty keys, duration and size of the last checkpoint and total bytes written.
+        :rtype: dict
+        """
+        return {
+            'checkpoints': self.checkpoints,
+            'dirty_keys': len(self.dirty),
+            'last_duration': self.last_duration,
+            'last_bytes': self.last_bytes,
+            'total_bytes': self.total_bytes,
+        }
+
+    def close(self):
+        """
+        Stops the background thread and writes a final checkpoint.
+        """
+        self.stopped = True
+        self.wakeup.set()
+        if self.thread is not None and self.pid == os.getpid():
+            self.thread.join()
+        self.checkpoint()
+
+
+if __name__ == '__main__':
+    test_path = 'checkpoint_test.json'
+    engine = CheckpointEngine(test_path, dirty_threshold=3, interval=60)
+    engine.load()
+
+    # Reaching the dirty threshold wakes the background thread
+    engine.mark_set(1, 'a')
+    engine.mark_set(2, 'b')
+    engine.mark_set(3, 'c')
+    deadline = time.time() + 5
+    while engine.stats()['checkpoints'] == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    assert engine.stats()['checkpoints'] == 1, "Dirty threshold did not trigger a checkpoint"
+
+    # Only changed keys are recorded, deletes included
+    engine.mark_delete('a')
+    engine.mark_set(20, 'b')
+    assert engine.stats()['dirty_keys'] == 2, "Expected two dirty keys"
+    engine.close()
+    assert engine.stats()['last_bytes'] > 0, "Final checkpoint wrote nothing"
+
+    reloaded = CheckpointEngine(test_path, interval=0.05)
+    assert reloaded.load() == {'b': 20, 'c': 3}, "Snapshot does not match the applied changes"
+
+    # A failed checkpoint keeps its changes and the background thread keeps running
+    reloaded.mark_set({1, 2}, 'unencodable')
+    reloaded.mark_set(4, 'd')
+    time.sleep(0.2)
+    assert reloaded.thread.is_alive() and reloaded.stats()['dirty_keys'] == 2, "A failed checkpoint lost changes"
+    reloaded.mark_set(5, 'unencodable')
+    deadline = time.time() + 5
+    while reloaded.stats()['dirty_keys'] and time.time() < deadline:
+        time.sleep(0.01)
+    reloaded.close()
+    retried = CheckpointEngine(test_path, interval=60)
+    assert retried.load() == {'b': 20, 'c': 3, 'd': 4, 'unencodable': 5}, "The retried checkpoint is wrong"
+    retried.close()
+    os.remove(test_path)
+
+    print("All assertions passed.")
@@ -0,0 +1,338 @@
+import itertools
+import queue
+import socket
+import threading
+
+from protocol import (decode_frames, encode_frame, RemoteError, GET, SET, DELETE, GET_MANY, SET_MANY, DELETE_MANY,
+                      PING, FEED_SNAPSHOT, FEED_READ, ERROR)
+from database_server import DEFAULT_ADDRESS, RECEIVE_SIZE
+
+POOL_SIZE = 4
+
+
+class Connection:
+    def __init__(self, address):
+        """
+        One socket to a DatabaseServer.
+
+        :param address: A (host, port) pair for TCP, or a file path for a Unix domain socket.
+        :type address: tuple or str
+        """
+        if isinstance(address, str):
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.socket.connect(address)
+        self.buffer = bytearray()
+        self.request_ids = itertools.count(1)
+
+    def execute(self, requests):
+        """
+        Sends requests in one write and collects their responses, pipelining them over a single round trip.
+
+        :param requests: (opcode, arguments) pairs.
+        :type requests: list
+        :return: The result of each request, or a RemoteError instance for a request that failed.
+        :rtype: list
+        """
+        ids = []
+        out = bytearray()
+        for opcode, arguments in requests:
+            request_id = next(self.request_ids) & 0xffffffff
+            ids.append(request_id)
+            out += encode_frame(request_id, opcode, arguments)
+        self.socket.sendall(out)
+        results = []
+        while len(results) < len(ids):
+            data = self.socket.recv(RECEIVE_SIZE)
+            if not data:
+                raise ConnectionError("The server closed the connection.")
+            self.buffer += data
+            frames, used = decode_frames(self.buffer)
+            del self.buffer[:used]
+            for request_id, status, payload in frames:
+                if request_id != ids[len(results)]:
+                    raise ConnectionError("Response out of order.")
+                results.append(RemoteError(payload) if status == ERROR else payload)
+        return results
+
+    def close(self):
+        """
+        Closes the socket.
+        """
+        self.socket.close()
+
+
+class Pipeline:
+    def __init__(self, client):
+        """
+        Collects requests to send together. Call the usual methods, then execute().
+
+        :param client: The client whose pool provides the connection.
+        :type client: DatabaseClient
+        """
+        self.client = client
+        self.requests = []
+
+    def set_value(self, val, key):
+        """
+        Queues a set. Returns the pipeline, so calls can be chained.
+        """
+        self.requests.append((SET, (val, key)))
+        return self
+
+    def get_value(self, key):
+        """
+        Queues a get.
+        """
+        self.requests.append((GET, (key,)))
+        return self
+
+    def delete_value(self, key):
+        """
+        Queues a delete.
+        """
+        self.requests.append((DELETE, (key,)))
+        return self
+
+    def execute(self):
+        """
+        Sends every collected request over one connection in a single round trip.
+
+        :return: The result of each request in order, or a RemoteError instance for a request that failed.
+        :rtype: list
+        """
+        requests, self.requests = self.requests, []
+        return self.client.execute(requests)
+
+
+class DatabaseClient:
+    def __init__(self, address=DEFAULT_ADDRESS, pool_size=POOL_SIZE):
+        """
+        Initializes a client of a DatabaseServer, safe to share between threads. Connections are opened on demand,
+        up to `pool_size`, and reused; a thread needing one while all are busy waits for one to be returned.
+
+        :param address: A (host, port) pair for TCP, or a file path for a Unix domain socket.
+        :type address: tuple or str
+        :param pool_size: The maximum number of open connections.
+        :type pool_size: int
+        """
+        self.address = address
+        self.idle = queue.LifoQueue()  # The most recently used connection is the most likely to be warm
+        self.slots = threading.BoundedSemaphore(pool_size)
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes an idle connection, or opens one if the pool is not full.
+        """
+        self.slots.acquire()
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            connection = Connection(self.address)
+        except OSError:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.connections.append(connection)
+        return connection
+
+    def release(self, connection, broken=False):
+        """
+        Returns a connection to the pool, or discards it if it failed mid-request.
+        """
+        if broken:
+            connection.close()
+            with self.lock:
+                self.connections.remove(connection)
+        else:
+            self.idle.put(connection)
+        self.slots.release()
+
+    def execute(self, requests):
+        """
+        Sends requests over one pooled connection.
+
+        :return: The result of each request, or a RemoteError instance for a request that failed.
+        :rtype: list
+        """
+        connection = self.acquire()
+        try:
+            results = connection.execute(requests)
+        except (OSError, ValueError):
+            self.release(connection, broken=True)
+            raise
+        except TypeError:  # An argument the protocol does not carry, raised before anything was sent
+            self.release(connection)
+            raise
+        self.release(connection)
+        return results
+
+    def call(self, opcode, *arguments):
+        """
+        Sends a single request and returns its result.
+
+        :raises RemoteError: If the server failed to execute it.
+        """
+        result = self.execute([(opcode, arguments)])[0]
+        if isinstance(result, RemoteError):
+            raise result
+        return result
+
+    def pipeline(self):
+        """
+        Returns a Pipeline for sending many requests in one round trip.
+        """
+        return Pipeline(self)
+
+    def set_value(self, val, key):
+        """
+        Sets a value for a specified key on the server.
+
+        :return: True if the operation is successful, False otherwise.
+        :rtype: bool
+        """
+        return self.call(SET, val, key)
+
+    def get_value(self, key):
+        """
+        Retrieves the value associated with the specified key from the server.
+
+        :return: The value associated with the key if it exists, otherwise None.
+        :rtype: any or None
+        """
+        return self.call(GET, key)
+
+    def delete_value(self, key):
+        """
+        Deletes the key-value pair associated with the specified key on the server.
+
+        :return: The value associated with the deleted key if it exists, otherwise None.
+        :rtype: any or None
+        """
+        return self.call(DELETE, key)
+
+    def set_many(self, items):
+        """
+        Sets many key-value pairs in one request.
+
+        :return: True for each key that was set.
+        :rtype: dict
+        """
+        return self.call(SET_MANY, dict(items))
+
+    def get_many(self, keys):
+        """
+        Retrieves many values in one request.
+
+        :return: For each key, its value if it exists, otherwise None.
+        :rtype: dict
+        """
+        return self.call(GET_MANY, list(keys))
+
+    def delete_many(self, keys):
+        """
+        Deletes many keys in one request.
+
+        :return: For each key, the deleted value if it existed, otherwise None.
+        :rtype: dict
+        """
+        return self.call(DELETE_MANY, list(keys))
+
+    def ping(self):
+        """
+        Checks that the server answers.
+
+        :return: True.
+        :rtype: bool
+        """
+        return self.call(PING)
+
+    def feed_snapshot(self):
+        """
+        Retrieves every key-value pair with the change feed sequence they are current at, for a replica.
+
+        :return: The feed's epoch, the sequence and a dict of every stored key-value pair.
+        :rtype: tuple
+        """
+        return tuple(self.call(FEED_SNAPSHOT))
+
+    def read_feed(self, after, timeout, limit):
+        """
+        Retrieves the change batches committed after sequence `after`, the server waiting up to `timeout`
+        seconds for one. The request holds a pooled connection meanwhile.
+
+        :return: The feed's epoch, and the (sequence, commit time in ns, records) batches or None if the
+                 replica must resynchronize, see SyncDatabase.read_feed().
+        :rtype: tuple
+        """
+        return tuple(self.call(FEED_READ, after, timeout, limit))
+
+    def close(self):
+        """
+        Closes every pooled connection.
+        """
+        with self.lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections = []
+
+
+if __name__ == '__main__':
+    import os
+    from database_server import DatabaseServer
+    from sync_database import SyncDatabase
+
+    addresses = [('127.0.0.1', 0)]
+    if hasattr(socket, 'AF_UNIX'):
+        addresses.append(f'database_client_test_{os.getpid()}.sock')
+    for address in addresses:
+        server = DatabaseServer(SyncDatabase('threading', file_path='client_test.pkl'), address)
+        server.start()
+        client = DatabaseClient(server.address, pool_size=2)
+
+        assert client.ping() == True, "Server did not answer a ping"
+        assert client.set_value(10, 'a') == True, "Failed to set key 'a'"
+        assert client.get_value('a') == 10, "Failed to get value for key 'a'"
+        assert client.delete_value('a') == 10, "Failed to delete key 'a'"
+        assert client.get_value('a') is None, "Key 'a' should be deleted and return None"
+        assert client.set_many({'x': 1, 'y': (2, 3)}) == {'x': True, 'y': True}, "Failed to set a batch"
+        assert client.get_many(['x', 'y']) == {'x': 1, 'y': (2, 3)}, "Failed to get a batch"
+
+        # Pipelined requests come back in order from a single round trip
+        pipeline = client.pipeline()
+        for i in range(100):
+            pipeline.set_value(i, f'key {i}').get_value(f'key {i}')
+        results = pipeline.execute()
+        assert results[1::2] == list(range(100)), "Pipelined results out of order"
+
+        # A failed request raises RemoteError without breaking the connection
+        try:
+            client.call(99)
+            raise AssertionError("An unknown opcode was accepted")
+        except RemoteError:
+            pass
+        assert client.get_value('x') == 1, "Connection unusable after a failed request"
+        try:
+            client.set_value({1, 2}, 'set')
+            raise AssertionError("A value was pickled over the socket")
+        except TypeError:
+            pass
+
+        # The pool is shared between threads without exceeding its size
+        threads = [threading.Thread(target=lambda: [client.get_value('x') for _ in range(50)]) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(client.connections) <= 2, "Pool exceeded its size"
+
+        client.close()
+        server.shutdown()
+    os.remove('client_test.pkl')
+    print("All assertions passed.")
@@ -0,0 +1,137 @@
+import os
+import socket
+import socketserver
+import threading
+
+from protocol import (decode_frames, encode_frame, GET, SET, DELETE, GET_MANY, SET_MANY, DELETE_MANY, PING,
+                      FEED_SNAPSHOT, FEED_READ, OK, ERROR)
+from sync_database import SyncDatabase
+from tracing import logger
+
+DEFAULT_ADDRESS = ('127.0.0.1', 7878)
+RECEIVE_SIZE = 256 * 1024
+LISTEN_BACKLOG = 128  # socketserver's default of 5 makes bursts of new connections wait for a SYN retry
+
+
+class RequestHandler(socketserver.BaseRequestHandler):
+    """
+    Serves one client connection. Every request already received is executed in order and all of their
+    responses go back in a single send, so a pipelining client pays one round trip per batch.
+    """
+
+    def handle(self):
+        """
+        Executes requests until the client disconnects.
+        """
+        database = self.server.database
+        operations = {
+            GET: database.get_value,
+            SET: database.set_value,
+            DELETE: database.delete_value,
+            GET_MANY: database.get_many,
+            SET_MANY: database.set_many,
+            DELETE_MANY: database.delete_many,
+            PING: lambda: True,
+            FEED_SNAPSHOT: database.feed_snapshot,
+            FEED_READ: database.read_feed,  # Blocks this connection's thread until changes arrive or it times out
+        }
+        buffer = bytearray()
+        while True:
+            try:
+                data = self.request.recv(RECEIVE_SIZE)
+            except ConnectionError:
+                return
+            if not data:
+                return
+            buffer += data
+            try:
+                frames, used = decode_frames(buffer)
+            except ValueError as error:
+                logger.error("handle: Dropping connection after a malformed frame: %s", error)
+                return
+            del buffer[:used]
+            responses = bytearray()
+            for request_id, opcode, arguments in frames:
+                try:
+                    responses += encode_frame(request_id, OK, operations[opcode](*arguments))
+                except Exception as error:  # Including a result of a type the protocol does not carry
+                    responses += encode_frame(request_id, ERROR, f'{type(error).__name__}: {error}')
+            if responses:
+                self.request.sendall(responses)
+
+
+class ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = LISTEN_BACKLOG
+
+
+if hasattr(socketserver, 'ThreadingUnixStreamServer'):
+    class ThreadingUnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+        request_queue_size = LISTEN_BACKLOG
+
+
+class DatabaseServer:
+    def __init__(self, database=None, address=DEFAULT_ADDRESS):
+        """
+        Initializes a server that lets many processes share one store over a socket, instead of each opening
+        its own FileDatabase handle. Each connection is served by its own thread, so the store must synchronize
+        its callers, as a SyncDatabase in threading mode does.
+
+        :param database: The store to serve, by default a SyncDatabase in threading mode.
+        :type database: SyncDatabase or None
+        :param address: A (host, port) pair for TCP, or a file path for a Unix domain socket.
+        :type address: tuple or str
+        """
+        self.database = database if database is not None else SyncDatabase('threading')
+        self.address = address
+        if isinstance(address, str):
+            if os.path.exists(address):
+                os.remove(address)  # A stale socket file left by a previous server
+            self.server = ThreadingUnixServer(address, RequestHandler)
+        else:
+            self.server = ThreadingTCPServer(address, RequestHandler)
+            self.server.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.address = self.server.server_address  # The actual port if 0 was requested
+        self.server.database = self.database
+        self.thread = None
+        logger.info("DatabaseServer listening on %s.", self.address)
+
+    def serve_forever(self):
+        """
+        Serves requests until shutdown() is called from another thread.
+        """
+        self.server.serve_forever()
+
+    def start(self):
+        """
+        Serves requests from a background thread.
+        """
+        self.thread = threading.Thread(target=self.serve_forever, name='database-server', daemon=True)
+        self.thread.start()
+
+    def shutdown(self):
+        """
+        Stops serving, closes the listening socket and the store.
+        """
+        self.server.shutdown()
+        self.server.server_close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
+        self.database.close()
+
+
+if __name__ == '__main__':
+    import sys
+
+    host, port = DEFAULT_ADDRESS
+    address = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_ADDRESS
+    if isinstance(address, str) and address.isdigit():
+        address = (host, int(address))
+    server = DatabaseServer(SyncDatabase('threading', persistence='log'), address)
+    print(f'Serving on {server.address}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -1,18 +1,64 @@
 import logging
+import time
 
-logging.basicConfig(filename='dict_database.log', level=logging.DEBUG)
+from tracing import logger, tracer, configure_tracing
+from indexes import Indexes, MISSING
+from ttl import TimerWheel
+from arena_store import ArenaStore
+
+ENGINES = ('dict', 'arena')
+
+
+def is_hashable(key):
+    """
+    Tells whether a key can be stored: set_many() logs and leaves out the others.
+
+    :rtype: bool
+    """
+    try:
+        hash(key)
+    except TypeError:
+        return False
+    return True
 
 
 class DictDatabase:
-    def __init__(self):
+    def __init__(self, engine='dict'):
         """
         Initializes an instance of the DictDatabase class with an empty dictionary.
+
+        :param engine: 'dict' keeps the keys and values as Python objects in a dict, 'arena' packs them into
+                       contiguous bytearrays with an open-addressing index (see arena_store.py), which takes
+                       several times less memory per small entry but encodes on every write and decodes on
+                       every read.
+        :type engine: str
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"Engine must be one of {ENGINES}.")
+        self.engine = engine
+        self.dict = {} if engine == 'dict' else ArenaStore()
+        self.indexes = None  # Built by the first scan or create_index(), then kept up to date by every change
+        self.expiry = None  # The TimerWheel of key deadlines, created by the first set with a TTL
+        if tracer.enabled:
+            logger.info("Initialized DictDatabase with an empty dictionary.")
+
+    def fill(self, dictionary):
+        """
+        Replaces every key-value pair with those of a dictionary, such as a loaded snapshot, converting them to
+        the storage engine.
+
+        :param dictionary: The new contents, taken over if the engine is 'dict'.
+        :type dictionary: dict
+        :raises TypeError: If the arena engine cannot store one of the keys, see mmap_store.normalize_key().
         """
-        self.dict = {}
-        logging.info("Initialized DictDatabase with an empty dictionary.")
-        print("Initialized DictDatabase with an empty dictionary.")  # Added print
+        if self.engine == 'arena':
+            store = ArenaStore()
+            for key, val in dictionary.items():
+                store[key] = val
+            dictionary = store
+        self.dict = dictionary
 
-    def set_value(self, val, key):
+    def set_value(self, val, key, ttl=None):
         """
         Sets a value in the dictionary for a specified key. If the key exists, the value is updated.
 
@@ -20,18 +66,26 @@ class DictDatabase:
         :type val: any
         :param key: The key to associate with the value.
         :type key: str
+        :param ttl: Seconds after which the key expires, or None to keep it until deleted. Setting a key
+                    without a TTL removes any deadline it had.
+        :type ttl: float or None
         :return: True if the operation is successful, False otherwise.
         :rtype: bool
         """
         try:
+            if self.indexes is not None:
+                old = self.dict.get(key, MISSING)
             self.dict[key] = val
-            logging.info(f"set_value: Set {key} = {val}")
-            print(f"set_value: Set {key} = {val}")  # Added print
-            return True
-        except KeyError:
-            logging.error(f"Failed to set {key} = {val}")
-            print(f"Failed to set {key} = {val}")  # Added print
+        except TypeError:
+            logger.error("Failed to set %r = %r", key, val)
             return False
+        if self.indexes is not None:
+            self.indexes.on_set(key, old, val)
+        if ttl is not None or self.expiry is not None:
+            self.track_expiry((key,), ttl)
+        if tracer.enabled:
+            logger.info("set_value: Set %s = %s", key, val)
+        return True
 
     def get_value(self, key):
         """
@@ -42,38 +96,260 @@ class DictDatabase:
         :return: The value associated with the key if it exists, otherwise None.
         :rtype: any or None
         """
-        logging.info(f"get_value: Attempting to retrieve {key}")
-        print(f"get_value: Attempting to retrieve {key}")  # Added print
-        if key in self.dict.keys():
-            logging.info(f"get_value: Found {key} = {self.dict[key]}")
-            print(f"get_value: Found {key} = {self.dict[key]}")  # Added print
-            return self.dict[key]
-        logging.warning(f"get_value: {key} not found.")
-        print(f"get_value: {key} not found.")  # Added print
+        val = self.dict.get(key, MISSING)  # One lookup, which matters for the arena engine
+        if val is not MISSING and not (self.expiry is not None and self.expiry.expired(key, time.monotonic())):
+            if tracer.enabled:
+                logger.info("get_value: Found %s = %s", key, val)
+            return val
+        if tracer.enabled:
+            logger.info("get_value: %s not found.", key)
         return None
 
-    def delete_value(self, key):
+    def delete_value(self, key, default=None):
         """
         Deletes the key-value pair associated with the specified key from the dictionary.
 
         :param key: The key of the key-value pair to delete.
         :type key: str
-        :return: The value associated with the deleted key if it exists, otherwise None.
+        :param default: Returned if the key does not exist, so that callers can pass MISSING to tell a missing
+                        key from a stored None.
+        :type default: any
+        :return: The value associated with the deleted key if it exists, None if it expired, otherwise `default`.
         :rtype: any or None
         """
-        logging.info(f"delete_value: Attempting to delete {key}")
-        print(f"delete_value: Attempting to delete {key}")  # Added print
-        if key in self.dict.keys():
-            value = self.dict.pop(key)
-            logging.info(f"delete_value: Deleted {key} = {value}")
-            print(f"delete_value: Deleted {key} = {value}")  # Added print
+        value = self.dict.pop(key, MISSING)
+        if value is not MISSING:
+            if self.indexes is not None:
+                self.indexes.on_delete(key, value)
+            if self.expiry is not None:
+                if self.expiry.expired(key, time.monotonic()):
+                    value = None  # Reads already treat it as deleted
+                self.expiry.cancel(key)
+            if tracer.enabled:
+                logger.info("delete_value: Deleted %s = %s", key, value)
             return value
-        logging.warning(f"delete_value: {key} not found for deletion.")
-        print(f"delete_value: {key} not found for deletion.")  # Added print
-        return None
+        if tracer.enabled:
+            logger.info("delete_value: %s not found for deletion.", key)
+        return default
+
+    def set_many(self, items, ttl=None):
+        """
+        Sets many key-value pairs in one call.
+
+        :param items: A mapping of keys to values, or an iterable of (key, value) pairs.
+        :type items: dict or iterable
+        :param ttl: Seconds after which the keys expire, or None to keep them until deleted.
+        :type ttl: float or None
+        :return: True for each key that was set. Unhashable keys cannot be stored and are logged and left out.
+        :rtype: dict
+        """
+        results = {}
+        indexes = self.indexes
+        for key, val in (items.items() if hasattr(items, 'items') else items):
+            try:
+                if indexes is not None:
+                    old = self.dict.get(key, MISSING)
+                self.dict[key] = val
+            except TypeError:
+                logger.error("Failed to set %r = %r", key, val)
+                continue
+            if indexes is not None:
+                indexes.on_set(key, old, val)
+            results[key] = True
+        if ttl is not None or self.expiry is not None:
+            self.track_expiry(results, ttl)
+        if tracer.enabled:
+            logger.info("set_many: Set %d keys.", len(results))
+        return results
+
+    def get_many(self, keys):
+        """
+        Retrieves the values of many keys in one call.
+
+        :param keys: The keys to retrieve.
+        :type keys: iterable
+        :return: For each key, its value if it exists, otherwise None.
+        :rtype: dict
+        """
+        get = self.dict.get
+        if self.expiry is None:
+            return {key: get(key) for key in keys}
+        expired, now = self.expiry.expired, time.monotonic()
+        return {key: None if expired(key, now) else get(key) for key in keys}
+
+    def delete_many(self, keys, default=None):
+        """
+        Deletes many keys in one call.
+
+        :param keys: The keys to delete.
+        :type keys: iterable
+        :param default: The result of a key that does not exist, see delete_value().
+        :type default: any
+        :return: For each key, the deleted value if it existed, None if it expired, otherwise `default`.
+        :rtype: dict
+        """
+        pop = self.dict.pop
+        if self.indexes is None:
+            results = {key: pop(key, default) for key in keys}
+        else:
+            results = {}
+            for key in keys:
+                val = pop(key, MISSING)
+                if val is not MISSING:
+                    self.indexes.on_delete(key, val)
+                results[key] = default if val is MISSING else val
+        if self.expiry is not None:
+            expired, now = self.expiry.expired, time.monotonic()
+            for key, val in results.items():
+                if val is not default and expired(key, now):
+                    results[key] = None  # Reads already treat it as deleted
+                self.expiry.cancel(key)
+        if tracer.enabled:
+            logger.info("delete_many: Deleted %d keys.", sum(val is not default for val in results.values()))
+        return results
+
+    def start_expiry(self):
+        """
+        Creates the timer wheel tracking key deadlines.
+
+        :rtype: TimerWheel
+        """
+        self.expiry = TimerWheel()
+        logger.info("start_expiry: Tracking key deadlines.")
+        return self.expiry
+
+    def track_expiry(self, keys, ttl):
+        """
+        Gives keys a deadline `ttl` seconds from now, or removes their deadlines if `ttl` is None.
+        Deadlines are kept in memory only: after a reload the keys no longer expire.
+        """
+        expiry = self.expiry
+        if ttl is None:
+            for key in keys:
+                expiry.cancel(key)
+            return
+        if expiry is None:
+            expiry = self.start_expiry()
+        deadline = time.monotonic() + ttl
+        for key in keys:
+            expiry.schedule(key, deadline)
+
+    def time_to_live(self, key):
+        """
+        Returns the seconds left before a key expires.
+
+        :return: The seconds left, or None if the key has no deadline.
+        :rtype: float or None
+        """
+        deadline = None if self.expiry is None else self.expiry.deadline(key)
+        return None if deadline is None else max(deadline - time.monotonic(), 0.0)
+
+    def reap_expired(self, limit=None):
+        """
+        Deletes the keys whose deadline has passed, with one delete_many() call. Until then, reads already
+        treat them as missing. Nothing calls this in the background here; SyncDatabase does (see ttl.py).
+
+        :param limit: Stop after about this many keys, leaving the rest for the next call.
+        :type limit: int or None
+        :return: The number of keys deleted.
+        :rtype: int
+        """
+        if self.expiry is None:
+            return 0
+        keys = self.expiry.advance(time.monotonic(), limit)
+        if keys:
+            self.delete_many(keys)
+        return len(keys)
+
+    def enable_indexes(self):
+        """
+        Builds the ordered key index from the stored keys if it does not exist yet. From then on every
+        change updates it incrementally.
+
+        :return: The indexes.
+        :rtype: Indexes
+        """
+        if self.indexes is None:
+            self.indexes = Indexes(self.dict.items())
+            logger.info("enable_indexes: Indexed %d keys.", len(self.dict))
+        return self.indexes
+
+    def scan(self, start=None, stop=None, prefix=None, limit=None):
+        """
+        Returns key-value pairs in key order, in O(log n + k) for k results. Keys of different types are
+        ordered by type name first, and a range only covers keys of the type of its bounds.
+
+        :param start: The first key to include, or None to start from the smallest key.
+        :type start: any or None
+        :param stop: The key to stop before, or None to continue to the largest key.
+        :type stop: any or None
+        :param prefix: If given, return only the string keys starting with it, instead of a range.
+        :type prefix: str or None
+        :param limit: The maximum number of pairs to return, or None for all of them.
+        :type limit: int or None
+        :return: (key, value) pairs.
+        :rtype: list
+        """
+        return self.collect(self.enable_indexes().scan_keys(start, stop, prefix), limit)
+
+    def create_index(self, name, field):
+        """
+        Creates a secondary index ordering the keys by a field of their values, for find() and find_range().
+        Values without the field, or with None in it, are not indexed.
+
+        :param name: The index name.
+        :type name: str
+        :param field: A key of mapping values, such as 'age' for {'age': 30}, or a function of the value.
+        :type field: str or callable
+        :return: None
+        :rtype: None
+        :raises ValueError: If the field values cannot be ordered.
+        """
+        self.enable_indexes().add_index(name, field, self.dict.items())
+
+    def drop_index(self, name):
+        """
+        Removes a secondary index.
+
+        :raises KeyError: If there is no index of that name.
+        """
+        self.enable_indexes().drop_index(name)
+
+    def find(self, name, value, limit=None):
+        """
+        Returns the key-value pairs whose indexed field equals `value`.
+
+        :rtype: list
+        :raises KeyError: If there is no index of that name.
+        """
+        return self.collect(self.enable_indexes().find_equal(name, value), limit)
+
+    def find_range(self, name, start=None, stop=None, limit=None):
+        """
+        Returns the key-value pairs whose indexed field lies from `start` (inclusive) to `stop` (exclusive),
+        in field order.
+
+        :rtype: list
+        :raises KeyError: If there is no index of that name.
+        """
+        return self.collect(self.enable_indexes().find_keys(name, start, stop), limit)
+
+    def collect(self, keys, limit=None):
+        """
+        Pairs up to `limit` keys from an index with their values.
+        """
+        pairs = []
+        expiry, now = self.expiry, time.monotonic()
+        for key in keys:
+            if limit is not None and len(pairs) >= limit:
+                break
+            if expiry is None or not expiry.expired(key, now):
+                pairs.append((key, self.dict[key]))
+        return pairs
 
 
 if __name__ == '__main__':
+    configure_tracing(logging.DEBUG, filename='dict_database.log', echo=True)
 
     # Test cases with assertions
     db = DictDatabase()
@@ -96,5 +372,44 @@ if __name__ == '__main__':
     # Test delete_value for non-existent key
     assert db.delete_value('b') == None, "Deleting non-existent key 'b' should return None"
 
-    logging.info("All assertions passed.")
-    print("All assertions passed.")  # Added print
+    # Test batch operations
+    assert db.set_many({'x': 1, 'y': 2}) == {'x': True, 'y': True}, "Failed to set a batch"
+    assert db.set_many([('z', 3), ([], 4)]) == {'z': True}, "Unhashable key in a batch should be reported"
+    assert db.get_many(['x', 'z', 'b']) == {'x': 1, 'z': 3, 'b': None}, "Failed to get a batch"
+    assert db.delete_many(['x', 'b']) == {'x': 1, 'b': None}, "Failed to delete a batch"
+
+    # Ordered scans and secondary indexes follow every change once built
+    db.set_many({'test 1': {'score': 5}, 'test 2': {'score': 9}, 'test 3': {'score': 7}, 'other': {'score': 1}})
+    assert [key for key, _ in db.scan(prefix='test ')] == ['test 1', 'test 2', 'test 3'], "Wrong prefix scan"
+    db.create_index('score', 'score')
+    db.set_value({'score': 8}, 'test 4')
+    db.delete_value('test 2')
+    db.delete_many(['other'])
+    assert db.scan('test 2', 'test 9') == [('test 3', {'score': 7}), ('test 4', {'score': 8})], "Wrong range scan"
+    assert [key for key, _ in db.find_range('score', 6)] == ['test 3', 'test 4'], "Wrong secondary range"
+    assert db.find('score', 5) == [('test 1', {'score': 5})], "Wrong secondary lookup"
+
+    # Keys with a TTL read as missing once expired, and reap_expired() deletes them
+    db.set_many({'session 1': 'a', 'session 2': 'b', 'session 4': 'd', 'session 5': 'e'}, ttl=0.05)
+    db.set_value('c', 'session 3', ttl=60)
+    db.set_value('b', 'session 2')  # A plain set keeps the key
+    assert 59 < db.time_to_live('session 3') <= 60.1, "Wrong TTL"  # Deadlines are rounded up to a tick
+    assert db.time_to_live('session 2') is None, "A plain set kept the TTL"
+    time.sleep(0.25)
+    assert db.get_value('session 1') is None and db.get_many(['session 2']) == {'session 2': 'b'}, "Wrong expiry"
+    assert [key for key, _ in db.scan(prefix='session ')] == ['session 2', 'session 3'], "Scan saw an expired key"
+    assert db.delete_value('session 4') is None and db.delete_many(['session 5']) == {'session 5': None}, \
+        "Deleting an expired key returned its value"
+    assert db.reap_expired() == 1 and 'session 1' not in db.dict, "Expired key not reaped"
+
+    # The arena engine behaves the same behind the same API
+    arena_db = DictDatabase(engine='arena')
+    assert arena_db.set_value({'score': 1}, 'a') and arena_db.set_value(2, 3), "Failed to set keys in the arena"
+    assert arena_db.set_value(0, []) == False, "Unhashable key should be rejected by the arena"
+    assert arena_db.get_value('a') == {'score': 1} and arena_db.get_value('b') is None, "Wrong arena read"
+    assert arena_db.set_many({'b': 'x', 'c': None}) == {'b': True, 'c': True}, "Failed to set an arena batch"
+    assert arena_db.get_many(['b', 'c', 'd']) == {'b': 'x', 'c': None, 'd': None}, "Failed to get an arena batch"
+    assert arena_db.delete_value(3) == 2 and arena_db.delete_many(['b', 'd']) == {'b': 'x', 'd': None}, "Bad delete"
+    assert arena_db.scan() == [('a', {'score': 1}), ('c', None)], "Wrong arena scan"
+
+    logger.info("All assertions passed.")
@@ -0,0 +1,143 @@
+import threading
+
+from tracing import logger
+
+DURABILITY_MODES = ('none', 'periodic', 'fsync', 'group')
+FLUSH_INTERVAL = 1.0  # Seconds between background flushes in periodic mode
+
+
+class GroupCommitter:
+    def __init__(self, sync):
+        """
+        Coalesces the flushes of concurrent writers. Each writer registers its already written change and
+        receives a ticket; when it waits on the ticket, one waiting writer becomes the leader and runs a single
+        sync covering every change registered so far, while the others wait for its result.
+
+        :param sync: Forces every registered change to disk.
+        :type sync: callable
+        """
+        self.sync = sync
+        self.condition = threading.Condition(threading.Lock())
+        self.registered = 0  # Ticket of the latest change handed to the OS
+        self.durable = 0  # Every ticket up to this one is on disk
+        self.syncing = False
+        self.syncs = 0
+
+    def register(self):
+        """
+        Records that a change has been written. Must be called in write order, i.e. under the writer lock.
+
+        :return: The change's ticket.
+        :rtype: int
+        """
+        with self.condition:
+            self.registered += 1
+            return self.registered
+
+    def wait(self, ticket):
+        """
+        Blocks until the change with `ticket` is on disk, leading a sync if no other writer is running one.
+
+        :param ticket: A ticket returned by register().
+        :type ticket: int
+        """
+        with self.condition:
+            while self.durable < ticket:
+                if self.syncing:
+                    self.condition.wait()
+                    continue
+                self.syncing = True
+                target = self.registered  # Everything registered so far is covered by this sync
+                self.condition.release()
+                try:
+                    self.sync()
+                finally:
+                    self.condition.acquire()
+                    self.syncing = False
+                    self.condition.notify_all()
+                self.durable = max(self.durable, target)
+                self.syncs += 1
+
+
+class PeriodicFlusher:
+    def __init__(self, sync, interval=FLUSH_INTERVAL):
+        """
+        Syncs written changes to disk from a background thread every `interval` seconds,
+        bounding how much a crash can lose without making writers wait for the disk.
+
+        :param sync: Forces written changes to disk.
+        :type sync: callable
+        :param interval: Seconds between syncs.
+        :type interval: float
+        """
+        self.sync = sync
+        self.interval = interval
+        self.pending = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='periodic-flush', daemon=True)
+        self.thread.start()
+
+    def mark(self):
+        """
+        Records that there are written changes to sync.
+        """
+        self.pending = True
+
+    def run(self):
+        """
+        Background loop syncing pending changes.
+        """
+        while not self.stopped.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        """
+        Syncs now if there are pending changes.
+        """
+        if self.pending:
+            self.pending = False
+            try:
+                self.sync()
+            except OSError as error:
+                self.pending = True
+                logger.error("flush: Failed to sync: %s", error)
+
+    def close(self):
+        """
+        Stops the background thread after a final sync.
+        """
+        self.stopped.set()
+        self.thread.join()
+        self.flush()
+
+
+if __name__ == '__main__':
+    import time
+
+    syncs = []
+
+    def slow_sync():
+        syncs.append(time.perf_counter())
+        time.sleep(0.05)
+
+    committer = GroupCommitter(slow_sync)
+    tickets = [committer.register() for _ in range(20)]
+    threads = [threading.Thread(target=committer.wait, args=(ticket,)) for ticket in tickets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert committer.durable == 20, "Not every ticket became durable"
+    assert committer.syncs < 20, f"Expected coalesced syncs, got {committer.syncs} for 20 writers"
+
+    committer.wait(tickets[0])  # Already durable, returns without syncing
+    assert committer.syncs == len(syncs), "A durable ticket triggered another sync"
+
+    flushed = []
+    flusher = PeriodicFlusher(lambda: flushed.append(1), interval=0.01)
+    flusher.mark()
+    time.sleep(0.1)
+    flusher.close()
+    assert flushed == [1], "Periodic flusher should sync exactly once per marked batch"
+
+    print("All assertions passed.")
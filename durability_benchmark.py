@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from durability import DURABILITY_MODES
+from sync_database import SyncDatabase
+
+WRITER_COUNTS = (1, 8, 64)
+COMMITS = 1024  # Total commits per measurement, split between the writers
+
+
+def measure(durability, writers, commits, directory):
+    """
+    Runs `writers` threads that together commit `commits` single-key writes to a log-persisted SyncDatabase.
+
+    :param durability: The durability mode.
+    :type durability: str
+    :param writers: The number of writer threads.
+    :type writers: int
+    :param commits: The total number of commits.
+    :type commits: int
+    :param directory: Where to put the database files.
+    :type directory: str
+    :return: Commits per second, and the number of syncs that were run (None where they are not counted).
+    :rtype: tuple
+    """
+    file_path = os.path.join(directory, f'{durability}.{writers}.pkl')
+    log_path = os.path.join(directory, f'{durability}.{writers}.wal')
+    db = SyncDatabase('threading', persistence='log', durability=durability, file_path=file_path, log_path=log_path)
+    per_writer = commits // writers
+
+    def worker(index):
+        for i in range(per_writer):
+            db.set_value(i, f'writer {index} key {i}')
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(writers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    db.close()
+    syncs = db.committer.syncs if db.committer is not None else None
+    return per_writer * writers / elapsed, syncs
+
+
+if __name__ == '__main__':
+    commits = int(sys.argv[1]) if len(sys.argv) > 1 else COMMITS
+    print(f'{commits} commits per measurement, log persistence')
+    with tempfile.TemporaryDirectory() as directory:
+        for durability in DURABILITY_MODES:
+            for writers in WRITER_COUNTS:
+                rate, syncs = measure(durability, writers, commits, directory)
+                detail = f'  ({syncs} syncs)' if syncs is not None else ''
+                print(f'{durability:>8} {writers:3d} writers: {rate:10.0f} commits/s{detail}')
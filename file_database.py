@@ -1,38 +1,211 @@
-import json
-import pickle
 import os
+import time
 import logging
 
-import win32file
-
-from dict_database import DictDatabase
-import win32event
+from dict_database import DictDatabase, is_hashable
+from indexes import MISSING
+from tracing import logger, tracer, configure_tracing
+from metrics import metrics
+from serialization import get_codec, detect_codec, MAGIC_SIZE
+from checkpoint import CheckpointEngine, DIRTY_THRESHOLD, CHECKPOINT_INTERVAL
+from platform_backend import get_backend
+from mmap_store import MmapStore
+from cache import CachedStore
+from durability import GroupCommitter, PeriodicFlusher, DURABILITY_MODES, FLUSH_INTERVAL
 
 FILE_PATH = 'database.pkl'
+MMAP_PATH = 'database.dat'  # The default data file in mmap mode, which must not be a snapshot
+LOG_PATH = 'database.wal'
+READ_CHUNK_SIZE = 64 * 1024
+COMPACT_MIN_RECORDS = 1024  # Never compact a log shorter than this
+COMPACT_RATIO = 4  # Compact once the log holds this many records per live key
+
+PERSISTENCE_MODES = ('snapshot', 'log', 'checkpoint', 'mmap')
+
 
 class FileDatabase(DictDatabase):
-    def __init__(self):
+    def __init__(self, persistence='snapshot', dirty_threshold=DIRTY_THRESHOLD, checkpoint_interval=CHECKPOINT_INTERVAL,
+                 backend=None, file_path=FILE_PATH, log_path=LOG_PATH, durability='none', flush_interval=FLUSH_INTERVAL,
+                 codec='json', cache_bytes=None, cache_policy='lru', engine='dict'):
         """
         Initializes an instance of the FileDatabase class, extending DictDatabase.
         Loads an existing dictionary from a file or initializes a new one if the file does not exist.
+
+        :param persistence: 'snapshot' rewrites the whole dictionary on every change,
+                            'log' appends one record per change to a write-ahead log,
+                            'checkpoint' tracks changed keys and snapshots them from a background thread,
+                            'mmap' keeps the data in a memory-mapped file with an on-disk hash index instead of
+                            in memory (see mmap_store.py), so opening it parses nothing.
+                            In mmap mode the file is not a snapshot and the codec is not used.
+        :type persistence: str
+        :param dirty_threshold: In checkpoint mode, number of changed keys that triggers a checkpoint.
+        :type dirty_threshold: int
+        :param checkpoint_interval: In checkpoint mode, maximum seconds between checkpoints while there are changes.
+        :type checkpoint_interval: float
+        :param backend: The file I/O backend name ('win32' or 'posix'), or None for the platform's native one.
+        :type backend: str or None
+        :param file_path: The snapshot file, or in mmap mode the data file. Left at FILE_PATH, mmap mode uses
+                          MMAP_PATH instead.
+        :type file_path: str
+        :param log_path: The write-ahead log file, used in log mode.
+        :type log_path: str
+        :param durability: When a change is forced to disk in snapshot and log mode:
+                           'none' leaves it to the OS, 'periodic' syncs from a background thread every
+                           flush_interval seconds, 'fsync' syncs every change before returning, and 'group'
+                           (log mode only) lets concurrent writers share one sync and return once it covers them.
+        :type durability: str
+        :param flush_interval: Seconds between syncs in periodic mode.
+        :type flush_interval: float
+        :param codec: The format new snapshots and log records are written in: 'json', 'binary', 'pickle'
+                      or 'msgpack' (see serialization.py). Files are read in whatever format they were written in.
+        :type codec: str
+        :param cache_bytes: In mmap mode, the byte budget of an in-memory cache of hot values in front of the
+                            mapped files, or None for no cache (see cache.py).
+        :type cache_bytes: int or None
+        :param cache_policy: The cache eviction policy, 'lru' or 'arc'.
+        :type cache_policy: str
+        :param engine: How the keys are held in memory in every mode but mmap, 'dict' or 'arena', see
+                       DictDatabase. Loading fills the chosen engine, and snapshots of an arena decode it whole.
+        :type engine: str
         """
-        super().__init__()
-        self.create_file()  # Load data when initializing, if file exists.
-        logging.info("FileDatabase initialized.")
-        print("FileDatabase initialized.")
+        if persistence not in PERSISTENCE_MODES:
+            raise ValueError(f"Persistence must be one of {PERSISTENCE_MODES}.")
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Durability must be one of {DURABILITY_MODES}.")
+        if durability == 'group' and persistence != 'log':
+            raise ValueError("Group commit needs log persistence, since a snapshot rewrite cannot be synced concurrently.")
+        if persistence == 'checkpoint' and durability != 'none':
+            raise ValueError("Checkpoint persistence syncs each checkpoint itself and takes no durability mode.")
+        if persistence == 'mmap' and engine != 'dict':
+            raise ValueError("Mmap persistence keeps the data in the mapped files and takes no engine.")
+        super().__init__(engine)
+        self.codec = get_codec(codec)
+        self.backend = get_backend(backend)
+        self.io = self.backend.file_io
+        self.persistence = persistence
+        self.file_path = MMAP_PATH if persistence == 'mmap' and file_path == FILE_PATH else file_path
+        self.log_path = log_path
+        self.log_handle = None
+        self.log_records = 0
+        self.checkpointer = None
+        if self.persistence == 'checkpoint':
+            # The engine replaces the snapshot file atomically, so no long-lived handle is kept on it
+            self.checkpointer = CheckpointEngine(self.file_path, dirty_threshold, checkpoint_interval, self.codec)
+        elif self.persistence == 'mmap':
+            self.dict = MmapStore(self.file_path)  # Reads and writes go straight to the mapped files
+            if cache_bytes is not None:
+                self.dict = CachedStore(self.dict, cache_bytes, cache_policy)
+        else:
+            self.create_file()  # Load data when initializing, if file exists.
+        if self.persistence == 'log':
+            self.create_log()
+        self.durability = durability
+        self.committer = GroupCommitter(self.sync_files) if durability == 'group' else None
+        self.flusher = PeriodicFlusher(self.sync_files, flush_interval) if durability == 'periodic' else None
+        logger.info("FileDatabase initialized with %s persistence and %s durability.", persistence, durability)
 
     def create_file(self):
         """
         Creates a new file with an empty dictionary if the file doesn't exist.
         """
-        self.handle = win32file.CreateFile(
-            FILE_PATH,
-            win32file.GENERIC_WRITE | win32file.GENERIC_READ,
-            win32file.FILE_SHARE_READ | win32file.FILE_SHARE_WRITE,
-            None,
-            win32file.OPEN_ALWAYS,  # Overwrite the file if it exists
-            0,
-            None)
+        self.handle = self.io.open(self.file_path)
+
+    def create_log(self):
+        """
+        Opens the write-ahead log, creating it if it doesn't exist.
+        """
+        self.log_handle = self.io.open(self.log_path)
+
+    def append_record(self, record):
+        """
+        Appends a single change record to the end of the write-ahead log.
+        The cost of an append does not depend on how many keys are stored.
+
+        :param record: ['s', key, value] for a set or ['d', key] for a delete.
+        :type record: list
+        :return: None
+        :rtype: None
+        """
+        self.append_records([record])
+
+    def append_records(self, records):
+        """
+        Appends change records to the end of the write-ahead log with a single write.
+
+        :param records: ['s', key, value] for a set or ['d', key] for a delete, in order.
+        :type records: list
+        :return: None
+        :rtype: None
+        """
+        if not records:
+            return
+        if metrics.enabled:
+            start = time.perf_counter_ns()
+        data = self.codec.encode_records(records)
+        if metrics.enabled:
+            encoded = time.perf_counter_ns()
+        if self.io.seek(self.log_handle, 0, os.SEEK_END) == 0:
+            data = self.codec.magic + data  # A log starts with the magic of the codec writing it
+        self.io.write(self.log_handle, data)
+        if metrics.enabled:
+            self.record_write('log_appends', start, encoded, len(data))
+        self.log_records += len(records)
+        if self.log_records >= max(COMPACT_MIN_RECORDS, COMPACT_RATIO * len(self.dict)):
+            self.compact()
+
+    def compact(self):
+        """
+        Folds the write-ahead log into a fresh snapshot and empties the log.
+        Runs once the log grows to a multiple of the live key count, so its cost is amortized over many appends.
+
+        :return: None
+        :rtype: None
+        """
+        self.replace_snapshot()  # The snapshot must be on disk before the log is dropped
+        self.io.seek(self.log_handle, 0)
+        self.io.truncate(self.log_handle)
+        logger.info("compact: Folded %d log records into a snapshot of %d keys.", self.log_records, len(self.dict))
+        self.log_records = 0
+
+    def replay_log(self):
+        """
+        Re-applies every complete record of the write-ahead log on top of the loaded snapshot.
+        A torn record left by a crash in the middle of an append is discarded.
+        A log written with another codec is folded into a snapshot so new appends use the configured one.
+
+        :return: None
+        :rtype: None
+        """
+        self.io.seek(self.log_handle, 0)
+        head = self.io.read(self.log_handle, MAGIC_SIZE)
+        codec = detect_codec(head, self.codec)
+        valid_length = len(codec.magic) if head else 0
+        pending = head[valid_length:]
+        self.log_records = 0
+        while True:
+            end = 0
+            try:
+                for record, end in codec.iter_records(pending):
+                    if record[0] == 's':
+                        self.dict[record[1]] = record[2]
+                    else:
+                        self.dict.pop(record[1], None)
+                    self.log_records += 1
+            except ValueError:
+                logger.error("replay_log: Corrupt record after %d records, truncating log.", self.log_records)
+                valid_length += end
+                break
+            valid_length += end
+            data = self.io.read(self.log_handle, READ_CHUNK_SIZE)
+            if not data:
+                break
+            pending = pending[end:] + data
+        # Drop any torn tail so new appends start on a record boundary
+        self.io.seek(self.log_handle, valid_length)
+        self.io.truncate(self.log_handle)
+        logger.info("replay_log: Replayed %d records.", self.log_records)
+        if head and codec is not self.codec:
+            self.compact()
 
     def save(self):
         """
@@ -41,50 +214,253 @@ class FileDatabase(DictDatabase):
         :return: None
         :rtype: None
         """
-        # with open(FILE_PATH, 'wb') as database_file:
-        #     pickle.dump(self.dict, database_file)
-        # logging.info("Database saved to file.")
-        # print("Database saved to file.")
-
-        data = json.dumps(self.dict).encode('utf-8')  # Convert dict to bytes
-        win32file.SetFilePointer(self.handle, 0, win32file.FILE_BEGIN)  # Move to the beginning of the file
-        win32file.SetEndOfFile(self.handle)  # Ensure the file is truncated before writing new data
-        win32file.WriteFile(self.handle, data)
-        print(f"Data saved to file: {data}")
-
-    # def load(self):
-    #     """
-    #     Loads the dictionary state from a file, if it exists. If the file does not exist,
-    #     initializes with an empty dictionary.
-    #
-    #     :return: None
-    #     :rtype: None
-    #     """
-    #     if os.path.exists(FILE_PATH):
-    #         with open(FILE_PATH, 'rb') as database_file:
-    #             self.dict = pickle.load(database_file)
-    #         logging.info("Database loaded from file.")
-    #         print("Database loaded from file.")
-    #     else:
-    #         logging.warning("Database file not found. Initialized with an empty dictionary.")
-    #         print("Database file not found. Initialized with an empty dictionary.")
-    #         self.dict = {}
+        if metrics.enabled:
+            start = time.perf_counter_ns()
+        data = self.codec.dump(self.snapshot_contents())  # Convert dict to bytes
+        if metrics.enabled:
+            encoded = time.perf_counter_ns()
+        self.io.seek(self.handle, 0)  # Move to the beginning of the file
+        self.io.truncate(self.handle)  # Ensure the file is truncated before writing new data
+        self.io.write(self.handle, data)
+        if metrics.enabled:
+            self.record_write('snapshot_saves', start, encoded, len(data))
+        if tracer.enabled:
+            logger.debug("Data saved to file: %s", data)
+
+    def snapshot_contents(self):
+        """
+        Returns the stored key-value pairs as a dict for the codec, decoding an arena.
+
+        :rtype: dict
+        """
+        return self.dict if self.engine == 'dict' else dict(self.dict.items())
+
+    def replace_snapshot(self):
+        """
+        Writes the current dictionary state to a temporary file, forces it to disk and renames it over the
+        snapshot, so a crash at any point leaves either the old or the new snapshot intact.
+        """
+        if metrics.enabled:
+            start = time.perf_counter_ns()
+        data = self.codec.dump(self.snapshot_contents())
+        if metrics.enabled:
+            encoded = time.perf_counter_ns()
+        temp_path = f'{self.file_path}.{os.getpid()}.tmp'
+        handle = self.io.open(temp_path)
+        try:
+            self.io.truncate(handle)  # Left over by a crash during an earlier replacement
+            self.io.write(handle, data)
+            self.io.sync(handle)
+        finally:
+            self.io.close(handle)
+        self.io.close(self.handle)  # Windows cannot rename over an open file
+        os.replace(temp_path, self.file_path)
+        self.handle = self.io.open(self.file_path)
+        if os.name != 'nt':
+            # The rename itself must be on disk too: sync the directory holding the snapshot
+            directory = os.open(os.path.dirname(os.path.abspath(self.file_path)), os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+        if metrics.enabled:
+            self.record_write('snapshot_saves', start, encoded, len(data))
+
+    @staticmethod
+    def record_write(counter, start, encoded, size):
+        """
+        Records the serialize and write times and the size of a snapshot save or log append.
+
+        :param counter: The counter of the kind of write.
+        :type counter: str
+        :param start: When serialization started, from time.perf_counter_ns().
+        :type start: int
+        :param encoded: When serialization ended and writing started.
+        :type encoded: int
+        :param size: Bytes written.
+        :type size: int
+        """
+        metrics.record('serialize', encoded - start)
+        metrics.record('write', time.perf_counter_ns() - encoded)
+        metrics.record('write_bytes', size)
+        metrics.add(counter)
 
     def load(self):
-        if os.path.exists(FILE_PATH):
-            win32file.SetFilePointer(self.handle, 0, win32file.FILE_BEGIN)  # Start from the beginning of the file
-            result, data = win32file.ReadFile(self.handle, 1024)  # Read up to 1024 bytes
-            # print(f"Data read from file: {data}")
-            if result != 0 or not data:  # If no data was read or data is empty
-                self.dict = {}  # Initialize the dictionary as empty
+        """
+        Loads the dictionary state from the file, streaming it so stores of any size can be reloaded.
+        In log mode the write-ahead log is replayed on top of the snapshot.
+
+        :return: None
+        :rtype: None
+        """
+        if self.persistence == 'checkpoint':
+            self.fill(self.checkpointer.load())
+        elif self.persistence == 'mmap':
+            self.dict.refresh()  # Nothing to parse, the mapped files are the data
+        else:
+            self.load_files()
+        if self.indexes is not None:
+            self.indexes.rebuild(self.dict.items())
+
+    def load_files(self):
+        """
+        Streams the snapshot in and, in log mode, replays the write-ahead log on top of it.
+        """
+        if os.path.exists(self.file_path):
+            # Reopen, in case another handle replaced the snapshot file since this one was opened
+            self.io.close(self.handle)
+            self.handle = self.io.open(self.file_path)
+            head = self.io.read(self.handle, MAGIC_SIZE)
+            codec = detect_codec(head, self.codec)
+            self.io.seek(self.handle, 0)  # Start from the beginning of the file
+            if not head:
+                self.fill({})  # A new, empty file
             else:
                 try:
-                    self.dict = json.loads(data.decode('utf-8'))  # Convert bytes back to dict
-                except json.JSONDecodeError:
-                    # print("Error: Invalid JSON in file.")
-                    self.dict = {}  # Initialize as empty if JSON is invalid
+                    # Parse the snapshot block by block instead of reading it in one go
+                    self.fill(codec.load(lambda size: self.io.read(self.handle, size)))
+                except ValueError as error:
+                    # Starting empty would lose every key, and the next save would overwrite the file
+                    logger.error("load_files: Snapshot %s is unreadable: %s", self.file_path, error)
+                    raise
+        if self.persistence == 'log':
+            self.replay_log()
 
-    def set_value(self, val, key):
+    def persist_set(self, val, key):
+        """
+        Makes a completed set durable according to the persistence mode.
+        """
+        if self.persistence == 'mmap':
+            return  # Already written to the mapped files
+        if self.persistence == 'log':
+            self.append_record(['s', key, val])
+        elif self.persistence == 'checkpoint':
+            self.checkpointer.mark_set(val, key)
+        else:
+            self.save()  # Save to file after updating
+
+    def persist_delete(self, key):
+        """
+        Makes a completed delete durable according to the persistence mode.
+        """
+        if self.persistence == 'mmap':
+            return
+        if self.persistence == 'log':
+            self.append_record(['d', key])
+        elif self.persistence == 'checkpoint':
+            self.checkpointer.mark_delete(key)
+        else:
+            self.save()  # Save to file after deletion
+
+    def persist_many(self, records):
+        """
+        Makes a batch of completed changes durable with one write, whatever the persistence mode.
+
+        :param records: ['s', key, value] for a set or ['d', key] for a delete, in order.
+        :type records: list
+        """
+        if not records or self.persistence == 'mmap':
+            return
+        if self.persistence == 'log':
+            self.append_records(records)
+        elif self.persistence == 'checkpoint':
+            for record in records:
+                if record[0] == 's':
+                    self.checkpointer.mark_set(record[2], record[1])
+                else:
+                    self.checkpointer.mark_delete(record[1])
+        else:
+            self.save()  # One rewrite covers the whole batch
+
+    def sync_files(self):
+        """
+        Forces everything written so far to disk.
+        """
+        if metrics.enabled:
+            start = time.perf_counter_ns()
+        if self.persistence == 'mmap':
+            self.dict.flush()
+        else:
+            self.io.sync(self.log_handle if self.persistence == 'log' else self.handle)
+        if metrics.enabled:
+            metrics.record('fsync', time.perf_counter_ns() - start)
+
+    def commit(self):
+        """
+        Applies the durability mode to a change that was just persisted. Called in write order.
+
+        :return: A group commit ticket to wait on with wait_durable(), or None if there is nothing to wait for.
+        :rtype: int or None
+        """
+        if self.durability == 'fsync':
+            self.sync_files()
+        elif self.durability == 'periodic':
+            self.flusher.mark()
+        elif self.durability == 'group':
+            return self.committer.register()
+        return None
+
+    def wait_durable(self, ticket):
+        """
+        Blocks until the change holding a commit ticket is on disk.
+
+        :param ticket: A ticket returned by commit(), or None.
+        :type ticket: int or None
+        """
+        if ticket is not None:
+            self.committer.wait(ticket)
+
+    def checkpoint(self):
+        """
+        Forces a checkpoint of all pending changes in checkpoint mode.
+
+        :return: Checkpoint statistics, including the duration and bytes written by the last checkpoint.
+        :rtype: dict
+        """
+        self.checkpointer.checkpoint()
+        return self.checkpointer.stats()
+
+    def export_mmap(self, path):
+        """
+        Copies every key into the mmap store at `path`, so the database can be reopened with
+        FileDatabase('mmap', file_path=path). Opening that only maps the files and reads the index header,
+        however large the store, and each value is decoded when it is first read, instead of load() parsing
+        the whole snapshot and log up front.
+
+        :param path: The data file of the store, created if it does not exist.
+        :type path: str
+        :return: The number of keys copied.
+        :rtype: int
+        """
+        store = MmapStore(path)
+        try:
+            store.update(self.dict.items())
+        finally:
+            store.close()
+        logger.info("export_mmap: Copied %d keys to %s.", len(self.dict), path)
+        return len(self.dict)
+
+    def cache_stats(self):
+        """
+        Returns the hit, miss and eviction counters of the mmap mode value cache.
+
+        :return: Cache statistics, or None if there is no cache.
+        :rtype: dict or None
+        """
+        return self.dict.stats() if isinstance(self.dict, CachedStore) else None
+
+    def close(self):
+        """
+        Flushes pending changes and stops background checkpointing and flushing.
+        """
+        if self.checkpointer is not None:
+            self.checkpointer.close()
+        if self.flusher is not None:
+            self.flusher.close()
+        if self.persistence == 'mmap':
+            self.dict.flush()
+
+    def set_value(self, val, key, ttl=None):
         """
         Sets a value in the dictionary for a specified key, then saves the updated dictionary to the file.
 
@@ -92,14 +468,29 @@ class FileDatabase(DictDatabase):
         :type val: any
         :param key: The key to associate with the value.
         :type key: str
+        :param ttl: Seconds after which the key expires, or None to keep it until deleted. Deadlines are not
+                    persisted: after a reload the key no longer expires.
+        :type ttl: float or None
         :return: True if the operation is successful, False otherwise.
         :rtype: bool
         """
-        response = super().set_value(val, key)
-        if response:
-            self.save()  # Save to file after updating
+        response, ticket = self.apply_set(val, key, ttl)
+        self.wait_durable(ticket)
         return response
 
+    def apply_set(self, val, key, ttl=None):
+        """
+        Sets and persists a value without waiting for it to become durable.
+
+        :return: The set_value() result and the commit ticket to wait on.
+        :rtype: tuple
+        """
+        response = super().set_value(val, key, ttl)
+        if not response:
+            return response, None
+        self.persist_set(val, key)
+        return response, self.commit()
+
     def get_value(self, key):
         """
         Retrieves the value associated with the specified key in the dictionary, after loading the dictionary from the file.
@@ -109,10 +500,15 @@ class FileDatabase(DictDatabase):
         :return: The value associated with the key if it exists, otherwise None.
         :rtype: any or None
         """
-        val = super().get_value(key)
-        logging.info(f"Returning value: {val} for key: {key}")
-        print(f"Returning value: {val} for key: {key}")
-        return val
+        if self.persistence == 'mmap':
+            # One index probe instead of a membership test followed by a lookup
+            val = self.dict.get(key)
+            if val is not None and self.expiry is not None and self.expiry.expired(key, time.monotonic()):
+                val = None
+            if tracer.enabled:
+                logger.info("get_value: %s = %s", key, val)
+            return val
+        return super().get_value(key)
 
     def delete_value(self, key):
         """
@@ -123,17 +519,126 @@ class FileDatabase(DictDatabase):
         :return: The value associated with the deleted key if it exists, otherwise None.
         :rtype: any or None
         """
-        val = super().delete_value(key)
-        if val is not None:
-            self.save()  # Save to file after deletion
-        logging.info(f"Deleted key-value pair for key: {key}. Value: {val}")
-        print(f"Deleted key-value pair for key: {key}. Value: {val}")
+        val, ticket = self.apply_delete(key)
+        self.wait_durable(ticket)
         return val
 
+    def apply_delete(self, key, default=None):
+        """
+        Deletes a key and persists the deletion without waiting for it to become durable.
+
+        :param default: Returned if the key does not exist, see DictDatabase.delete_value().
+        :type default: any
+        :return: The delete_value() result and the commit ticket to wait on.
+        :rtype: tuple
+        """
+        val = super().delete_value(key, MISSING)  # A stored None must still be deleted from the files
+        if val is MISSING:
+            return default, None
+        self.persist_delete(key)
+        return val, self.commit()
+
+    def set_many(self, items, ttl=None):
+        """
+        Sets many key-value pairs, then persists them all with a single write.
+
+        :param items: A mapping of keys to values, or an iterable of (key, value) pairs.
+        :type items: dict or iterable
+        :param ttl: Seconds after which the keys expire, or None to keep them until deleted.
+        :type ttl: float or None
+        :return: True for each key that was set.
+        :rtype: dict
+        """
+        results, ticket = self.apply_set_many(items, ttl)
+        self.wait_durable(ticket)
+        return results
+
+    def apply_set_many(self, items, ttl=None):
+        """
+        Sets and persists many key-value pairs without waiting for them to become durable.
+
+        :return: The set_many() result and the commit ticket to wait on.
+        :rtype: tuple
+        """
+        items = list(items.items() if hasattr(items, 'items') else items)
+        results = super().set_many(items, ttl)
+        if not results:
+            return results, None
+        self.persist_many([['s', key, val] for key, val in items if is_hashable(key) and key in results])
+        return results, self.commit()
+
+    def delete_many(self, keys):
+        """
+        Deletes many keys, then persists the deletions with a single write.
+
+        :param keys: The keys to delete.
+        :type keys: iterable
+        :return: For each key, the deleted value if it existed, otherwise None.
+        :rtype: dict
+        """
+        results, ticket = self.apply_delete_many(keys)
+        self.wait_durable(ticket)
+        return results
+
+    def apply_delete_many(self, keys, default=None):
+        """
+        Deletes many keys and persists the deletions without waiting for them to become durable.
+
+        :param default: The result of a key that does not exist, see DictDatabase.delete_value().
+        :type default: any
+        :return: The delete_many() result and the commit ticket to wait on.
+        :rtype: tuple
+        """
+        results = super().delete_many(keys, MISSING)
+        records = [['d', key] for key, val in results.items() if val is not MISSING]
+        if default is not MISSING:
+            results = {key: default if val is MISSING else val for key, val in results.items()}
+        if not records:
+            return results, None
+        self.persist_many(records)
+        return results, self.commit()
+
+    def apply_records(self, records):
+        """
+        Applies a batch of sets and deletes in order and persists them with a single write, without waiting
+        for them to become durable. Used to commit transactions.
+
+        :param records: ['s', key, value] for a set or ['d', key] for a delete, in order.
+        :type records: list
+        :return: The records that changed something, and the commit ticket to wait on.
+        :rtype: tuple
+        """
+        applied = []
+        indexes = self.indexes
+        expiry = self.expiry
+        for record in records:
+            key = record[1]
+            if expiry is not None:
+                expiry.cancel(key)  # Transactions write without TTLs
+            if record[0] == 's':
+                if indexes is not None:
+                    old = self.dict.get(key, MISSING)
+                self.dict[key] = record[2]
+                if indexes is not None:
+                    indexes.on_set(key, old, record[2])
+                applied.append(record)
+            else:
+                old = self.dict.pop(key, MISSING)
+                if old is not MISSING:
+                    if indexes is not None:
+                        indexes.on_delete(key, old)
+                    applied.append(record)
+        if tracer.enabled:
+            logger.info("apply_records: Applied %d of %d changes.", len(applied), len(records))
+        if not applied:
+            return applied, None
+        self.persist_many(applied)
+        return applied, self.commit()
+
 
 if __name__ == '__main__':
     # Set up logging
-    logging.basicConfig(filename='file_database.log', level=logging.DEBUG)
+    configure_tracing(logging.DEBUG, filename='file_database.log', echo=True)
 
     # Test cases with assertions
     db = FileDatabase()
@@ -156,5 +661,139 @@ if __name__ == '__main__':
     # Test delete_value for non-existent key
     assert db.delete_value('b') is None, "Deleting non-existent key 'b' should return None"
 
-    logging.info("All assertions passed.")
-    print("All assertions passed.")
+    # Batches are applied together and persisted once
+    assert db.set_many({'x': 1, 'y': 2}) == {'x': True, 'y': True}, "Failed to set a batch"
+    assert db.get_many(['x', 'y', 'b']) == {'x': 1, 'y': 2, 'b': None}, "Failed to get a batch"
+    assert db.delete_many(['x', 'b']) == {'x': 1, 'b': None}, "Failed to delete a batch"
+
+    # Log persistence: every change is appended and replayed on load
+    log_db = FileDatabase('log')
+    log_db.load()
+    assert log_db.set_value(30, 'c') == True, "Failed to set key 'c' in log mode"
+    assert log_db.delete_value('c') == 30, "Failed to delete key 'c' in log mode"
+    assert log_db.set_value(40, 'd') == True, "Failed to set key 'd' in log mode"
+    log_db.set_many({'f': 60, 'g': 70})
+    log_db.delete_many(['g'])
+    assert log_db.set_many([(['unhashable'], 0), ('e', 50)]) == {'e': True}, "Failed to skip an unhashable key"
+    log_db.set_many({'k': None, 'n': None})
+    assert log_db.delete_value('k') is None and log_db.delete_many(['n']) == {'n': None}, "Failed to delete None"
+    log_db.set_many({'t1': 1, 't2': 2}, ttl=0.05)  # Expired keys are deleted and logged in one batch
+    time.sleep(0.25)
+    assert log_db.get_value('t1') is None and log_db.reap_expired() == 2, "Failed to reap expired keys"
+    reopened = FileDatabase('log')
+    reopened.load()
+    assert reopened.get_value('d') == 40 and reopened.get_value('e') == 50, "Log replay lost a key"
+    assert reopened.get_value('c') is None, "Log replay resurrected deleted key 'c'"
+    assert reopened.get_many(['f', 'g', 't1']) == {'f': 60, 'g': None, 't1': None}, "Log replay lost a batch"
+    assert 'k' not in reopened.dict and 'n' not in reopened.dict, "Log replay resurrected keys holding None"
+
+    # Binary codec: keeps non-JSON types, and a JSON log written before the switch is migrated on load
+    paths = dict(file_path='binary_database.pkl', log_path='binary_database.wal')
+    json_db = FileDatabase('log', **paths)
+    json_db.set_value(40, 'd')
+    binary_db = FileDatabase('log', codec='binary', **paths)
+    binary_db.load()
+    assert binary_db.get_value('d') == 40, "Switching codecs lost the JSON log"
+    assert binary_db.set_value((1, b'raw'), 7) == True, "Failed to set a non-JSON value"
+    reopened = FileDatabase('log', codec='binary', **paths)
+    reopened.load()
+    assert reopened.get_value(7) == (1, b'raw'), "Binary codec did not keep the value's type"
+    assert reopened.get_value('d') == 40, "Migrated snapshot lost key 'd'"
+    assert not [path for path in os.listdir() if path.endswith('.tmp')], "Compaction left a temporary file"
+    for opened in (json_db, binary_db, reopened):
+        opened.io.close(opened.handle)
+        opened.io.close(opened.log_handle)
+    for path in paths.values():
+        os.remove(path)
+
+    # The arena engine holds the keys in a compact arena, and loading fills it instead of a dict
+    paths = dict(file_path='arena_database.pkl', log_path='arena_database.wal')
+    arena_db = FileDatabase('log', engine='arena', codec='binary', **paths)
+    arena_db.set_many({(1, 'a'): 1, 'b': [2]})
+    arena_db.compact()
+    arena_db.set_value(3, 'c')
+    reopened = FileDatabase('log', engine='arena', codec='binary', **paths)
+    reopened.load()
+    assert type(reopened.dict).__name__ == 'ArenaStore', "Loading replaced the arena by a dict"
+    assert reopened.get_many([(1.0, 'a'), 'b', 'c']) == {(1.0, 'a'): 1, 'b': [2], 'c': 3}, "The arena lost data"
+    for opened in (arena_db, reopened):
+        opened.io.close(opened.handle)
+        opened.io.close(opened.log_handle)
+    for path in paths.values():
+        os.remove(path)
+
+    # An unreadable snapshot is reported, not replaced by an empty database
+    with open('corrupt_database.pkl', 'wb') as corrupt_file:
+        corrupt_file.write(b'{"a": 1, "b"')
+    corrupt_db = FileDatabase(file_path='corrupt_database.pkl')
+    try:
+        corrupt_db.load()
+        raise AssertionError("A corrupt snapshot was loaded as an empty database")
+    except ValueError:
+        pass
+    corrupt_db.io.close(corrupt_db.handle)
+    os.remove('corrupt_database.pkl')
+
+    # Group commit: the change is on disk when set_value returns
+    group_db = FileDatabase('log', durability='group')
+    assert group_db.set_value(45, 'durable') == True, "Failed to set key 'durable' with group commit"
+    assert group_db.committer.durable == group_db.committer.registered, "Group commit returned before syncing"
+
+    # Mmap persistence: values are read from the mapped file, nothing is loaded into memory
+    mmap_db = FileDatabase('mmap', file_path='mmap_database.dat')
+    assert mmap_db.set_value({'nested': [1, 2]}, 'm') == True, "Failed to set key 'm' in mmap mode"
+    assert mmap_db.set_many({'n': 1, 'o': 2}) == {'n': True, 'o': True}, "Failed to set a batch in mmap mode"
+    assert mmap_db.delete_value('n') == 1, "Failed to delete key 'n' in mmap mode"
+    assert mmap_db.set_value('x', 1) and mmap_db.get_value(1.0) == 'x', "Equal keys differ in mmap mode"
+    assert mmap_db.delete_value(True) == 'x', "Failed to delete key 1 as True in mmap mode"
+    mmap_db.close()
+    reopened = FileDatabase('mmap', file_path='mmap_database.dat')
+    reopened.load()
+    assert reopened.get_many(['m', 'n', 'o']) == {'m': {'nested': [1, 2]}, 'n': None, 'o': 2}, "Mmap store lost data"
+
+    # A value cache in front of the mapped files serves repeated reads of hot keys
+    cached_db = FileDatabase('mmap', file_path='mmap_database.dat', cache_bytes=1024, cache_policy='arc')
+    for _ in range(3):
+        assert cached_db.get_value('o') == 2, "Failed to read key 'o' through the cache"
+    assert cached_db.cache_stats()['hits'] == 2, "Expected repeated reads to hit the cache"
+    assert cached_db.set_value(3, 'o') and cached_db.get_value('o') == 3, "Cache served a stale value"
+    for opened in (mmap_db, reopened, cached_db):
+        opened.dict.close()
+    os.remove('mmap_database.dat')
+    os.remove('mmap_database.idx')
+
+    # An mmap store never truncates a file it did not create, like a snapshot
+    snapshot_db = FileDatabase(file_path='snapshot_database.pkl')
+    snapshot_db.set_value(1, 'kept')
+    snapshot_size = os.path.getsize('snapshot_database.pkl')
+    try:
+        FileDatabase('mmap', file_path='snapshot_database.pkl')
+        raise AssertionError("An mmap store was created over a snapshot")
+    except ValueError:
+        pass
+    assert os.path.getsize('snapshot_database.pkl') == snapshot_size, "The snapshot was truncated"
+    default_db = FileDatabase('mmap')
+    assert default_db.file_path == MMAP_PATH, "Mmap mode defaults to the snapshot file"
+    default_db.dict.close()
+    os.remove(MMAP_PATH)
+    os.remove(os.path.splitext(MMAP_PATH)[0] + '.idx')
+    snapshot_db.io.close(snapshot_db.handle)
+    os.remove('snapshot_database.pkl')
+
+    # A snapshot database exported to an mmap store reopens without loading anything
+    log_db.export_mmap('exported_database.dat')
+    lazy_db = FileDatabase('mmap', file_path='exported_database.dat')
+    assert lazy_db.get_many(['d', 'f']) == {'d': 40, 'f': 60}, "Export lost data"
+    lazy_db.dict.close()
+    os.remove('exported_database.dat')
+    os.remove('exported_database.idx')
+
+    # Checkpoint persistence: changes are snapshotted in the background
+    checkpoint_db = FileDatabase('checkpoint', dirty_threshold=100, checkpoint_interval=1.0)
+    checkpoint_db.load()
+    assert checkpoint_db.set_value(50, 'e') == True, "Failed to set key 'e' in checkpoint mode"
+    stats = checkpoint_db.checkpoint()
+    assert stats['last_bytes'] > 0, "Checkpoint wrote nothing"
+    checkpoint_db.close()
+
+    logger.info("All assertions passed.")
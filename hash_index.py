@@ -0,0 +1,177 @@
+import hashlib
+import struct
+
+SLOT = struct.Struct('<QQ')  # Key hash, record reference
+COMPACT_SLOT = struct.Struct('<II')  # 32-bit key hash and record reference, for indexes of buffers under 4 GiB
+EMPTY = 0  # Reference of a never used slot, which ends a probe sequence
+DELETED = 1  # Reference of a slot whose key was removed, which probes continue past
+FIRST_REFERENCE = 2  # References below this are markers, record offsets are stored shifted up by it
+MAX_LOAD = 0.75  # Fraction of used slots (live or deleted) before the index must be rebuilt
+
+
+def key_hash(key):
+    """
+    Returns a 64-bit hash of a key that is identical in every process, unlike hash() with a random seed.
+
+    :param key: The encoded key.
+    :type key: bytes
+    :return: The hash.
+    :rtype: int
+    """
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+
+class HashIndex:
+    def __init__(self, buffer, base, capacity, slot=SLOT):
+        """
+        An open-addressing hash table with linear probing, stored in a fixed region of a writable buffer
+        (a bytearray, an mmap or a shared memory block). Each slot maps a 64-bit key hash to the offset of
+        a record; the caller owns the records and decides whether a record matches a key.
+
+        :param buffer: The writable buffer holding the slots.
+        :type buffer: bytearray or mmap.mmap or memoryview
+        :param base: Byte offset of the first slot in the buffer.
+        :type base: int
+        :param capacity: The number of slots, a power of two.
+        :type capacity: int
+        :param slot: The slot layout, SLOT or COMPACT_SLOT. With COMPACT_SLOT, hashes must fit in 32 bits.
+        :type slot: struct.Struct
+        """
+        if capacity & (capacity - 1) or capacity <= 0:
+            raise ValueError("Capacity must be a power of two.")
+        self.buffer = buffer
+        self.base = base
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.slot = slot
+
+    @staticmethod
+    def size(capacity, slot=SLOT):
+        """
+        Returns the number of bytes an index of `capacity` slots occupies.
+        """
+        return capacity * slot.size
+
+    def probe(self, hash_value, matches):
+        """
+        Looks up a key.
+
+        :param hash_value: The key hash.
+        :type hash_value: int
+        :param matches: Called with a record offset, returns True if that record holds the key.
+        :type matches: callable
+        :return: (slot holding the key or -1, first slot a new entry for the key may use or -1 if the index is full).
+        :rtype: tuple
+        """
+        buffer, base, mask, unpack_from = self.buffer, self.base, self.mask, self.slot.unpack_from
+        slot = hash_value & mask
+        free = -1
+        size = self.slot.size
+        for _ in range(self.capacity):
+            stored_hash, reference = unpack_from(buffer, base + slot * size)
+            if reference == EMPTY:
+                return -1, slot if free < 0 else free
+            if reference == DELETED:
+                if free < 0:
+                    free = slot
+            elif stored_hash == hash_value and matches(reference - FIRST_REFERENCE):
+                return slot, free
+            slot = (slot + 1) & mask
+        return -1, free
+
+    def get(self, slot):
+        """
+        Returns the (hash, record offset) stored in a live slot.
+        """
+        stored_hash, reference = self.slot.unpack_from(self.buffer, self.base + slot * self.slot.size)
+        return stored_hash, reference - FIRST_REFERENCE
+
+    def is_deleted(self, slot):
+        """
+        Returns True if a slot held a key that was removed.
+        """
+        return self.slot.unpack_from(self.buffer, self.base + slot * self.slot.size)[1] == DELETED
+
+    def put(self, slot, hash_value, offset):
+        """
+        Points a slot at a record.
+        """
+        self.slot.pack_into(self.buffer, self.base + slot * self.slot.size, hash_value, offset + FIRST_REFERENCE)
+
+    def remove(self, slot):
+        """
+        Marks a slot deleted, keeping probe sequences that pass through it intact.
+        """
+        self.slot.pack_into(self.buffer, self.base + slot * self.slot.size, 0, DELETED)
+
+    def entries(self):
+        """
+        Returns every live (hash, record offset) pair.
+
+        :rtype: list
+        """
+        buffer, base, unpack_from = self.buffer, self.base, self.slot.unpack_from
+        entries = []
+        size = self.slot.size
+        for slot in range(self.capacity):
+            stored_hash, reference = unpack_from(buffer, base + slot * size)
+            if reference >= FIRST_REFERENCE:
+                entries.append((stored_hash, reference - FIRST_REFERENCE))
+        return entries
+
+    def clear(self):
+        """
+        Empties every slot.
+        """
+        size = self.size(self.capacity, self.slot)
+        self.buffer[self.base:self.base + size] = bytes(size)
+
+    def rebuild(self, entries):
+        """
+        Empties the index and reinserts `entries`, dropping all deleted markers.
+
+        :param entries: (hash, record offset) pairs with distinct keys.
+        :type entries: list
+        """
+        self.clear()
+        buffer, base, mask, unpack_from = self.buffer, self.base, self.mask, self.slot.unpack_from
+        for hash_value, offset in entries:
+            slot = hash_value & mask
+            while unpack_from(buffer, base + slot * self.slot.size)[1] != EMPTY:
+                slot = (slot + 1) & mask
+            self.put(slot, hash_value, offset)
+
+
+if __name__ == '__main__':
+    records = [b'alpha', b'beta', b'gamma', b'delta']
+    index = HashIndex(bytearray(HashIndex.size(8)), 0, 8)
+
+    def find(key):
+        return index.probe(key_hash(key), lambda offset: records[offset] == key)
+
+    for offset, key in enumerate(records):
+        slot, free = find(key)
+        assert slot == -1, f"{key} found before insertion"
+        index.put(free, key_hash(key), offset)
+    for offset, key in enumerate(records):
+        slot, _ = find(key)
+        assert index.get(slot) == (key_hash(key), offset), f"{key} maps to the wrong record"
+
+    # Deleted slots keep later keys reachable and are reused
+    slot, _ = find(b'alpha')
+    index.remove(slot)
+    assert find(b'alpha')[0] == -1, "Removed key still found"
+    assert all(find(key)[0] >= 0 for key in records[1:]), "Removal broke a probe sequence"
+    assert len(index.entries()) == 3, "Expected three live entries"
+
+    index.rebuild(index.entries())
+    assert all(find(key)[0] >= 0 for key in records[1:]), "Rebuild lost an entry"
+    assert key_hash(b'alpha') == key_hash(b'alpha') and key_hash(b'alpha') != key_hash(b'beta'), "Unstable hash"
+
+    # Compact slots take half the space for 32-bit hashes and references
+    compact = HashIndex(bytearray(HashIndex.size(8, COMPACT_SLOT)), 0, 8, COMPACT_SLOT)
+    assert len(compact.buffer) == 64, "Compact slots should take 8 bytes"
+    compact.put(compact.probe(7, lambda offset: False)[1], 7, 40)
+    assert compact.entries() == [(7, 40)] and compact.probe(7, lambda offset: offset == 40)[0] == 7, "Bad compact slot"
+
+    print("All assertions passed.")
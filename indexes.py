@@ -0,0 +1,297 @@
+from bisect import bisect_left, insort
+
+from tracing import logger
+
+CHUNK_SIZE = 512  # Values per chunk of a SortedList; a chunk is split when it doubles
+MISSING = object()  # Stands for a key that was not stored, since None is a storable value
+
+
+class SortedList:
+    def __init__(self, values=()):
+        """
+        A sorted list kept as a list of chunks of at most 2 * CHUNK_SIZE values, with the largest value of each
+        chunk in a separate list. An insert or removal bisects the maxima, then one chunk, and shifts at most
+        one chunk, so it costs O(log n + CHUNK_SIZE) instead of the O(n) shift of a single sorted list.
+
+        :param values: The initial values, in any order.
+        :type values: iterable
+        """
+        values = sorted(values)
+        self.chunks = [values[i:i + CHUNK_SIZE] for i in range(0, len(values), CHUNK_SIZE)]
+        self.maxes = [chunk[-1] for chunk in self.chunks]
+        self.size = len(values)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            yield from chunk
+
+    def add(self, value):
+        """
+        Inserts a value, keeping the list sorted.
+
+        :raises TypeError: If the value cannot be compared with the stored values.
+        """
+        maxes = self.maxes
+        if not maxes:
+            self.chunks.append([value])
+            maxes.append(value)
+            self.size += 1
+            return
+        i = bisect_left(maxes, value)
+        if i == len(maxes):
+            i -= 1
+            self.chunks[i].append(value)
+            maxes[i] = value
+        else:
+            insort(self.chunks[i], value)
+        self.size += 1
+        chunk = self.chunks[i]
+        if len(chunk) > 2 * CHUNK_SIZE:
+            self.chunks[i:i + 1] = [chunk[:CHUNK_SIZE], chunk[CHUNK_SIZE:]]
+            maxes[i:i + 1] = [chunk[CHUNK_SIZE - 1], chunk[-1]]
+
+    def discard(self, value):
+        """
+        Removes a value if it is in the list.
+
+        :return: True if it was removed.
+        :rtype: bool
+        """
+        maxes = self.maxes
+        i = bisect_left(maxes, value)
+        if i == len(maxes):
+            return False
+        chunk = self.chunks[i]
+        j = bisect_left(chunk, value)
+        if chunk[j] != value:
+            return False
+        del chunk[j]
+        self.size -= 1
+        if chunk:
+            maxes[i] = chunk[-1]
+        else:
+            del self.chunks[i]
+            del maxes[i]
+        return True
+
+    def irange(self, start=None, stop=None):
+        """
+        Yields the values from `start` (inclusive) up to `stop` (exclusive) in order, either bound being
+        optional. Finding the first value costs O(log n), every following one O(1).
+        """
+        maxes, chunks = self.maxes, self.chunks
+        if start is None:
+            i, j = 0, 0
+        else:
+            i = bisect_left(maxes, start)
+            if i == len(maxes):
+                return
+            j = bisect_left(chunks[i], start)
+        while i < len(chunks):
+            chunk = chunks[i]
+            end = len(chunk) if stop is None or maxes[i] < stop else bisect_left(chunk, stop)
+            yield from chunk[j:end]
+            if end < len(chunk):
+                return
+            i, j = i + 1, 0
+
+
+class Indexes:
+    def __init__(self, items=()):
+        """
+        The ordered indexes of a database: its keys in order, for prefix and range scans, and optional
+        secondary indexes ordering keys by a field of their values. The database reports every change
+        with on_set() and on_delete(), so the indexes never need rebuilding from the whole dictionary.
+
+        Each index keeps one SortedList per type name of what it orders, so keys of different types, like
+        the str and int keys a database may mix, never need comparing, and values of one type are compared
+        natively. A range covers the values of the type of its bounds; without bounds, types are visited
+        in the order of their names.
+
+        :param items: The (key, value) pairs stored so far.
+        :type items: iterable
+        """
+        self.secondary = {}  # Index name -> (field, {type name: SortedList of (field value, key type, key)})
+        self.rebuild(items)
+
+    @staticmethod
+    def partition(lists, value):
+        """
+        Returns the SortedList of a type, creating it on first use.
+        """
+        name = type(value).__name__
+        sorted_list = lists.get(name)
+        if sorted_list is None:
+            sorted_list = lists[name] = SortedList()
+        return sorted_list
+
+    @staticmethod
+    def group(values, type_of):
+        """
+        Builds SortedLists from values grouped by the type name of `type_of(value)`.
+        """
+        groups = {}
+        for value in values:
+            groups.setdefault(type(type_of(value)).__name__, []).append(value)
+        return {name: SortedList(grouped) for name, grouped in groups.items()}
+
+    def rebuild(self, items):
+        """
+        Rebuilds every index from scratch, after the database was reloaded.
+        """
+        items = list(items)
+        self.keys = self.group((key for key, _ in items), lambda key: key)
+        for name, (field, _) in list(self.secondary.items()):
+            self.add_index(name, field, items)
+
+    @staticmethod
+    def field_value(field, val):
+        """
+        Returns the value of a field of a stored value, or MISSING if it has none.
+
+        :param field: A key of mapping values, or a function of the value.
+        :type field: str or callable
+        """
+        try:
+            extracted = field(val) if callable(field) else val[field]
+        except (KeyError, IndexError, TypeError):
+            return MISSING
+        return MISSING if extracted is None else extracted
+
+    def add_index(self, name, field, items):
+        """
+        Creates or replaces a secondary index over a field of the stored values.
+        Values without the field, or with None in it, are left out.
+
+        :raises ValueError: If field values of the same type cannot be ordered.
+        """
+        entries = []
+        for key, val in items:
+            extracted = self.field_value(field, val)
+            if extracted is not MISSING:
+                entries.append((extracted, type(key).__name__, key))
+        try:
+            self.secondary[name] = (field, self.group(entries, lambda entry: entry[0]))
+        except TypeError:
+            raise ValueError(f"Index {name!r} has values that cannot be ordered.") from None
+
+    def drop_index(self, name):
+        """
+        Removes a secondary index.
+
+        :raises KeyError: If there is no index of that name.
+        """
+        del self.secondary[name]
+
+    def on_set(self, key, old, val):
+        """
+        Updates the indexes after a key was set.
+
+        :param old: The value the key had, or MISSING if it was not stored.
+        """
+        try:
+            if old is MISSING:
+                self.partition(self.keys, key).add(key)
+            for field, lists in self.secondary.values():
+                if old is not MISSING:
+                    extracted = self.field_value(field, old)
+                    if extracted is not MISSING:
+                        self.partition(lists, extracted).discard((extracted, type(key).__name__, key))
+                extracted = self.field_value(field, val)
+                if extracted is not MISSING:
+                    self.partition(lists, extracted).add((extracted, type(key).__name__, key))
+        except TypeError:
+            logger.error("on_set: %r or a field of its value cannot be ordered with the indexed ones.", key)
+
+    def on_delete(self, key, old):
+        """
+        Updates the indexes after a key was deleted.
+
+        :param old: The value the key had.
+        """
+        self.partition(self.keys, key).discard(key)
+        for field, lists in self.secondary.values():
+            extracted = self.field_value(field, old)
+            if extracted is not MISSING:
+                self.partition(lists, extracted).discard((extracted, type(key).__name__, key))
+
+    @staticmethod
+    def irange(lists, start, stop, wrap=lambda bound: bound):
+        """
+        Yields the values of a range from the SortedList of the type of its bounds, or from every list.
+        """
+        if start is None and stop is None:
+            for name in sorted(lists):
+                yield from lists[name]
+            return
+        sorted_list = lists.get(type(start if start is not None else stop).__name__)
+        if sorted_list is not None:
+            yield from sorted_list.irange(None if start is None else wrap(start), None if stop is None else wrap(stop))
+
+    def scan_keys(self, start=None, stop=None, prefix=None):
+        """
+        Yields the keys from `start` (inclusive) to `stop` (exclusive) in order, or the string keys starting
+        with `prefix`.
+        """
+        if prefix is None:
+            yield from self.irange(self.keys, start, stop)
+            return
+        for key in self.irange(self.keys, prefix, None):
+            if not key.startswith(prefix):
+                return
+            yield key
+
+    def find_keys(self, name, start=None, stop=None):
+        """
+        Yields the keys whose field value in a secondary index lies from `start` (inclusive) to
+        `stop` (exclusive), in field order.
+
+        :raises KeyError: If there is no index of that name.
+        """
+        for entry in self.irange(self.secondary[name][1], start, stop, lambda bound: (bound,)):
+            yield entry[2]
+
+    def find_equal(self, name, value):
+        """
+        Yields the keys whose field value in a secondary index equals `value`.
+
+        :raises KeyError: If there is no index of that name.
+        """
+        for entry in self.irange(self.secondary[name][1], value, None, lambda bound: (bound,)):
+            if entry[0] != value:
+                return
+            yield entry[2]
+
+
+if __name__ == '__main__':
+    import random
+
+    values = list(range(5000))
+    random.Random(1).shuffle(values)
+    sorted_list = SortedList(values[:1000])
+    for value in values[1000:]:
+        sorted_list.add(value)
+    assert list(sorted_list) == list(range(5000)) and len(sorted_list.chunks) > 1, "Inserts broke the order"
+    for value in values[:2500]:
+        assert sorted_list.discard(value), f"Failed to remove {value}"
+    assert not sorted_list.discard(-1), "Removed a value that was not there"
+    assert list(sorted_list) == sorted(values[2500:]) and len(sorted_list) == 2500, "Removals broke the order"
+    remaining = sorted(values[2500:])
+    assert list(sorted_list.irange(100, 200)) == [v for v in remaining if 100 <= v < 200], "Wrong range"
+    assert list(sorted_list.irange(4990)) == [v for v in remaining if v >= 4990], "Wrong open range"
+
+    indexes = Indexes({'user 1': {'age': 30}, 'user 2': {'age': 25}, 'other': 7, 3: 'int key'}.items())
+    indexes.add_index('age', 'age', [('user 1', {'age': 30}), ('user 2', {'age': 25})])
+    indexes.on_set('user 3', MISSING, {'age': 30})
+    indexes.on_set('user 1', {'age': 30}, {'age': 40})
+    indexes.on_delete('user 2', {'age': 25})
+    assert list(indexes.scan_keys(prefix='user ')) == ['user 1', 'user 3'], "Wrong prefix scan"
+    assert list(indexes.scan_keys()) == [3, 'other', 'user 1', 'user 3'], "Keys of mixed types out of order"
+    assert list(indexes.scan_keys(0, 10)) == [3], "A range of int keys included other types"
+    assert list(indexes.find_equal('age', 30)) == ['user 3'], "Secondary index kept an old value"
+    assert list(indexes.find_keys('age', 30, 50)) == ['user 3', 'user 1'], "Wrong secondary range"
+
+    print("All assertions passed.")
@@ -0,0 +1,161 @@
+import codecs
+import json
+import re
+from json.decoder import scanstring
+
+READ_CHUNK_SIZE = 1024 * 1024
+OBJECT_START = re.compile(r'[ \t\n\r]*\{')
+ITEM_START = re.compile(r'[ \t\n\r]*(["}])')
+KEY_SEPARATOR = re.compile(r'[ \t\n\r]*:[ \t\n\r]*')
+ITEM_SEPARATOR = re.compile(r'[ \t\n\r]*([,}])[ \t\n\r]*')
+
+
+def iter_object_items(read, chunk_size=READ_CHUNK_SIZE):
+    """
+    Incrementally parses a JSON object from a byte stream, yielding its items one at a time.
+    Only the unparsed tail of the stream is kept in memory, so loading a large snapshot needs
+    little more than the memory of the resulting dictionary.
+
+    :param read: Callable taking a byte count and returning up to that many bytes, or b'' at end of stream.
+    :type read: callable
+    :param chunk_size: Number of bytes requested per read.
+    :type chunk_size: int
+    :return: Generator of (key, value) pairs in file order.
+    :rtype: generator
+    :raises ValueError: If the stream is not a single JSON object.
+    """
+    json_decoder = json.JSONDecoder()
+    scan_value = json_decoder.scan_once
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def fill(minimum):
+        """
+        Appends at least `minimum` more bytes to the buffer unless the stream ends first.
+        """
+        nonlocal buffer, pos, eof
+        buffer = buffer[pos:]  # Drop what was already parsed
+        pos = 0
+        wanted = max(chunk_size, minimum)
+        while wanted > 0 and not eof:
+            data = read(wanted)
+            if not data:
+                eof = True
+                buffer += text_decoder.decode(b'', final=True)
+                break
+            buffer += text_decoder.decode(data)
+            wanted -= len(data)
+
+    def bulk_cut():
+        """
+        Finds the last ',' in the buffer that is followed by the opening quote of a key.
+        A comma inside a nested value also qualifies, but then the slice up to it has unbalanced
+        brackets and fails to decode, so a successful decode proves the cut is between top-level items.
+        """
+        cut = buffer.rfind(',', pos)
+        while cut > pos:
+            match = ITEM_START.match(buffer, cut + 1)
+            if match and match.group(1) == '"':
+                return cut
+            cut = buffer.rfind(',', pos, cut)
+        return -1
+
+    fill(chunk_size)
+    while True:
+        match = OBJECT_START.match(buffer, pos)
+        if match or eof:
+            break
+        fill(chunk_size)
+    if not match:
+        raise ValueError("Stream does not contain a JSON object.")
+    pos = match.end()
+
+    first = True
+    bulk = True
+    while True:
+        if bulk:
+            # Fast path: decode every complete item in the buffer with a single call into the C decoder
+            bulk = False
+            cut = bulk_cut()
+            if cut > pos:
+                try:
+                    items = json_decoder.decode('{' + buffer[pos:cut] + '}')
+                except ValueError:
+                    items = None
+                if items is not None:
+                    yield from items.items()
+                    first = False
+                    pos = cut + 1
+                    continue
+        # Each item is parsed as a whole and restarted after a refill if it runs past the buffer.
+        # Requiring the trailing ',' or '}' guarantees a number was not cut off mid-digits.
+        try:
+            match = ITEM_START.match(buffer, pos)
+            if not match or (match.group(1) == '}' and not first):
+                raise ValueError(f"Expected a key at offset {pos}.")
+            if match.group(1) == '}':
+                return  # Empty object
+            key, end = scanstring(buffer, match.end())
+            match = KEY_SEPARATOR.match(buffer, end)
+            if not match:
+                raise ValueError(f"Expected ':' after key {key!r}.")
+            value, end = scan_value(buffer, match.end())
+            match = ITEM_SEPARATOR.match(buffer, end)
+            if not match:
+                raise ValueError(f"Expected ',' or '}}' after value of {key!r}.")
+        except (StopIteration, ValueError) as error:
+            if eof:
+                raise ValueError(f"Invalid JSON object: {error}") from None
+            fill(len(buffer) - pos)  # Double the window so long values parse in O(n)
+            bulk = True
+            continue
+        yield key, value
+        first = False
+        pos = match.end()
+        if match.group(1) == '}':
+            return
+
+
+def load_object(read, chunk_size=READ_CHUNK_SIZE):
+    """
+    Builds a dictionary from a JSON object stream without holding the whole document in memory.
+
+    :param read: Callable taking a byte count and returning up to that many bytes, or b'' at end of stream.
+    :type read: callable
+    :param chunk_size: Number of bytes requested per read.
+    :type chunk_size: int
+    :return: The decoded dictionary.
+    :rtype: dict
+    :raises ValueError: If the stream is not a single JSON object.
+    """
+    result = {}
+    for key, value in iter_object_items(read, chunk_size):
+        result[key] = value
+    return result
+
+
+if __name__ == '__main__':
+    import io
+
+    sample = {'a': 1, 'b': [1, 2, {'c': 'd', 'e': [3, 4]}], 'long': 'x' * 5000, 'num': 123456789, 'ü': 'ñ',
+              'none': None, 'tricky': 'a, "b": 1}, "c', 'nested': {'x': {'y': 1, 'z': 2}, 'w': 3}}
+    sample.update({f'key {i}': i for i in range(200)})
+    encoded = json.dumps(sample).encode('utf-8')
+
+    # Tiny chunks split strings, numbers and multi-byte characters across reads
+    for size in (1, 2, 7, 64, READ_CHUNK_SIZE):
+        assert load_object(io.BytesIO(encoded).read, size) == sample, f"Mismatch with chunk size {size}"
+
+    assert load_object(io.BytesIO(b' { } ').read) == {}, "Empty object should load as an empty dict"
+
+    for broken in (b'', b'[1, 2]', b'{"a": 1', b'{"a" 1}'):
+        try:
+            load_object(io.BytesIO(broken).read, 4)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"Invalid document {broken!r} was accepted")
+
+    print("All assertions passed.")
@@ -0,0 +1,87 @@
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from json_stream import load_object
+
+BENCHMARK_PATH = 'load_benchmark.json'
+KEY_COUNT = 1000000
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size of the current process.
+
+    :return: Peak RSS in bytes, or None where the platform does not report it.
+    :rtype: int or None
+    """
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # Linux reports kilobytes
+
+
+def write_dataset(path, key_count):
+    """
+    Writes a snapshot file of `key_count` keys in the format FileDatabase.save() produces.
+    """
+    data = {f'key {i}': f'value {i}' for i in range(key_count)}
+    with open(path, 'wb') as dataset_file:
+        dataset_file.write(json.dumps(data).encode('utf-8'))
+
+
+def load_whole(path):
+    """
+    Reads the entire file into memory and parses it in one call, the approach the old loader took.
+    """
+    with open(path, 'rb') as dataset_file:
+        return json.loads(dataset_file.read().decode('utf-8'))
+
+
+def load_streaming(path):
+    """
+    Parses the file block by block with the streaming loader.
+    """
+    with open(path, 'rb') as dataset_file:
+        return load_object(dataset_file.read)
+
+
+LOADERS = {'whole-file': load_whole, 'streaming': load_streaming}
+
+
+def run_loader(name, path, results):
+    """
+    Runs one loader in a fresh process so its peak RSS is not polluted by the other.
+    """
+    baseline = peak_rss()
+    start = time.perf_counter()
+    loaded = LOADERS[name](path)
+    elapsed = time.perf_counter() - start
+    peak = peak_rss()
+    results.put((name, len(loaded), elapsed, baseline, peak))
+
+
+if __name__ == '__main__':
+    key_count = int(sys.argv[1]) if len(sys.argv) > 1 else KEY_COUNT
+    write_dataset(BENCHMARK_PATH, key_count)
+    file_size = os.path.getsize(BENCHMARK_PATH)
+    print(f'dataset: {key_count} keys, {file_size / 2 ** 20:.1f} MiB')
+
+    results = multiprocessing.Queue()
+    for loader in LOADERS:
+        process = multiprocessing.Process(target=run_loader, args=(loader, BENCHMARK_PATH, results))
+        process.start()
+        name, loaded_keys, elapsed, baseline, peak = results.get()
+        process.join()
+        assert loaded_keys == key_count, f"{name} loaded {loaded_keys} keys instead of {key_count}"
+        if peak is None:
+            print(f'{name:>10}: {elapsed:.2f} s')
+        else:
+            print(f'{name:>10}: {elapsed:.2f} s, peak RSS {peak / 2 ** 20:.1f} MiB '
+                  f'(+{(peak - baseline) / 2 ** 20:.1f} MiB over startup)')
+
+    os.remove(BENCHMARK_PATH)
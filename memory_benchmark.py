@@ -0,0 +1,63 @@
+import sys
+import time
+import tracemalloc
+
+from dict_database import DictDatabase
+
+KEY_COUNT = 200000
+WORKLOADS = {
+    'int values': lambda i: i,
+    'short strings': lambda i: f'value {i}',
+    'small dicts': lambda i: {'id': i, 'active': True},
+}
+
+
+def fill(engine, key_count, value):
+    """
+    Returns a database of `key_count` keys and the bytes its store allocated, as traced by tracemalloc.
+    """
+    tracemalloc.start()
+    db = DictDatabase(engine)
+    for i in range(key_count):
+        db.set_value(value(i), f'user:{i:08d}')
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return db, allocated
+
+
+def rates(engine, key_count, value):
+    """
+    Returns sets, gets and deletes per second, timed without tracing allocations.
+    """
+    db = DictDatabase(engine)
+    keys = [f'user:{i:08d}' for i in range(key_count)]
+    start = time.perf_counter()
+    for i, key in enumerate(keys):
+        db.set_value(value(i), key)
+    sets = time.perf_counter() - start
+    start = time.perf_counter()
+    for key in keys:
+        db.get_value(key)
+    gets = time.perf_counter() - start
+    start = time.perf_counter()
+    for key in keys:
+        db.delete_value(key)
+    deletes = time.perf_counter() - start
+    return key_count / sets, key_count / gets, key_count / deletes
+
+
+if __name__ == '__main__':
+    key_count = int(sys.argv[1]) if len(sys.argv) > 1 else KEY_COUNT
+    print(f'{key_count} keys like {"user:00000000"!r}')
+    for name, value in WORKLOADS.items():
+        _, plain_bytes = fill('dict', key_count, value)
+        arena_db, arena_bytes = fill('arena', key_count, value)
+        stats = arena_db.dict.stats()
+        assert arena_db.get_value(f'user:{key_count // 2:08d}') == value(key_count // 2), "The arena lost a value"
+        del arena_db
+        print(f'{name:>13}: dict {plain_bytes / key_count:6.1f} bytes/key, arena {arena_bytes / key_count:6.1f} '
+              f'bytes/key ({plain_bytes / arena_bytes:4.1f}x less; records {stats["arena_bytes"] / key_count:5.1f}, '
+              f'index {stats["index_bytes"] / key_count:5.1f})')
+        for engine in ('dict', 'arena'):
+            set_rate, get_rate, delete_rate = rates(engine, key_count, value)
+            print(f'{"":>13}  {engine:>5}: {set_rate:9.0f} sets/s, {get_rate:9.0f} gets/s, {delete_rate:9.0f} deletes/s')
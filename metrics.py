@@ -0,0 +1,333 @@
+import json
+import threading
+import time
+
+SUB_BUCKET_BITS = 7  # 128 sub-buckets per power of two keep every recorded value within 1% of its bucket
+MAX_VALUE = (1 << 63) - 1
+BUCKETS = (64 - SUB_BUCKET_BITS + 1) << SUB_BUCKET_BITS
+PERCENTILES = (0.5, 0.9, 0.99, 0.999)
+REPORT_INTERVAL = 10.0
+
+
+class Histogram:
+    def __init__(self):
+        """
+        Counts non-negative integer values, such as durations in nanoseconds or sizes in bytes, in HDR-style
+        log-linear buckets: exact below 128, then 128 buckets per power of two. Memory does not depend
+        on how many values are recorded, and recording costs a few integer operations.
+        The buckets cover every value up to 2 ** 63 - 1 in about 7,500 list slots.
+        """
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.min = MAX_VALUE
+        self.max = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def bucket_index(value):
+        """
+        Returns the bucket holding a value.
+        """
+        magnitude = value.bit_length() - SUB_BUCKET_BITS
+        return (magnitude << SUB_BUCKET_BITS) + (value >> magnitude) if magnitude > 0 else value
+
+    @staticmethod
+    def bucket_value(index):
+        """
+        Returns the middle of the range of values a bucket holds.
+        """
+        magnitude = index >> SUB_BUCKET_BITS
+        low = (index & ((1 << SUB_BUCKET_BITS) - 1)) << magnitude
+        return low + ((1 << magnitude) - 1) // 2
+
+    def record(self, value):
+        """
+        Counts one value.
+
+        :param value: The value, rounded down to an integer. Negative values count as 0, values of 2 ** 63
+                      or more as 2 ** 63 - 1.
+        :type value: int or float
+        """
+        value = min(int(value), MAX_VALUE) if value > 0 else 0
+        magnitude = value.bit_length() - SUB_BUCKET_BITS
+        index = (magnitude << SUB_BUCKET_BITS) + (value >> magnitude) if magnitude > 0 else value
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            if value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+
+    def value_at(self, fraction):
+        """
+        Returns the value below which `fraction` of the recorded values fall, to within the bucket precision.
+
+        :rtype: int or None
+        """
+        with self.lock:
+            counts = list(self.counts)
+            count, low, high = self.count, self.min, self.max
+        if not count:
+            return None
+        rank = min(count - 1, int(count * fraction))
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen > rank:
+                return min(max(self.bucket_value(index), low), high)
+        return high
+
+    def snapshot(self):
+        """
+        Summarizes the recorded values.
+
+        :return: The count, total, mean, minimum, maximum and the usual percentiles.
+        :rtype: dict
+        """
+        with self.lock:
+            summary = {'count': self.count, 'total': self.total, 'min': self.min if self.count else None,
+                       'max': self.max, 'mean': self.total / self.count if self.count else None}
+        for fraction in PERCENTILES:
+            summary[f'p{fraction * 100:g}'] = self.value_at(fraction)
+        return summary
+
+    def reset(self):
+        """
+        Forgets every recorded value.
+        """
+        with self.lock:
+            self.counts = [0] * BUCKETS
+            self.count = 0
+            self.total = 0
+            self.min = MAX_VALUE
+            self.max = 0
+
+
+class Counter:
+    def __init__(self):
+        """
+        A running total, such as a number of operations.
+        """
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def add(self, amount=1):
+        """
+        Adds to the total.
+        """
+        with self.lock:
+            self.value += amount
+
+    def reset(self):
+        """
+        Sets the total back to 0.
+        """
+        with self.lock:
+            self.value = 0
+
+
+class Metrics:
+    def __init__(self):
+        """
+        Holds the named histograms and counters the databases record into, and the switch their hot paths check
+        first, as they do tracer.enabled, so with metrics off an operation costs one attribute lookup.
+        Durations are recorded in nanoseconds, sizes in bytes.
+        """
+        self.enabled = False
+        self.histograms = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.held = threading.local()  # When the calling thread acquired each lock it holds
+        self.reporter = None
+
+    def histogram(self, name):
+        """
+        Returns the histogram of a name, creating it on first use.
+        """
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        return histogram
+
+    def counter(self, name):
+        """
+        Returns the counter of a name, creating it on first use.
+        """
+        counter = self.counters.get(name)
+        if counter is None:
+            with self.lock:
+                counter = self.counters.setdefault(name, Counter())
+        return counter
+
+    def record(self, name, value):
+        """
+        Records a value in the histogram of a name.
+        """
+        self.histogram(name).record(value)
+
+    def add(self, name, amount=1):
+        """
+        Adds to the counter of a name.
+        """
+        self.counter(name).add(amount)
+
+    def start_hold(self, name):
+        """
+        Notes that the calling thread just acquired a lock, to record how long it holds it with end_hold().
+        """
+        setattr(self.held, name, time.perf_counter_ns())
+
+    def end_hold(self, name):
+        """
+        Records how long the calling thread held a lock since start_hold(), if metrics were on then.
+        """
+        start = getattr(self.held, name, None)
+        if start is not None:
+            self.record(name, time.perf_counter_ns() - start)
+            setattr(self.held, name, None)
+
+    def snapshot(self):
+        """
+        Summarizes every histogram and counter.
+
+        :return: {'histograms': {name: summary}, 'counters': {name: value}}
+        :rtype: dict
+        """
+        with self.lock:
+            histograms = dict(self.histograms)
+            counters = dict(self.counters)
+        return {
+            'histograms': {name: histogram.snapshot() for name, histogram in sorted(histograms.items())},
+            'counters': {name: counter.value for name, counter in sorted(counters.items())},
+        }
+
+    def reset(self):
+        """
+        Clears every histogram and counter, for example between benchmark runs.
+        """
+        with self.lock:
+            for histogram in self.histograms.values():
+                histogram.reset()
+            for counter in self.counters.values():
+                counter.reset()
+
+
+metrics = Metrics()
+
+
+class MetricsReporter:
+    def __init__(self, interval=REPORT_INTERVAL, filename=None, callback=None):
+        """
+        Dumps a metrics snapshot every `interval` seconds from a background thread, and once more when closed.
+
+        :param interval: Seconds between dumps.
+        :type interval: float
+        :param filename: A file to append each snapshot to as one line of JSON, or None.
+        :type filename: str or None
+        :param callback: A function to call with each snapshot, or None.
+        :type callback: callable or None
+        """
+        self.interval = interval
+        self.filename = filename
+        self.callback = callback
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='metrics-reporter', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """
+        Dumps snapshots until closed.
+        """
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    def report(self):
+        """
+        Dumps one snapshot, stamped with the wall clock time.
+        """
+        snapshot = metrics.snapshot()
+        snapshot['time'] = time.time()
+        if self.filename is not None:
+            with open(self.filename, 'a') as file:
+                file.write(json.dumps(snapshot) + '\n')
+        if self.callback is not None:
+            self.callback(snapshot)
+
+    def close(self):
+        """
+        Stops the thread after a final dump.
+        """
+        self.stopped.set()
+        self.thread.join()
+        self.report()
+
+
+def enable_metrics(interval=None, filename=None, callback=None):
+    """
+    Turns on recording of lock waits and holds, serialization, writes, syncs and bytes written.
+
+    :param interval: If given, dump a snapshot every `interval` seconds to `filename` and/or `callback`.
+    :type interval: float or None
+    :param filename: A file to append snapshots to as lines of JSON, or None.
+    :type filename: str or None
+    :param callback: A function to call with each snapshot, or None.
+    :type callback: callable or None
+    :return: None
+    :rtype: None
+    """
+    disable_metrics()
+    if interval is not None:
+        metrics.reporter = MetricsReporter(interval, filename, callback)
+    metrics.enabled = True
+
+
+def disable_metrics():
+    """
+    Turns recording off again, making a final dump if snapshots were being dumped. Recorded values are kept.
+
+    :return: None
+    :rtype: None
+    """
+    metrics.enabled = False
+    if metrics.reporter is not None:
+        metrics.reporter.close()
+        metrics.reporter = None
+
+
+if __name__ == '__main__':
+    import os
+
+    histogram = Histogram()
+    for value in range(1, 100001):
+        histogram.record(value)
+    for fraction in PERCENTILES:
+        expected = fraction * 100000
+        assert abs(histogram.value_at(fraction) - expected) <= expected * 0.01, f"p{fraction} is off"
+    summary = histogram.snapshot()
+    assert summary['count'] == 100000 and summary['min'] == 1 and summary['max'] == 100000, "Wrong summary"
+    assert sum(1 for bucket_count in histogram.counts if bucket_count) < 1500, "Too many buckets for the range"
+    histogram.record(1 << 70)
+    assert histogram.max == MAX_VALUE, "An out of range value was not clamped"
+
+    assert not metrics.enabled, "Metrics must be off by default"
+    snapshots = []
+    enable_metrics(interval=60, filename='metrics_test.jsonl', callback=snapshots.append)
+    metrics.record('write', 1500)
+    metrics.add('log_appends')
+    metrics.start_hold('lock_write_hold')
+    metrics.end_hold('lock_write_hold')
+    disable_metrics()
+    assert snapshots[-1]['histograms']['write']['max'] == 1500, "Final dump missed a recorded value"
+    assert snapshots[-1]['counters']['log_appends'] == 1, "Final dump missed a counter"
+    assert snapshots[-1]['histograms']['lock_write_hold']['count'] == 1, "Lock hold was not recorded"
+    with open('metrics_test.jsonl') as file:
+        assert json.loads(file.readline())['counters'] == {'log_appends': 1}, "Dump file is wrong"
+    os.remove('metrics_test.jsonl')
+    metrics.reset()
+    assert metrics.snapshot()['counters'] == {'log_appends': 0}, "Reset kept a count"
+
+    print("All assertions passed.")
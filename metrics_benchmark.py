@@ -0,0 +1,47 @@
+import json
+import os
+import sys
+import time
+
+from metrics import metrics, enable_metrics, disable_metrics
+from sync_database import SyncDatabase
+
+OPERATIONS = 50000
+PATHS = dict(file_path='metrics_benchmark.pkl', log_path='metrics_benchmark.wal')
+
+
+def measure(operations):
+    """
+    Times set and get on a SyncDatabase in log mode, the path that records every metric.
+
+    :return: Operations per second for each operation.
+    :rtype: dict
+    """
+    db = SyncDatabase('threading', persistence='log', **PATHS)
+    keys = [f'key {i}' for i in range(operations)]
+    rates = {}
+    start = time.perf_counter()
+    for i, key in enumerate(keys):
+        db.set_value(i, key)
+    rates['set'] = operations / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for key in keys:
+        db.get_value(key)
+    rates['get'] = operations / (time.perf_counter() - start)
+    db.io.close(db.handle)
+    db.io.close(db.log_handle)
+    for path in PATHS.values():
+        os.remove(path)
+    return rates
+
+
+if __name__ == '__main__':
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else OPERATIONS
+    print(f'{operations} operations per measurement')
+    for name in ('disabled', 'enabled'):
+        if name == 'enabled':
+            enable_metrics()
+        rates = measure(operations)
+        disable_metrics()
+        print(f'{name:>9}: ' + '  '.join(f'{operation} {rate:10.0f} ops/s' for operation, rate in rates.items()))
+    print(json.dumps(metrics.snapshot(), indent=2))
@@ -0,0 +1,542 @@
+import mmap
+import os
+import struct
+
+from hash_index import HashIndex, key_hash, MAX_LOAD
+from serialization import encode_value, decode_value
+from tracing import logger
+
+DEFAULT_CAPACITY = 1 << 16  # Index slots of a new store
+INITIAL_DATA_SIZE = 1024 * 1024  # Bytes of a new data file, doubled whenever it fills up
+COMPACT_MIN_BYTES = 4 * 1024 * 1024  # Never compact a data file smaller than this
+COMPACT_RATIO = 2  # Compact once the data file holds this many bytes per live byte
+
+DATA_MAGIC = b'MMAPDAT1'
+INDEX_MAGIC = b'MMAPIDX1'
+DATA_BASE = len(DATA_MAGIC)  # Records start right after the data file magic
+FIELD = struct.Struct('<Q')
+# Index file header fields, each a little-endian u64 after the 8-byte magic
+CAPACITY = 8
+DATA_USED = 16  # End of the last record in the data file
+COUNT = 24
+DELETED_SLOTS = 32
+GENERATION = 40  # Incremented whenever the files are replaced or resized, so other mappings know to remap
+LIVE_BYTES = 48  # Bytes of records still referenced by the index
+INDEX_BASE = 64
+RECORD = struct.Struct('<II')  # Key length, value length; followed by the key and value encodings
+
+
+def index_path(path):
+    """
+    Returns the index file belonging to a data file, e.g. 'database.idx' for 'database.pkl'.
+    """
+    return os.path.splitext(path)[0] + '.idx'
+
+
+def sync_directory(path):
+    """
+    Forces renames in the directory holding `path` to disk. Windows cannot open a directory, and needs no sync.
+    """
+    if os.name == 'nt':
+        return
+    directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+
+def normalize_key(key):
+    """
+    Returns the form a key is stored in, so that keys equal as Python objects are stored as one, as in a dict:
+    bools and integral floats become ints, recursively inside tuples. The key comes back in that form from
+    keys() and items(), e.g. 1 for a key set as True or 1.0.
+
+    :raises TypeError: For keys other than None, bools, ints, floats, strings, bytes and tuples of them, whose
+                       equality the encoding cannot follow (two equal frozensets may encode differently).
+    """
+    kind = type(key)
+    if kind is str or kind is int or kind is bytes or key is None:
+        return key
+    if kind is bool:
+        return int(key)
+    if kind is float:
+        return int(key) if key.is_integer() else key
+    if kind is tuple:
+        return tuple(normalize_key(item) for item in key)
+    raise TypeError(f"Keys of type {kind.__name__} cannot be stored by their encoding.")
+
+
+def encode_key(key):
+    """
+    Returns the bytes a key is stored and hashed as, see normalize_key().
+
+    :raises TypeError: If the key is of a type normalize_key() refuses, like a dict refuses unhashable keys.
+    """
+    out = bytearray()
+    encode_value(normalize_key(key), out)
+    return bytes(out)
+
+
+class MmapStore:
+    def __init__(self, path, capacity=DEFAULT_CAPACITY):
+        """
+        A dictionary-like store kept in two memory-mapped files: an append-only data file of records and a
+        fixed-layout hash index file mapping each key hash to its record's offset. Opening a store maps the
+        files without reading them, a lookup probes the index and decodes a single record straight from the
+        page cache, and the operating system decides which pages stay in memory, so stores larger than RAM work.
+
+        Keys are matched on their encoding, so only the key types of normalize_key() are accepted, and equal
+        numbers are one key, as in a dict.
+
+        The index file header holds the shared state (sizes, counts and a generation number), so a handle in
+        another process notices when the files were grown or compacted and remaps them.
+
+        :param path: The data file. The index is kept next to it, see index_path().
+        :type path: str
+        :param capacity: Number of index slots when creating the store, a power of two.
+        :type capacity: int
+        """
+        self.path = path
+        self.index_path = index_path(path)
+        self.compacted_paths = (f'{path}.compacted', f'{self.index_path}.compacted')
+        self.finish_compaction()
+        self.create(capacity)
+        self.map_files()
+        logger.info("MmapStore opened %s with %d keys.", path, len(self))
+
+    def create(self, capacity):
+        """
+        Creates empty data and index files unless the store already exists.
+
+        :raises ValueError: If the data file exists without its index and is not an empty store, since
+                            creating the store would truncate it: a snapshot, or records that the missing
+                            index referenced.
+        """
+        if os.path.exists(self.index_path) and os.path.getsize(self.index_path) >= INDEX_BASE:
+            return
+        if os.path.exists(self.path) and os.path.getsize(self.path):
+            with open(self.path, 'rb') as data_file:
+                head = data_file.read(DATA_BASE + RECORD.size)
+            # A crash while creating the store leaves the data file with its magic and no record yet
+            if head[:DATA_BASE] != DATA_MAGIC or head[DATA_BASE:].strip(b'\0'):
+                raise ValueError(f"{self.path} exists and is not an empty MmapStore data file.")
+        with open(self.path, 'wb') as data_file:
+            data_file.write(DATA_MAGIC)
+            data_file.truncate(INITIAL_DATA_SIZE)
+        with open(self.index_path, 'wb') as index_file:
+            header = bytearray(INDEX_BASE)
+            header[:len(INDEX_MAGIC)] = INDEX_MAGIC
+            FIELD.pack_into(header, CAPACITY, capacity)
+            FIELD.pack_into(header, DATA_USED, DATA_BASE)
+            index_file.write(header)
+            index_file.truncate(INDEX_BASE + HashIndex.size(capacity))
+
+    def map_files(self):
+        """
+        Maps both files as they currently are on disk. Earlier mappings are dropped rather than closed,
+        so a lookup still running on them in another thread finishes safely.
+        """
+        with open(self.index_path, 'r+b') as index_file:
+            self.index_map = mmap.mmap(index_file.fileno(), 0)
+        if self.index_map[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            raise ValueError(f"{self.index_path} is not an MmapStore index.")
+        with open(self.path, 'r+b') as data_file:
+            self.data = mmap.mmap(data_file.fileno(), 0)
+        if self.data[:DATA_BASE] != DATA_MAGIC:
+            raise ValueError(f"{self.path} is not an MmapStore data file.")
+        self.capacity = self.field(CAPACITY)
+        self.generation = self.field(GENERATION)
+        self.index = HashIndex(self.index_map, INDEX_BASE, self.capacity)
+
+    def field(self, offset):
+        """
+        Reads an index header field.
+        """
+        return FIELD.unpack_from(self.index_map, offset)[0]
+
+    def set_field(self, offset, value):
+        """
+        Writes an index header field.
+        """
+        FIELD.pack_into(self.index_map, offset, value)
+
+    def refresh(self):
+        """
+        Remaps the files if another handle replaced or grew them since this one mapped them.
+        """
+        if self.field(GENERATION) != self.generation or self.field(DATA_USED) > len(self.data):
+            self.map_files()
+
+    def key_at(self, offset):
+        """
+        Returns the encoded key of the record at `offset`.
+        """
+        key_length = RECORD.unpack_from(self.data, offset)[0]
+        start = offset + RECORD.size
+        return self.data[start:start + key_length]
+
+    def value_at(self, offset):
+        """
+        Decodes the value of the record at `offset` directly from the mapping.
+        """
+        key_length = RECORD.unpack_from(self.data, offset)[0]
+        return decode_value(self.data, offset + RECORD.size + key_length)[0]
+
+    def record_size(self, offset):
+        """
+        Returns the number of bytes the record at `offset` occupies.
+        """
+        key_length, value_length = RECORD.unpack_from(self.data, offset)
+        return RECORD.size + key_length + value_length
+
+    def find(self, encoded_key):
+        """
+        Looks up an encoded key.
+
+        :return: (hash, slot holding the key or -1, first slot a new entry may use).
+        :rtype: tuple
+        """
+        hash_value = key_hash(encoded_key)
+        slot, free = self.index.probe(hash_value, lambda offset: self.key_at(offset) == encoded_key)
+        return hash_value, slot, free
+
+    def locate(self, key):
+        """
+        Returns the offset of a key's current record without decoding it, or -1 if it is not stored.
+        A record is never rewritten in place, so the same offset within the same generation means the same value.
+
+        :raises TypeError: If the key is unhashable.
+        """
+        self.refresh()
+        _, slot, _ = self.find(encode_key(key))
+        return self.index.get(slot)[1] if slot >= 0 else -1
+
+    def __contains__(self, key):
+        try:
+            encoded_key = encode_key(key)
+        except TypeError:
+            return False
+        self.refresh()
+        return self.find(encoded_key)[1] >= 0
+
+    def __getitem__(self, key):
+        self.refresh()
+        _, slot, _ = self.find(encode_key(key))
+        if slot < 0:
+            raise KeyError(key)
+        return self.value_at(self.index.get(slot)[1])
+
+    def get(self, key, default=None):
+        """
+        Returns the value of a key, or `default` if it is not stored.
+        """
+        try:
+            return self[key]
+        except (KeyError, TypeError):
+            return default
+
+    def __setitem__(self, key, val):
+        encoded_key = encode_key(key)
+        out = bytearray(RECORD.size)
+        out += encoded_key
+        encode_value(val, out)
+        RECORD.pack_into(out, 0, len(encoded_key), len(out) - RECORD.size - len(encoded_key))
+        self.refresh()
+        hash_value, slot, free = self.find(encoded_key)
+        if slot < 0 and self.field(COUNT) + self.field(DELETED_SLOTS) + 1 > self.capacity * MAX_LOAD:
+            self.resize_index(self.capacity * 2 if self.field(COUNT) + 1 > self.capacity * MAX_LOAD // 2
+                              else self.capacity)
+            hash_value, slot, free = self.find(encoded_key)
+
+        # Append the record first; it is unreachable until the index points at it
+        offset = self.field(DATA_USED)
+        if offset + len(out) > len(self.data):
+            self.grow_data(offset + len(out))
+        self.data[offset:offset + len(out)] = out
+        self.set_field(DATA_USED, offset + len(out))
+        live_bytes = self.field(LIVE_BYTES) + len(out)
+
+        if slot >= 0:
+            live_bytes -= self.record_size(self.index.get(slot)[1])
+            self.index.put(slot, hash_value, offset)
+        else:
+            if self.index.is_deleted(free):
+                self.set_field(DELETED_SLOTS, self.field(DELETED_SLOTS) - 1)
+            self.index.put(free, hash_value, offset)
+            self.set_field(COUNT, self.field(COUNT) + 1)
+        self.set_field(LIVE_BYTES, live_bytes)
+        if offset + len(out) > max(COMPACT_MIN_BYTES, COMPACT_RATIO * live_bytes):
+            self.compact()
+
+    def update(self, items):
+        """
+        Stores many key-value pairs at once: the index is resized and the data file grown at most once,
+        and the records are copied into the mapping with a single write, so importing a large database
+        costs about one hash probe per key.
+
+        :param items: A mapping of keys to values, or an iterable of (key, value) pairs.
+        :type items: dict or iterable
+        :raises TypeError: If a key is unhashable. Nothing is stored then.
+        """
+        out = bytearray()
+        records = []
+        for key, val in (items.items() if hasattr(items, 'items') else items):
+            encoded_key = encode_key(key)
+            start = len(out)
+            out += RECORD.pack(0, 0)
+            out += encoded_key
+            encode_value(val, out)
+            RECORD.pack_into(out, start, len(encoded_key), len(out) - start - RECORD.size - len(encoded_key))
+            records.append((encoded_key, start, len(out) - start))
+        if not records:
+            return
+        self.refresh()
+        capacity = self.capacity
+        while self.field(COUNT) + self.field(DELETED_SLOTS) + len(records) > capacity * MAX_LOAD:
+            capacity *= 2
+        if capacity != self.capacity:
+            self.resize_index(capacity)
+
+        base = self.field(DATA_USED)
+        if base + len(out) > len(self.data):
+            self.grow_data(base + len(out))
+        self.data[base:base + len(out)] = out
+        self.set_field(DATA_USED, base + len(out))
+        count, live_bytes = self.field(COUNT), self.field(LIVE_BYTES) + len(out)
+        for encoded_key, start, size in records:
+            hash_value, slot, free = self.find(encoded_key)
+            if slot >= 0:
+                live_bytes -= self.record_size(self.index.get(slot)[1])
+                self.index.put(slot, hash_value, base + start)
+            else:
+                if self.index.is_deleted(free):
+                    self.set_field(DELETED_SLOTS, self.field(DELETED_SLOTS) - 1)
+                self.index.put(free, hash_value, base + start)
+                count += 1
+        self.set_field(COUNT, count)
+        self.set_field(LIVE_BYTES, live_bytes)
+        if base + len(out) > max(COMPACT_MIN_BYTES, COMPACT_RATIO * live_bytes):
+            self.compact()
+
+    def pop(self, key, *default):
+        """
+        Removes a key and returns its value, or `default` if it is not stored.
+        """
+        try:
+            encoded_key = encode_key(key)
+        except TypeError:
+            if default:
+                return default[0]
+            raise
+        self.refresh()
+        _, slot, _ = self.find(encoded_key)
+        if slot < 0:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        offset = self.index.get(slot)[1]
+        val = self.value_at(offset)
+        self.index.remove(slot)
+        self.set_field(COUNT, self.field(COUNT) - 1)
+        self.set_field(DELETED_SLOTS, self.field(DELETED_SLOTS) + 1)
+        self.set_field(LIVE_BYTES, self.field(LIVE_BYTES) - self.record_size(offset))
+        return val
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+    def __len__(self):
+        return self.field(COUNT)
+
+    def items(self):
+        """
+        Returns every (key, value) pair, decoding the whole store.
+
+        :rtype: list
+        """
+        self.refresh()
+        items = []
+        for _, offset in self.index.entries():
+            items.append((decode_value(self.key_at(offset), 0)[0], self.value_at(offset)))
+        return items
+
+    def keys(self):
+        """
+        Returns every key.
+
+        :rtype: list
+        """
+        return [key for key, _ in self.items()]
+
+    def grow_data(self, minimum):
+        """
+        Doubles the data file until `minimum` bytes fit, and remaps it.
+        """
+        size = len(self.data)
+        while size < minimum:
+            size *= 2
+        with open(self.path, 'r+b') as data_file:
+            data_file.truncate(size)
+            self.data = mmap.mmap(data_file.fileno(), 0)
+        logger.info("grow_data: Data file %s grown to %d bytes.", self.path, size)
+
+    def bump_generation(self):
+        """
+        Tells handles in other processes to remap the files.
+        """
+        self.generation = self.field(GENERATION) + 1
+        self.set_field(GENERATION, self.generation)
+
+    def resize_index(self, capacity):
+        """
+        Rebuilds the index with `capacity` slots, dropping deleted markers.
+        """
+        entries = self.index.entries()
+        if capacity != self.capacity:
+            with open(self.index_path, 'r+b') as index_file:
+                index_file.truncate(INDEX_BASE + HashIndex.size(capacity))
+                self.index_map = mmap.mmap(index_file.fileno(), 0)
+            self.set_field(CAPACITY, capacity)
+            self.capacity = capacity
+            self.index = HashIndex(self.index_map, INDEX_BASE, capacity)
+        self.index.rebuild(entries)
+        self.set_field(DELETED_SLOTS, 0)
+        self.bump_generation()
+        logger.info("resize_index: Rebuilt index of %s with %d slots.", self.path, capacity)
+
+    def compact(self):
+        """
+        Writes the live records to a fresh data file and a matching index to a fresh index file, which replace
+        the old ones, reclaiming the space left by updates and deletes. The two files cannot be replaced in
+        one step, so both are synced under temporary names first, then renamed to their 'compacted' names:
+        from then on, an interrupted compaction is completed by the next open instead of pairing the new
+        index with the old data file.
+        """
+        temp_paths = [f'{path}.{os.getpid()}.tmp' for path in (self.path, self.index_path)]
+        relocated = []
+        offset = DATA_BASE
+        with open(temp_paths[0], 'wb') as temp_file:
+            temp_file.write(DATA_MAGIC)
+            for hash_value, old_offset in self.index.entries():
+                record = self.data[old_offset:old_offset + self.record_size(old_offset)]
+                temp_file.write(record)
+                relocated.append((hash_value, offset))
+                offset += len(record)
+            temp_file.truncate(max(INITIAL_DATA_SIZE, 2 * offset))
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+
+        generation = self.field(GENERATION) + 1
+        index = bytearray(self.index_map[:INDEX_BASE + HashIndex.size(self.capacity)])
+        HashIndex(index, INDEX_BASE, self.capacity).rebuild(relocated)
+        for field, value in ((DATA_USED, offset), (LIVE_BYTES, offset - DATA_BASE), (DELETED_SLOTS, 0),
+                             (GENERATION, generation)):
+            FIELD.pack_into(index, field, value)
+        with open(temp_paths[1], 'wb') as temp_file:
+            temp_file.write(index)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+
+        # The index is renamed last, so its compacted name existing means both files are complete
+        os.replace(temp_paths[0], self.compacted_paths[0])
+        os.replace(temp_paths[1], self.compacted_paths[1])
+        sync_directory(self.path)
+        self.finish_compaction()
+        self.set_field(GENERATION, generation)  # In the old index, so handles in other processes remap
+        self.map_files()
+        logger.info("compact: Kept %d records, %d bytes in use.", len(relocated), offset)
+
+    def finish_compaction(self):
+        """
+        Replaces the files with the ones a compaction left under their 'compacted' names. A compacted index
+        means both files were complete, the data file perhaps already moved in place; a compacted data file
+        alone is the leftover of a compaction interrupted before that, and is discarded.
+        """
+        data_path, compacted_index = self.compacted_paths
+        if not os.path.exists(compacted_index):
+            if os.path.exists(data_path):
+                os.remove(data_path)
+            return
+        if os.path.exists(data_path):
+            os.replace(data_path, self.path)
+        os.replace(compacted_index, self.index_path)
+        sync_directory(self.path)
+
+    def flush(self):
+        """
+        Forces every change made through the mappings to disk, the data before the index pointing at it.
+        """
+        self.data.flush()
+        self.index_map.flush()
+
+    def close(self):
+        """
+        Flushes and unmaps both files.
+        """
+        self.flush()
+        self.data.close()
+        self.index_map.close()
+
+
+if __name__ == '__main__':
+    test_path = 'mmap_store_test.dat'
+    store = MmapStore(test_path, capacity=8)
+
+    store['a'] = 10
+    assert store['a'] == 10 and 'a' in store, "Failed to set key 'a'"
+    store['a'] = (1, 'x')
+    assert store.get('a') == (1, 'x'), "Failed to update key 'a'"
+    assert store.get('b') is None and 'b' not in store, "Non-existent key 'b' should be missing"
+    assert store.pop('a') == (1, 'x') and store.pop('a', None) is None, "Failed to delete key 'a'"
+
+    # The index and the data file grow as needed
+    for i in range(100):
+        store[f'key {i}'] = 'v' * 50000
+    assert len(store) == 100 and store.capacity > 8, "Index did not grow"
+    assert store['key 42'] == 'v' * 50000, "Lost a value while growing"
+
+    # Another handle maps the same files without parsing them, and follows compactions
+    other = MmapStore(test_path)
+    for i in range(100):
+        store[f'key {i}'] = i
+    assert store.generation > 0, "Overwriting every value should have compacted the data file"
+    assert other['key 7'] == 7, "Other handle did not follow the compaction"
+    assert sorted(other.keys()) == sorted(f'key {i}' for i in range(100)), "Other handle sees the wrong keys"
+
+    # Keys equal as Python objects are one key, as in a dict
+    store[True] = 'true'
+    assert store[1] == store[1.0] == 'true' and store.pop((1.0,), None) is None, "Equal numbers were separate keys"
+    store[(1, 'x')] = 'tuple'
+    assert store.get((True, 'x')) == 'tuple' and store.pop((1.0, 'x')) == 'tuple', "Equal tuples did not match"
+    assert store.pop(1) == 'true' and frozenset() not in store, "Failed to delete key 1"
+
+    # A compaction interrupted once both files were written is completed by the next open
+    store['key 0'] = 'interrupted'
+    finish_compaction = store.finish_compaction
+    store.finish_compaction = lambda: None  # Crash before the files are moved in place
+    store.compact()
+    store.finish_compaction = finish_compaction
+    assert all(map(os.path.exists, store.compacted_paths)), "The compaction did not leave its files"
+    recovered = MmapStore(test_path)
+    assert recovered['key 0'] == 'interrupted' and len(recovered) == len(other.keys()), "Compaction was not completed"
+    assert not any(map(os.path.exists, store.compacted_paths)), "Compacted files were left behind"
+    store.map_files()
+
+    # A data file left by a compaction interrupted before its index was renamed is discarded
+    with open(store.compacted_paths[0], 'wb') as leftover:
+        leftover.write(b'partial')
+    recovered = MmapStore(test_path)
+    assert recovered['key 0'] == 'interrupted' and not os.path.exists(store.compacted_paths[0]), "Bad leftover"
+
+    # A bulk update resizes once and agrees with single sets, including keys repeated in the batch
+    store.update([(f'bulk {i}', i) for i in range(5000)] + [('key 7', 'updated'), ('bulk 1', 'again')])
+    assert len(store) == 5100, "Bulk update miscounted the keys"
+    assert store['bulk 4999'] == 4999 and store['bulk 1'] == 'again', "Bulk update lost a value"
+    assert other['key 7'] == 'updated', "Other handle did not see the bulk update"
+
+    other.close()
+    store.close()
+    os.remove(test_path)
+    os.remove(index_path(test_path))
+    print("All assertions passed.")
@@ -54,6 +54,7 @@ class ThreadingTest:
 
         for thread in self.threads_list:
             thread.join()
+        self.threads_list = []  # Start the next test with no finished workers to join
 
 
     def test_4(self):
@@ -75,6 +76,7 @@ class ThreadingTest:
 
         for thread in self.threads_list:
             thread.join()
+        self.threads_list = []  # Start the next test with no finished workers to join
 
 
     def test_5(self):
@@ -92,6 +94,7 @@ class ThreadingTest:
 
         for thread in self.threads_list:
             thread.join()
+        self.threads_list = []  # Start the next test with no finished workers to join
 
 
     def test_6(self):
@@ -120,6 +123,7 @@ class ThreadingTest:
 
         for thread in self.threads_list:
             thread.join()
+        self.threads_list = []  # Start the next test with no finished workers to join
 
 
     def test_7(self):
@@ -146,6 +150,7 @@ class ThreadingTest:
 
         for thread in self.threads_list:
             thread.join()
+        self.threads_list = []  # Start the next test with no finished workers to join
 
 
     def test_all(self):
@@ -57,6 +57,7 @@ class ProcessTest:
 
         for process in self.process_list:
             process.join()
+        self.process_list = []  # Start the next test with no finished workers to join
 
 
     def test_4(self):
@@ -77,6 +78,7 @@ class ProcessTest:
 
         for thread in self.process_list:
             thread.join()
+        self.process_list = []  # Start the next test with no finished workers to join
 
 
     def test_5(self):
@@ -94,6 +96,7 @@ class ProcessTest:
 
         for thread in self.process_list:
             thread.join()
+        self.process_list = []  # Start the next test with no finished workers to join
 
 
     def test_6(self):
@@ -120,6 +123,7 @@ class ProcessTest:
 
         for process in self.process_list:
             process.join()
+        self.process_list = []  # Start the next test with no finished workers to join
 
 
     def test_7(self):
@@ -145,6 +149,7 @@ class ProcessTest:
 
         for process in self.process_list:
             process.join()
+        self.process_list = []  # Start the next test with no finished workers to join
 
 
     def test_all(self):
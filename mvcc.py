@@ -0,0 +1,196 @@
+import threading
+
+from tracing import logger
+
+GC_INTERVAL = 64  # Commits between garbage collections of versions no reader can see any more
+DELETED = object()  # The value of a version that deletes its key
+
+
+class VersionStore:
+    def __init__(self, items=()):
+        """
+        Keeps the committed versions of every key so readers can read a consistent snapshot without locking
+        out writers. Each key maps to its newest version as a (version, value, older) chain of tuples that are
+        never modified: a commit links a new head in front, and garbage collection builds shorter chains, so a
+        reader walking a chain sees the same versions however writers and the collector move on.
+
+        Commits and collections must be serialized by the caller (SyncDatabase holds its write lock);
+        reads need no lock.
+
+        :param items: The committed (key, value) pairs to start from, as version 0.
+        :type items: iterable
+        """
+        self.chains = {key: (0, value, None) for key, value in items}
+        self.version = 0  # The newest version readers may see
+        self.snapshots = {}  # Snapshot version -> number of readers holding it
+        self.lock = threading.Lock()  # Guards self.snapshots only, it is never held while waiting
+        self.uncollected = set()  # Keys whose chain has more than one version
+        self.commits = 0
+
+    def visible(self, key, snapshot):
+        """
+        Finds the version of a key that a snapshot sees.
+
+        :return: The value, None if the key did not exist at the snapshot, or self if the chain holds only
+                 newer versions, which happens only when the versions the snapshot needed were collected.
+        """
+        entry = self.chains.get(key)
+        if entry is None:
+            return None
+        while entry[0] > snapshot:
+            entry = entry[2]
+            if entry is None:
+                return self
+        return None if entry[1] is DELETED else entry[1]
+
+    def get(self, key):
+        """
+        Reads the newest committed value of a key without registering a snapshot. If the collector removed
+        the version this read started from, the read simply starts again from a newer one.
+
+        :return: The value, or None if the key does not exist.
+        :rtype: any or None
+        """
+        while True:
+            snapshot = self.version
+            val = self.visible(key, snapshot)
+            if val is not self:
+                return val
+            if self.version == snapshot:
+                return None  # The key's only versions are being committed and are not visible yet
+
+    def begin(self):
+        """
+        Starts a snapshot of everything committed so far. Versions the snapshot sees are kept until end().
+
+        :return: The snapshot version.
+        :rtype: int
+        """
+        with self.lock:
+            snapshot = self.version
+            self.snapshots[snapshot] = self.snapshots.get(snapshot, 0) + 1
+        return snapshot
+
+    def end(self, snapshot):
+        """
+        Ends a snapshot started with begin().
+        """
+        with self.lock:
+            if self.snapshots[snapshot] == 1:
+                del self.snapshots[snapshot]
+            else:
+                self.snapshots[snapshot] -= 1
+
+    def read(self, key, snapshot):
+        """
+        Reads the value of a key as of a snapshot started with begin().
+
+        :return: The value, or None if the key did not exist at the snapshot.
+        :rtype: any or None
+        """
+        val = self.visible(key, snapshot)
+        return None if val is self else val
+
+    def commit(self, changes):
+        """
+        Publishes changes as one new version. Readers see all of them or none.
+
+        :param changes: (key, value) pairs, with the value DELETED for a delete.
+        :type changes: iterable
+        :return: The new version.
+        :rtype: int
+        """
+        version = self.version + 1
+        chains = self.chains
+        for key, val in changes:
+            older = chains.get(key)
+            chains[key] = (version, val, older)
+            if older is not None or val is DELETED:
+                self.uncollected.add(key)
+        self.version = version  # Readers starting from now see the new heads
+        self.commits += 1
+        if self.commits % GC_INTERVAL == 0:
+            self.collect()
+        return version
+
+    def collect(self):
+        """
+        Drops the versions no reader can see any more: for each key, everything older than its newest version
+        at or before the oldest snapshot still held. A key whose only remaining version is a delete is dropped
+        entirely.
+
+        :return: The number of versions dropped.
+        :rtype: int
+        """
+        with self.lock:
+            oldest = min(self.snapshots, default=self.version)
+        dropped = 0
+        chains = self.chains
+        for key in list(self.uncollected):
+            newer = []
+            entry = chains[key]
+            while entry is not None and entry[0] > oldest:
+                newer.append(entry)
+                entry = entry[2]
+            if entry is None:
+                continue  # Every version is newer than the oldest snapshot
+            if not newer and entry[1] is DELETED:
+                while entry is not None:
+                    dropped += 1
+                    entry = entry[2]
+                del chains[key]
+                self.uncollected.discard(key)
+                continue
+            if entry[2] is not None:
+                older = entry[2]
+                while older is not None:
+                    dropped += 1
+                    older = older[2]
+                chain = (entry[0], entry[1], None)
+                for entry in reversed(newer):
+                    chain = (entry[0], entry[1], chain)
+                chains[key] = chain  # Readers already on the old chain keep walking it
+            if not newer:
+                self.uncollected.discard(key)
+        if dropped:
+            logger.debug("collect: Dropped %d versions older than snapshot %d.", dropped, oldest)
+        return dropped
+
+    def stats(self):
+        """
+        Returns the current version, the snapshots held and the number of keys with old versions.
+
+        :rtype: dict
+        """
+        with self.lock:
+            snapshots = sum(self.snapshots.values())
+        return {'version': self.version, 'snapshots': snapshots, 'uncollected_keys': len(self.uncollected)}
+
+
+if __name__ == '__main__':
+    store = VersionStore({'a': 1}.items())
+    snapshot = store.begin()
+    store.commit([('a', 2), ('b', 3)])
+    store.commit([('a', DELETED)])
+    assert store.get('a') is None and store.get('b') == 3, "Reads did not see the newest commit"
+    assert store.read('a', snapshot) == 1 and store.read('b', snapshot) is None, "The snapshot saw a later commit"
+
+    # Versions the snapshot sees survive collection until it ends
+    store.collect()
+    assert store.read('a', snapshot) == 1, "Collection dropped a version a snapshot still sees"
+    store.end(snapshot)
+    assert store.collect() == 3, "Expected every version of the deleted key 'a' to go"
+    assert 'a' not in store.chains, "A deleted key kept its chain"
+    assert store.chains['b'] == (1, 3, None), "The newest version of 'b' was not kept alone"
+    assert store.stats() == {'version': 2, 'snapshots': 0, 'uncollected_keys': 0}, "Unexpected stats"
+
+    # Periodic collection keeps chains short while writers keep committing
+    for i in range(GC_INTERVAL * 4):
+        store.commit([('c', i)])
+    assert store.get('c') == GC_INTERVAL * 4 - 1, "Lost the newest version of 'c'"
+    length, entry = 0, store.chains['c']
+    while entry is not None:
+        length, entry = length + 1, entry[2]
+    assert length <= GC_INTERVAL, f"Chain of 'c' grew to {length} versions"
+
+    print("All assertions passed.")
@@ -0,0 +1,438 @@
+import os
+import tempfile
+import threading
+
+from tracing import logger
+
+if os.name == 'nt':
+    import win32file
+    import win32event
+else:
+    import fcntl
+
+LOCK_DIR = tempfile.gettempdir()  # Where POSIX named locks keep their lock files
+
+
+class Win32FileIO:
+    """
+    File I/O on top of win32file handles.
+    """
+
+    @staticmethod
+    def open(path):
+        """
+        Opens a file for reading and writing, creating it if it doesn't exist.
+
+        :param path: The file to open.
+        :type path: str
+        :return: The file handle.
+        :rtype: PyHANDLE
+        """
+        return win32file.CreateFile(
+            path,
+            win32file.GENERIC_WRITE | win32file.GENERIC_READ,
+            win32file.FILE_SHARE_READ | win32file.FILE_SHARE_WRITE,
+            None,
+            win32file.OPEN_ALWAYS,
+            0,
+            None)
+
+    @staticmethod
+    def seek(handle, offset, whence=os.SEEK_SET):
+        """
+        Moves the file pointer.
+
+        :return: The new position from the start of the file.
+        :rtype: int
+        """
+        method = {os.SEEK_SET: win32file.FILE_BEGIN, os.SEEK_CUR: win32file.FILE_CURRENT,
+                  os.SEEK_END: win32file.FILE_END}[whence]
+        return win32file.SetFilePointer(handle, offset, method)
+
+    @staticmethod
+    def read(handle, size):
+        """
+        Reads up to `size` bytes from the file pointer.
+
+        :return: The bytes read, b'' at end of file.
+        :rtype: bytes
+        """
+        result, data = win32file.ReadFile(handle, size)
+        return data if result == 0 else b''
+
+    @staticmethod
+    def write(handle, data):
+        """
+        Writes all of `data` at the file pointer.
+        """
+        win32file.WriteFile(handle, data)
+
+    @staticmethod
+    def truncate(handle):
+        """
+        Cuts the file off at the file pointer.
+        """
+        win32file.SetEndOfFile(handle)
+
+    @staticmethod
+    def sync(handle):
+        """
+        Forces written data to disk.
+        """
+        win32file.FlushFileBuffers(handle)
+
+    @staticmethod
+    def close(handle):
+        """
+        Closes the file handle.
+        """
+        win32file.CloseHandle(handle)
+
+
+class PosixFileIO:
+    """
+    File I/O on top of plain os file descriptors.
+    """
+
+    @staticmethod
+    def open(path):
+        """
+        Opens a file for reading and writing, creating it if it doesn't exist.
+
+        :param path: The file to open.
+        :type path: str
+        :return: The file descriptor.
+        :rtype: int
+        """
+        return os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+
+    @staticmethod
+    def seek(handle, offset, whence=os.SEEK_SET):
+        """
+        Moves the file pointer.
+
+        :return: The new position from the start of the file.
+        :rtype: int
+        """
+        return os.lseek(handle, offset, whence)
+
+    @staticmethod
+    def read(handle, size):
+        """
+        Reads up to `size` bytes from the file pointer.
+
+        :return: The bytes read, b'' at end of file.
+        :rtype: bytes
+        """
+        return os.read(handle, size)
+
+    @staticmethod
+    def write(handle, data):
+        """
+        Writes all of `data` at the file pointer, resuming after partial writes.
+        """
+        view = memoryview(data)
+        while view:
+            written = os.write(handle, view)
+            view = view[written:]
+
+    @staticmethod
+    def truncate(handle):
+        """
+        Cuts the file off at the file pointer.
+        """
+        os.ftruncate(handle, os.lseek(handle, 0, os.SEEK_CUR))
+
+    @staticmethod
+    def sync(handle):
+        """
+        Forces written data to disk.
+        """
+        os.fsync(handle)
+
+    @staticmethod
+    def close(handle):
+        """
+        Closes the file descriptor.
+        """
+        os.close(handle)
+
+
+class Win32Mutex:
+    def __init__(self, name=None):
+        """
+        A win32 mutex, shared system-wide under `name` or private to the process if name is None.
+        """
+        self.handle = win32event.CreateMutex(None, False, None if name is None else f"Global\\{name}")
+        if not self.handle:
+            raise Exception(f"Failed to create or open the mutex {name}.")
+
+    def acquire(self):
+        """
+        Blocks until the lock is taken.
+        """
+        win32event.WaitForSingleObject(self.handle, win32event.INFINITE)
+
+    def release(self):
+        """
+        Releases the lock.
+        """
+        win32event.ReleaseMutex(self.handle)
+
+
+class Win32Semaphore:
+    def __init__(self, count, name=None):
+        """
+        A win32 counting semaphore, shared system-wide under `name` or private to the process if name is None.
+        """
+        self.handle = win32event.CreateSemaphore(None, count, count, None if name is None else f"Global\\{name}")
+        if not self.handle:
+            raise Exception(f"Failed to create or open the semaphore {name}.")
+
+    def acquire(self):
+        """
+        Blocks until a unit of the semaphore is taken.
+        """
+        win32event.WaitForSingleObject(self.handle, win32event.INFINITE)
+
+    def release(self, count=1):
+        """
+        Returns `count` units to the semaphore.
+        """
+        win32event.ReleaseSemaphore(self.handle, count)
+
+
+class FlockMutex:
+    def __init__(self, name):
+        """
+        A named mutex shared by every thread and process on the host, implemented as an exclusive
+        flock() on a lock file. Each acquire opens its own descriptor, because flock() locks belong
+        to the open file description and would otherwise be shared by threads and forked children.
+
+        :param name: The lock name, used as the lock file name.
+        :type name: str
+        """
+        self.path = os.path.join(LOCK_DIR, f'{name}.lock')
+        self.held = threading.local()
+
+    def acquire(self):
+        """
+        Blocks until the lock is taken.
+        """
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        self.held.fd = fd
+
+    def release(self):
+        """
+        Releases the lock.
+        """
+        fd = self.held.fd
+        self.held.fd = None
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+class FlockSemaphore:
+    def __init__(self, count, name):
+        """
+        A named counting semaphore shared by every thread and process on the host. Each of the
+        `count` units is a lock file; acquiring takes a free one with a non-blocking flock(),
+        or blocks on one of them when all are taken.
+
+        :param count: The number of units.
+        :type count: int
+        :param name: The semaphore name, used as a prefix for the lock file names.
+        :type name: str
+        """
+        self.paths = [os.path.join(LOCK_DIR, f'{name}.{slot}.lock') for slot in range(count)]
+        self.held = threading.local()
+
+    def held_slots(self):
+        """
+        Returns the (path, descriptor) of each unit held by the calling thread.
+        """
+        if not hasattr(self.held, 'slots'):
+            self.held.slots = []
+        return self.held.slots
+
+    def acquire(self):
+        """
+        Blocks until a unit of the semaphore is taken.
+        """
+        start = threading.get_ident() % len(self.paths)  # Spread contenders over the slots
+        order = self.paths[start:] + self.paths[:start]
+        held = self.held_slots()
+        for path in order:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            held.append((path, fd))
+            return
+        # Every unit is taken: wait for one this thread does not hold itself, or it would wait forever
+        mine = {path for path, _ in held}
+        path = next((path for path in order if path not in mine), order[0])
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        held.append((path, fd))
+
+    def release(self, count=1):
+        """
+        Returns `count` units to the semaphore.
+        """
+        held = self.held_slots()
+        for _ in range(count):
+            _, fd = held.pop()
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+
+class ThreadSemaphore:
+    def __init__(self, count):
+        """
+        A counting semaphore private to the process.
+        """
+        self.semaphore = threading.Semaphore(count)
+
+    def acquire(self):
+        """
+        Blocks until a unit of the semaphore is taken.
+        """
+        self.semaphore.acquire()
+
+    def release(self, count=1):
+        """
+        Returns `count` units to the semaphore.
+        """
+        self.semaphore.release(count)
+
+
+class Win32Backend:
+    name = 'win32'
+    file_io = Win32FileIO
+
+    @staticmethod
+    def create_mutex(name=None):
+        """
+        Creates a mutex, private to the process if name is None.
+        """
+        return Win32Mutex(name)
+
+    @staticmethod
+    def create_semaphore(count, name=None):
+        """
+        Creates a counting semaphore, private to the process if name is None.
+        """
+        return Win32Semaphore(count, name)
+
+
+class PosixBackend:
+    name = 'posix'
+    file_io = PosixFileIO
+
+    @staticmethod
+    def create_mutex(name=None):
+        """
+        Creates a mutex, private to the process if name is None.
+        """
+        return threading.Lock() if name is None else FlockMutex(name)
+
+    @staticmethod
+    def create_semaphore(count, name=None):
+        """
+        Creates a counting semaphore, private to the process if name is None.
+        """
+        return ThreadSemaphore(count) if name is None else FlockSemaphore(count, name)
+
+
+BACKENDS = {'win32': Win32Backend, 'posix': PosixBackend}
+
+
+def get_backend(name=None):
+    """
+    Returns the lock and file I/O backend to use.
+
+    :param name: 'win32' or 'posix', or None for the native backend of the running platform.
+    :type name: str or None
+    :return: The backend class.
+    :rtype: type
+    """
+    if name is None:
+        name = 'win32' if os.name == 'nt' else 'posix'
+    if name not in BACKENDS:
+        logger.error("Unknown backend %s.", name)
+        raise ValueError(f"Backend must be one of {tuple(BACKENDS)}.")
+    return BACKENDS[name]
+
+
+if __name__ == '__main__':
+    import time
+
+    backend = get_backend()
+    io = backend.file_io
+
+    # File I/O round trip
+    test_path = 'platform_backend_test.bin'
+    handle = io.open(test_path)
+    io.write(handle, b'hello world')
+    io.seek(handle, 5)
+    io.truncate(handle)
+    io.seek(handle, 0, os.SEEK_END)
+    io.write(handle, b'!')
+    io.sync(handle)
+    io.seek(handle, 0)
+    assert io.read(handle, 1024) == b'hello!', "File I/O round trip failed"
+    assert io.read(handle, 1024) == b'', "Expected end of file"
+    io.close(handle)
+    os.remove(test_path)
+
+    # Named primitives exclude each other across threads
+    mutex = backend.create_mutex('platform_backend_test_mutex')
+    semaphore = backend.create_semaphore(2, 'platform_backend_test_semaphore')
+    inside = []
+
+    def worker():
+        semaphore.acquire()
+        mutex.acquire()
+        inside.append(1)
+        assert len(inside) == 1, "Mutex let two threads in"
+        inside.pop()
+        mutex.release()
+        semaphore.release()
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    semaphore.acquire()
+    semaphore.acquire()
+    semaphore.release(2)
+
+    # Taking every unit while another thread holds one waits for that thread, not for a unit already taken
+    taken, done = threading.Event(), threading.Event()
+
+    def holder():
+        semaphore.acquire()
+        taken.set()
+        time.sleep(0.1)
+        semaphore.release()
+
+    def take_all():
+        semaphore.acquire()
+        semaphore.acquire()
+        semaphore.release(2)
+        done.set()
+
+    semaphore.acquire()  # So that the holder takes a unit other than the first one tried
+    threading.Thread(target=holder).start()
+    taken.wait()
+    semaphore.release()
+    threading.Thread(target=take_all, daemon=True).start()
+    assert done.wait(5), "Taking every unit deadlocked on a unit the thread already held"
+
+    print("All assertions passed.")
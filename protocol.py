@@ -0,0 +1,93 @@
+import struct
+
+from serialization import encode_value, decode_value, INCOMPLETE
+
+# Every frame: payload length, request id, opcode (requests) or status (responses); then the payload,
+# which is one value in the binary encoding of serialization.py (the argument tuple, or the result).
+# Payloads never contain pickled values, which would let any peer run code on the other end: keys and
+# values sent over a socket must be None, bools, ints, floats, strings, bytes, lists, tuples or dicts.
+HEADER = struct.Struct('<IIB')
+MAX_PAYLOAD = 64 * 1024 * 1024
+
+GET, SET, DELETE, GET_MANY, SET_MANY, DELETE_MANY, PING, FEED_SNAPSHOT, FEED_READ = range(1, 10)
+OK, ERROR = 0, 1
+
+
+class RemoteError(Exception):
+    """
+    Raised by the client when the server failed to execute a request.
+    """
+
+
+def encode_frame(request_id, code, payload):
+    """
+    Encodes one request or response.
+
+    :param request_id: Matches a response to its request.
+    :type request_id: int
+    :param code: The opcode of a request or the status of a response.
+    :type code: int
+    :param payload: The arguments or the result.
+    :type payload: any
+    :return: The frame bytes.
+    :rtype: bytearray
+    :raises TypeError: If the payload contains a type the protocol does not carry.
+    """
+    out = bytearray(HEADER.size)
+    encode_value(payload, out, allow_pickle=False)
+    HEADER.pack_into(out, 0, len(out) - HEADER.size, request_id, code)
+    return out
+
+
+def decode_frames(buffer):
+    """
+    Decodes every complete frame at the start of a buffer.
+
+    :param buffer: Received bytes, starting on a frame boundary.
+    :type buffer: bytearray
+    :return: The (request id, code, payload) of each complete frame, and the number of bytes they used.
+    :rtype: tuple
+    :raises ValueError: If a frame is malformed or contains a pickled value.
+    """
+    frames = []
+    pos = 0
+    while len(buffer) - pos >= HEADER.size:
+        length, request_id, code = HEADER.unpack_from(buffer, pos)
+        if length > MAX_PAYLOAD:
+            raise ValueError(f"Frame of {length} bytes exceeds the limit.")
+        end = pos + HEADER.size + length
+        if end > len(buffer):
+            break
+        try:
+            payload, payload_end = decode_value(bytes(buffer[pos + HEADER.size:end]), 0, allow_pickle=False)
+        except (*INCOMPLETE, TypeError) as error:  # Truncated inside the frame, or an unhashable dict key
+            raise ValueError(f"Malformed frame payload: {error}") from None
+        if payload_end != length:
+            raise ValueError("Frame payload does not match its length.")
+        frames.append((request_id, code, payload))
+        pos = end
+    return frames, pos
+
+
+if __name__ == '__main__':
+    stream = encode_frame(1, SET, (10, 'a')) + encode_frame(2, GET, ('a',))
+    frames, used = decode_frames(stream + stream[:3])
+    assert frames == [(1, SET, (10, 'a')), (2, GET, ('a',))], "Frames did not round-trip"
+    assert used == len(stream), "A partial frame was consumed"
+
+    # Pickled payloads are neither sent nor accepted
+    try:
+        encode_frame(3, SET, ({1, 2}, 'a'))
+        raise AssertionError("A set was pickled into a frame")
+    except TypeError:
+        pass
+    import pickle
+    from serialization import PICKLED, LENGTH
+    data = pickle.dumps(set())
+    forged = HEADER.pack(len(data) + 5, 4, PING) + bytes([PICKLED]) + LENGTH.pack(len(data)) + data
+    try:
+        decode_frames(bytearray(forged))
+        raise AssertionError("A pickled payload was decoded")
+    except ValueError:
+        pass
+    print("All assertions passed.")
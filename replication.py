@@ -0,0 +1,261 @@
+import threading
+import time
+
+from change_feed import FEED_BATCH, POLL_TIMEOUT
+from dict_database import DictDatabase
+from metrics import Histogram, metrics
+from protocol import RemoteError
+from rwlock import ReadWriteLock
+from tracing import logger, tracer
+
+RETRY_DELAY = 1.0  # Seconds between attempts while the primary is unreachable
+
+
+class Replica:
+    def __init__(self, source, database=None, poll_timeout=POLL_TIMEOUT, batch=FEED_BATCH):
+        """
+        A read-only copy of a primary SyncDatabase, kept up to date from its change feed by a background
+        thread. The replica loads a snapshot taken together with a feed sequence, then applies every batch
+        committed after it, so reads see the primary's commits in order, a little later. Reads take this
+        replica's own lock, never the primary's, so they spread across as many processes as there are replicas.
+
+        Key deadlines are not carried by the feed: a key set with a TTL stays readable on the replica after it
+        expires on the primary, until the primary deletes it (by its reaper, or reap_expired()) and the delete
+        arrives.
+
+        :param source: The primary: a SyncDatabase in this process, or a DatabaseClient of a DatabaseServer
+                       in another process or on another host. Its change feed is enabled on first use.
+        :type source: SyncDatabase or DatabaseClient
+        :param database: The local copy, by default an in-memory DictDatabase. Its contents are replaced.
+        :type database: DictDatabase or None
+        :param poll_timeout: Seconds each read of the feed waits for new changes.
+        :type poll_timeout: float
+        :param batch: The most change batches applied per read.
+        :type batch: int
+        """
+        self.source = source
+        self.database = database if database is not None else DictDatabase()
+        self.poll_timeout = poll_timeout
+        self.batch = batch
+        self.lock = ReadWriteLock('threading')
+        self.sequence = 0  # Of the last applied batch
+        self.epoch = None  # Of the feed the sequence belongs to
+        self.applied = threading.Condition()
+        self.lag = Histogram()  # Nanoseconds from the primary's commit to applying it here
+        self.resyncs = 0
+        self.stopped = threading.Event()
+        self.synchronize()
+        self.thread = threading.Thread(target=self.run, name='replica', daemon=True)
+        self.thread.start()
+        logger.info("Replica started at sequence %d.", self.sequence)
+
+    def synchronize(self):
+        """
+        Replaces the local copy with a snapshot of the primary.
+        """
+        epoch, sequence, items = self.source.feed_snapshot()
+        self.lock.acquire_write()
+        try:
+            self.database.delete_many(list(self.database.dict.keys()))
+            self.database.set_many(items)
+        finally:
+            self.lock.release_write()
+        with self.applied:
+            self.epoch, self.sequence = epoch, sequence
+            self.applied.notify_all()
+
+    def run(self):
+        """
+        Background loop following the change feed.
+        """
+        resync = False
+        while not self.stopped.is_set():
+            try:
+                if resync:
+                    self.resyncs += 1
+                    logger.info("run: Replica at sequence %d resynchronizing.", self.sequence)
+                    self.synchronize()
+                    resync = False
+                    continue
+                epoch, batches = self.source.read_feed(self.sequence, self.poll_timeout, self.batch)
+                if batches is None or epoch != self.epoch:
+                    resync = True  # Too far behind, or the primary restarted: start again from a snapshot
+                elif batches:
+                    self.apply(batches)
+            except (OSError, RemoteError) as error:
+                logger.error("run: Failed to read the change feed: %s", error)
+                self.stopped.wait(RETRY_DELAY)
+            except Exception as error:
+                # The local copy may now differ from the primary, e.g. after a batch failed halfway
+                logger.error("run: Replica failed, resynchronizing: %r", error)
+                resync = True
+                self.stopped.wait(RETRY_DELAY)
+
+    def apply(self, batches):
+        """
+        Applies change batches in order under a single write lock acquisition.
+
+        :param batches: (sequence, commit time in ns, records) batches following this replica's sequence.
+        :type batches: list
+        """
+        database = self.database
+        self.lock.acquire_write()
+        try:
+            for _, _, records in batches:
+                for record in records:
+                    if record[0] == 's':
+                        database.set_value(record[2], record[1])
+                    else:
+                        database.delete_value(record[1])
+        finally:
+            self.lock.release_write()
+        now = time.time_ns()
+        for _, committed, _ in batches:
+            self.lag.record(now - committed)
+            if metrics.enabled:
+                metrics.record('replication_lag', now - committed)
+        with self.applied:
+            self.sequence = batches[-1][0]
+            self.applied.notify_all()
+        if tracer.enabled:
+            logger.info("apply: Replica applied %d batches up to sequence %d.", len(batches), self.sequence)
+
+    def wait_for(self, sequence, timeout=None):
+        """
+        Waits until the replica has applied the batch of a sequence, to read one's own writes.
+
+        :return: True if it has, False if the timeout expired first.
+        :rtype: bool
+        """
+        with self.applied:
+            return self.applied.wait_for(lambda: self.sequence >= sequence, timeout)
+
+    def get_value(self, key):
+        """
+        Reads a value from the local copy.
+
+        :return: The value associated with the key if it exists, otherwise None.
+        :rtype: any or None
+        """
+        self.lock.acquire_read()
+        try:
+            return self.database.get_value(key)
+        finally:
+            self.lock.release_read()
+
+    def get_many(self, keys):
+        """
+        Reads many values from the local copy, consistent with each other.
+
+        :return: For each key, its value if it exists, otherwise None.
+        :rtype: dict
+        """
+        self.lock.acquire_read()
+        try:
+            return self.database.get_many(keys)
+        finally:
+            self.lock.release_read()
+
+    def scan(self, start=None, stop=None, prefix=None, limit=None):
+        """
+        Returns key-value pairs of the local copy in key order, see DictDatabase.scan().
+        """
+        self.lock.acquire_write()  # The first scan builds the index
+        try:
+            self.database.enable_indexes()
+        finally:
+            self.lock.release_write()
+        self.lock.acquire_read()
+        try:
+            return self.database.scan(start, stop, prefix, limit)
+        finally:
+            self.lock.release_read()
+
+    def stats(self):
+        """
+        Reports how far the replica has got.
+
+        :return: The applied sequence, the number of resynchronizations, and the lag histogram in nanoseconds.
+        :rtype: dict
+        """
+        return {'sequence': self.sequence, 'resyncs': self.resyncs, 'lag': self.lag.snapshot()}
+
+    def close(self):
+        """
+        Stops following the feed, after the read in progress returns.
+        """
+        self.stopped.set()
+        self.thread.join()
+
+
+if __name__ == '__main__':
+    import os
+    from sync_database import SyncDatabase
+    from database_client import DatabaseClient
+    from database_server import DatabaseServer
+
+    primary = SyncDatabase('threading', persistence='log', file_path='replication_test.pkl',
+                           log_path='replication_test.wal')
+    primary.set_many({'a': 1, 'b': 2})
+    replica = Replica(primary, poll_timeout=0.1)
+    assert replica.get_many(['a', 'b']) == {'a': 1, 'b': 2}, "The snapshot was not loaded"
+    primary.set_value(3, 'c')
+    primary.delete_value('a')
+    primary.transact(lambda transaction: transaction.write('b', transaction.read('b') + 10))
+    assert replica.wait_for(primary.feed.sequence, timeout=5), "The replica did not catch up"
+    assert replica.get_many(['a', 'b', 'c']) == {'a': None, 'b': 12, 'c': 3}, "Changes applied out of order"
+    assert replica.stats()['lag']['count'] == 3, "Lag was not measured for every batch"
+
+    # A replica too far behind resynchronizes from a snapshot
+    replica.close()
+    primary.set_value(4, 'd')
+    primary.feed.entries.clear()  # As if more batches than the feed keeps were committed meanwhile
+    replica.thread = threading.Thread(target=replica.run, daemon=True)
+    replica.stopped.clear()
+    replica.thread.start()
+    assert replica.wait_for(primary.feed.sequence, timeout=5) and replica.get_value('d') == 4, "Resync failed"
+    assert replica.resyncs == 1, "Expected one resynchronization"
+    replica.close()
+
+    # A replica of a restarted primary resynchronizes, even once the new feed passed its sequence
+    from change_feed import ChangeFeed
+    primary.feed = ChangeFeed()
+    for i in range(replica.sequence + 1):
+        primary.set_value(i, f'restart {i}')
+    replica.thread = threading.Thread(target=replica.run, daemon=True)
+    replica.stopped.clear()
+    replica.thread.start()
+    assert replica.wait_for(primary.feed.sequence, timeout=5) and replica.resyncs == 2, "The restart was missed"
+    assert replica.get_value('restart 0') == 0, "Batches of the new feed were applied to the old copy"
+    replica.close()
+
+    # A replica that fails to apply a change resynchronizes instead of stopping
+    failing = Replica(primary, poll_timeout=0.1)
+    set_value = failing.database.set_value
+
+    def fail_once(val, key):
+        failing.database.set_value = set_value
+        raise ValueError("Injected failure")
+
+    failing.database.set_value = fail_once
+    primary.set_value(5, 'e')
+    assert failing.wait_for(primary.feed.sequence, timeout=5) and failing.get_value('e') == 5, "The change was lost"
+    assert failing.resyncs == 1 and failing.thread.is_alive(), "The replica did not recover"
+    failing.close()
+
+    # Over a socket, from another process or host
+    server = DatabaseServer(primary, ('127.0.0.1', 0))
+    server.start()
+    remote = Replica(DatabaseClient(server.address), poll_timeout=0.1)
+    primary.set_many({f'key {i}': i for i in range(100)})
+    assert remote.wait_for(primary.feed.sequence, timeout=5), "The remote replica did not catch up"
+    assert remote.get_value('key 99') == 99 and remote.get_value('a') is None, "Wrong remote replica contents"
+    assert [key for key, _ in remote.scan(prefix='key 9')] == ['key 9'] + [f'key {i}' for i in range(90, 100)]
+    remote.close()
+    server.shutdown()
+    primary.io.close(primary.handle)
+    primary.io.close(primary.log_handle)
+    os.remove('replication_test.pkl')
+    os.remove('replication_test.wal')
+
+    print("All assertions passed.")
@@ -0,0 +1,120 @@
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+
+from database_client import DatabaseClient
+from database_server import DatabaseServer
+from replication import Replica
+from sync_database import SyncDatabase
+
+DURATION = 3.0  # Seconds of reading per measurement
+KEYS = 10000
+WRITE_RATE = 500  # Sets per second on the primary during every measurement
+REPLICA_COUNTS = [1, 2, 4, 8]
+
+
+def serve(address, ready, stop):
+    """
+    Runs the primary in a separate process, with a writer thread committing WRITE_RATE sets per second.
+    """
+    paths = dict(file_path=f'replication_benchmark_{os.getpid()}.pkl',
+                 log_path=f'replication_benchmark_{os.getpid()}.wal')
+    database = SyncDatabase('threading', persistence='log', **paths)
+    database.set_many({f'key {i}': 'x' * 100 for i in range(KEYS)})
+    server = DatabaseServer(database, address)
+    server.start()
+
+    def write():
+        rng = random.Random(0)
+        while not stop.wait(1 / WRITE_RATE):
+            database.set_value('y' * 100, f'key {rng.randrange(KEYS)}')
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    ready.put(server.address)
+    stop.wait()
+    writer.join()
+    server.shutdown()
+    for path in paths.values():
+        os.remove(path)
+
+
+def read_loop(get_value, seed, duration):
+    """
+    Reads random keys for `duration` seconds.
+
+    :return: The number of reads.
+    :rtype: int
+    """
+    rng = random.Random(seed)
+    reads = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            get_value(f'key {rng.randrange(KEYS)}')
+        reads += 100
+    return reads
+
+
+def primary_reader(address, seed, start, results):
+    """
+    Reads from the primary over a socket, as every reader had to without replicas.
+    """
+    client = DatabaseClient(address, pool_size=1)
+    start.wait()
+    results.put((read_loop(client.get_value, seed, DURATION), None))
+    client.close()
+
+
+def replica_reader(address, seed, start, results):
+    """
+    Follows the primary with a replica in this process and reads from it.
+    """
+    replica = Replica(DatabaseClient(address, pool_size=1), poll_timeout=0.2)
+    start.wait()
+    reads = read_loop(replica.get_value, seed, DURATION)
+    replica.close()
+    results.put((reads, replica.stats()))
+
+
+def measure(address, target, count):
+    """
+    Runs `count` reader processes at once.
+
+    :return: Total reads per second, and the stats of each replica (None when reading from the primary).
+    :rtype: tuple
+    """
+    start, results = multiprocessing.Event(), multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=target, args=(address, seed, start, results))
+                 for seed in range(count)]
+    for process in processes:
+        process.start()
+    time.sleep(0.5 + 0.2 * count)  # Let every replica load its snapshot before the clock starts
+    start.set()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return sum(reads for reads, _ in outcomes) / DURATION, [stats for _, stats in outcomes]
+
+
+if __name__ == '__main__':
+    counts = [int(arg) for arg in sys.argv[1:]] or REPLICA_COUNTS
+    print(f'{KEYS} keys, {WRITE_RATE} writes/s on the primary, {DURATION:.0f} s of reads, {os.cpu_count()} CPUs')
+    ready, stop = multiprocessing.Queue(), multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(('127.0.0.1', 0), ready, stop))
+    server.start()
+    address = ready.get()
+    for count in counts:
+        primary_rate, _ = measure(address, primary_reader, count)
+        replica_rate, stats = measure(address, replica_reader, count)
+        lags = [replica['lag'] for replica in stats if replica['lag']['count']]
+        p50 = max(lag['p50'] for lag in lags) / 1e6 if lags else float('nan')
+        p99 = max(lag['p99'] for lag in lags) / 1e6 if lags else float('nan')
+        worst = max(lag['max'] for lag in lags) / 1e6 if lags else float('nan')
+        print(f'{count} readers: primary {primary_rate:9.0f} reads/s, replicas {replica_rate:9.0f} reads/s '
+              f'({replica_rate / primary_rate:5.1f}x); lag p50 {p50:6.2f} ms, p99 {p99:6.2f} ms, max {worst:6.2f} ms')
+    stop.set()
+    server.join()
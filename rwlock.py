@@ -0,0 +1,195 @@
+import multiprocessing
+import threading
+
+from tracing import logger
+
+READERS = 0  # Readers currently holding the lock
+WAITING_WRITERS = 1  # Writers blocked in acquire_write
+WRITER = 2  # 1 while a writer holds the lock
+
+
+class ReadWriteLock:
+    def __init__(self, mode='threading', prefer_writers=True, max_readers=None):
+        """
+        A reader-writer lock built from a reader counter and a condition variable.
+        A writer waits once for the readers to drain instead of collecting every reader slot, so acquiring
+        for writing costs the same no matter how many readers are allowed.
+
+        :param mode: 'threading' to share the lock between threads, 'multiprocessing' to also share it
+                     with child processes (the counters then live in shared memory). The lock is anonymous:
+                     only processes started by its creator afterwards share it, unlike the named objects of
+                     SemaphoreReadWriteLock, which synchronize unrelated processes too.
+        :type mode: str
+        :param prefer_writers: If True, new readers queue behind a waiting writer, so writers wait at most
+                               for the readers already inside.
+        :type prefer_writers: bool
+        :param max_readers: Maximum number of simultaneous readers, or None for no limit.
+        :type max_readers: int or None
+        """
+        if mode == 'threading':
+            self.condition = threading.Condition(threading.Lock())
+            self.state = [0, 0, 0]
+        elif mode == 'multiprocessing':
+            self.condition = multiprocessing.Condition(multiprocessing.Lock())
+            self.state = multiprocessing.RawArray('i', 3)
+        else:
+            logger.error("Invalid mode specified.")
+            raise ValueError("Mode must be either 'threading' or 'multiprocessing'.")
+        self.prefer_writers = prefer_writers
+        self.max_readers = max_readers
+
+    def acquire_read(self):
+        """
+        Blocks until shared read access is granted.
+        """
+        state = self.state
+        with self.condition:
+            while (state[WRITER]
+                   or (self.prefer_writers and state[WAITING_WRITERS])
+                   or (self.max_readers is not None and state[READERS] >= self.max_readers)):
+                self.condition.wait()
+            state[READERS] += 1
+
+    def release_read(self):
+        """
+        Ends shared read access, waking waiting writers when the last reader leaves.
+        """
+        state = self.state
+        with self.condition:
+            state[READERS] -= 1
+            if state[READERS] == 0 or self.max_readers is not None:
+                self.condition.notify_all()
+
+    def acquire_write(self):
+        """
+        Blocks until exclusive write access is granted.
+        """
+        state = self.state
+        with self.condition:
+            state[WAITING_WRITERS] += 1
+            while state[WRITER] or state[READERS]:
+                self.condition.wait()
+            state[WAITING_WRITERS] -= 1
+            state[WRITER] = 1
+
+    def release_write(self):
+        """
+        Ends exclusive write access.
+        """
+        with self.condition:
+            self.state[WRITER] = 0
+            self.condition.notify_all()
+
+
+class SemaphoreReadWriteLock:
+    def __init__(self, backend, mode='threading', max_readers=10, name=None):
+        """
+        The original reader-writer scheme: a reader takes one unit of a semaphore of `max_readers` units,
+        and a writer takes a mutex and then every unit, one at a time.
+
+        :param backend: The platform backend providing the mutex and semaphore.
+        :type backend: type
+        :param mode: 'threading' for process-private objects, 'multiprocessing' for named system-wide objects.
+        :type mode: str
+        :param max_readers: Number of semaphore units, which is also the maximum number of simultaneous readers.
+        :type max_readers: int
+        :param name: In multiprocessing mode, the prefix of the system-wide object names, so that separate
+                     databases use separate locks, or None for the original shared names.
+        :type name: str or None
+        """
+        if mode == 'threading':
+            self.sem_lock = backend.create_mutex()
+            self.sem = backend.create_semaphore(max_readers)
+        elif mode == 'multiprocessing':
+            mutex_name, semaphore_name = ("MyGlobalMutex", "MyGlobalSemaphore") if name is None \
+                else (f"{name}.mutex", f"{name}.semaphore")
+            self.sem_lock = backend.create_mutex(mutex_name)
+            self.sem = backend.create_semaphore(max_readers, semaphore_name)
+        else:
+            logger.error("Invalid mode specified.")
+            raise ValueError("Mode must be either 'threading' or 'multiprocessing'.")
+        self.max_readers = max_readers
+
+    def acquire_read(self):
+        """
+        Takes one semaphore unit.
+        """
+        self.sem.acquire()
+
+    def release_read(self):
+        """
+        Returns one semaphore unit.
+        """
+        self.sem.release(1)
+
+    def acquire_write(self):
+        """
+        Takes the mutex and then all semaphore units.
+        """
+        self.sem_lock.acquire()
+        for _ in range(self.max_readers):
+            self.sem.acquire()
+
+    def release_write(self):
+        """
+        Returns all semaphore units and the mutex.
+        """
+        for _ in range(self.max_readers):
+            self.sem.release(1)
+        self.sem_lock.release()
+
+
+if __name__ == '__main__':
+    import time
+
+    lock = ReadWriteLock()
+    log = []
+
+    def reader():
+        lock.acquire_read()
+        log.append('read start')
+        time.sleep(0.05)
+        log.append('read end')
+        lock.release_read()
+
+    def writer():
+        lock.acquire_write()
+        log.append('write start')
+        time.sleep(0.01)
+        log.append('write end')
+        lock.release_write()
+
+    # Readers share the lock
+    threads = [threading.Thread(target=reader) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert log[:3] == ['read start'] * 3, "Readers did not run concurrently"
+
+    # A waiting writer goes before readers that arrive after it
+    log.clear()
+    first_reader = threading.Thread(target=reader)
+    first_reader.start()
+    time.sleep(0.01)
+    waiting_writer = threading.Thread(target=writer)
+    waiting_writer.start()
+    time.sleep(0.01)
+    late_reader = threading.Thread(target=reader)
+    late_reader.start()
+    for thread in (first_reader, waiting_writer, late_reader):
+        thread.join()
+    assert log == ['read start', 'read end', 'write start', 'write end', 'read start', 'read end'], \
+        f"Writer preference violated: {log}"
+
+    # The reader limit is enforced
+    limited = ReadWriteLock(max_readers=1)
+    limited.acquire_read()
+    blocked = threading.Thread(target=lambda: (limited.acquire_read(), limited.release_read()))
+    blocked.start()
+    time.sleep(0.05)
+    assert blocked.is_alive(), "Reader limit was not enforced"
+    limited.release_read()
+    blocked.join()
+
+    print("All assertions passed.")
@@ -0,0 +1,76 @@
+import sys
+import threading
+import time
+
+from platform_backend import get_backend
+from rwlock import ReadWriteLock, SemaphoreReadWriteLock
+from sync_database import MAX_READERS
+
+DURATION = 2.0  # Seconds per scheme
+READER_THREADS = 8
+WRITER_THREADS = 2
+READ_HOLD = 0.0001  # Seconds a reader keeps the lock, standing in for a dict lookup
+WRITE_HOLD = 0.0005  # Seconds a writer keeps the lock, standing in for a save
+WRITE_PAUSE = 0.01  # Seconds a writer waits between writes
+
+
+def percentile(samples, fraction):
+    """
+    Returns the value below which `fraction` of the sorted samples fall.
+    """
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+def run_scheme(lock, duration):
+    """
+    Runs a steady stream of readers against a few writers and measures how long writers wait.
+
+    :return: Reader and writer operation counts and the sorted writer wait times in seconds.
+    :rtype: tuple
+    """
+    stop = threading.Event()
+    reads = [0] * READER_THREADS
+    write_waits = []
+
+    def reader(index):
+        while not stop.is_set():
+            lock.acquire_read()
+            time.sleep(READ_HOLD)
+            lock.release_read()
+            reads[index] += 1
+
+    def writer():
+        while not stop.is_set():
+            start = time.perf_counter()
+            lock.acquire_write()
+            write_waits.append(time.perf_counter() - start)
+            time.sleep(WRITE_HOLD)
+            lock.release_write()
+            time.sleep(WRITE_PAUSE)
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(READER_THREADS)]
+    threads += [threading.Thread(target=writer) for _ in range(WRITER_THREADS)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(reads), len(write_waits), sorted(write_waits)
+
+
+if __name__ == '__main__':
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else DURATION
+    schemes = {
+        'semaphores': SemaphoreReadWriteLock(get_backend(), 'threading', MAX_READERS),
+        'rwlock (fair)': ReadWriteLock('threading', prefer_writers=False, max_readers=MAX_READERS),
+        'rwlock (writer preference)': ReadWriteLock('threading', prefer_writers=True, max_readers=MAX_READERS),
+    }
+    print(f'{READER_THREADS} readers, {WRITER_THREADS} writers, {duration:.1f} s per scheme')
+    for name, lock in schemes.items():
+        reads, writes, waits = run_scheme(lock, duration)
+        print(f'{name:>27}: {reads / duration:9.0f} reads/s {writes / duration:7.0f} writes/s  '
+              f'writer wait p50 {percentile(waits, 0.5) * 1e6:8.0f} us  '
+              f'p99 {percentile(waits, 0.99) * 1e6:8.0f} us  max {percentile(waits, 1.0) * 1e6:8.0f} us')
@@ -0,0 +1,65 @@
+import sys
+import time
+
+from dict_database import DictDatabase
+
+KEY_COUNT = 200000
+REPEATS = 20
+PREFIXES = ['user 019999', 'user 01999', 'user 0199', 'user 019']  # 10, 100, 1,000 and 10,000 keys
+SCORE_RANGES = [(50, 51), (50, 60), (0, 100)]  # 0.1%, 1% and 10% of the keys
+
+
+def timed(function, repeats=REPEATS):
+    """
+    Returns the result of a call and the mean seconds per call.
+    """
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = function()
+    return result, (time.perf_counter() - start) / repeats
+
+
+def filter_prefix(db, prefix):
+    """
+    Finds keys the only way an unindexed dict allows: testing every key, then sorting the matches.
+    """
+    return sorted((key, val) for key, val in db.dict.items() if key.startswith(prefix))
+
+
+def filter_scores(db, start, stop):
+    """
+    Finds values in a range by testing every value.
+    """
+    return [(key, val) for key, val in db.dict.items() if start <= val['score'] < stop]
+
+
+if __name__ == '__main__':
+    key_count = int(sys.argv[1]) if len(sys.argv) > 1 else KEY_COUNT
+    items = {f'user {i:07d}': {'score': i % 1000} for i in range(key_count)}
+
+    plain, indexed = DictDatabase(), DictDatabase()
+    plain.set_many(items)
+    indexed.set_many(items)
+    _, build = timed(lambda: indexed.create_index('score', 'score'), repeats=1)
+    _, key_build = timed(lambda: indexed.enable_indexes(), repeats=1)
+    print(f'{key_count} keys, key index and secondary index built in {(build + key_build) * 1000:.0f} ms')
+
+    for prefix in PREFIXES:
+        expected, full = timed(lambda: filter_prefix(plain, prefix), repeats=3)
+        found, scan = timed(lambda: indexed.scan(prefix=prefix))
+        assert found == expected, f"Prefix scan of {prefix!r} disagrees with the filter"
+        print(f'prefix {prefix!r:>13}: {len(found):6d} keys, scan {scan * 1000:8.3f} ms, '
+              f'full filter {full * 1000:8.1f} ms ({full / scan:7.0f}x)')
+
+    for start, stop in SCORE_RANGES:
+        expected, full = timed(lambda: filter_scores(plain, start, stop), repeats=3)
+        found, scan = timed(lambda: indexed.find_range('score', start, stop))
+        assert sorted(found) == sorted(expected), f"Index range [{start}, {stop}) disagrees with the filter"
+        print(f'score [{start:3d}, {stop:4d}): {len(found):6d} keys, index {scan * 1000:8.3f} ms, '
+              f'full filter {full * 1000:8.1f} ms ({full / scan:7.0f}x)')
+
+    # What maintaining both indexes costs a write
+    updates = [(f'user {i:07d}', {'score': (i * 7) % 1000}) for i in range(0, key_count, 7)]
+    for name, db in (('plain', plain), ('indexed', indexed)):
+        _, elapsed = timed(lambda: [db.set_value(val, key) for key, val in updates], repeats=1)
+        print(f'{name:>8} updates: {len(updates) / elapsed:9.0f} sets/s')
@@ -0,0 +1,639 @@
+import json
+import pickle
+import struct
+import zlib
+
+from json_stream import load_object
+from tracing import logger
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MAGIC_SIZE = 4
+READ_CHUNK_SIZE = 1024 * 1024
+
+LENGTH = struct.Struct('<I')
+INT64 = struct.Struct('<q')
+FLOAT64 = struct.Struct('<d')
+FRAME = struct.Struct('<II')  # Payload length and CRC32 of every framed log record
+
+# One-byte type tags of the binary value encoding
+NONE, TRUE, FALSE, SMALL_INT, INT, BIG_INT, FLOAT, SHORT_STR, STR, BYTES, LIST, TUPLE, DICT, PICKLED = b'NTFjiIdcsbltmp'
+INT32 = struct.Struct('<i')
+INT32_MIN, INT32_MAX = -2 ** 31, 2 ** 31 - 1
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+# Raised while decoding when the buffer ends in the middle of a value
+INCOMPLETE = (IndexError, struct.error)
+
+
+def encode_value(value, out, allow_pickle=True):
+    """
+    Appends the binary encoding of a value to `out`: a type tag, then a fixed-size number or a length-prefixed
+    payload. Types without an encoding of their own are pickled, so any picklable value round-trips.
+
+    :param value: The value to encode.
+    :type value: any
+    :param out: The buffer to append to.
+    :type out: bytearray
+    :param allow_pickle: Pickle other types. When False, only None, bools, ints, floats, strings, bytes, lists,
+                         tuples and dicts of them are accepted.
+    :type allow_pickle: bool
+    :raises TypeError: If `allow_pickle` is False and the value contains another type.
+    """
+    kind = type(value)
+    if kind is str:
+        data = value.encode('utf-8')
+        if len(data) < 256:
+            out.append(SHORT_STR)  # Most keys and many values: a one-byte length instead of four
+            out.append(len(data))
+        else:
+            out.append(STR)
+            out += LENGTH.pack(len(data))
+        out += data
+    elif kind is int:
+        if INT32_MIN <= value <= INT32_MAX:
+            out.append(SMALL_INT)
+            out += INT32.pack(value)
+        elif INT64_MIN <= value <= INT64_MAX:
+            out.append(INT)
+            out += INT64.pack(value)
+        else:
+            data = value.to_bytes((value.bit_length() + 8) // 8, 'little', signed=True)
+            out.append(BIG_INT)
+            out += LENGTH.pack(len(data))
+            out += data
+    elif value is None:
+        out.append(NONE)
+    elif value is True:
+        out.append(TRUE)
+    elif value is False:
+        out.append(FALSE)
+    elif kind is float:
+        out.append(FLOAT)
+        out += FLOAT64.pack(value)
+    elif kind is bytes:
+        out.append(BYTES)
+        out += LENGTH.pack(len(value))
+        out += value
+    elif kind is list or kind is tuple:
+        out.append(LIST if kind is list else TUPLE)
+        out += LENGTH.pack(len(value))
+        for item in value:
+            encode_value(item, out, allow_pickle)
+    elif kind is dict:
+        out.append(DICT)
+        out += LENGTH.pack(len(value))
+        for key, item in value.items():
+            encode_value(key, out, allow_pickle)
+            encode_value(item, out, allow_pickle)
+    elif not allow_pickle:
+        raise TypeError(f"Cannot encode a {kind.__name__} value without pickling it.")
+    else:
+        data = pickle.dumps(value, protocol=5)
+        out.append(PICKLED)
+        out += LENGTH.pack(len(data))
+        out += data
+
+
+def decode_value(data, pos, allow_pickle=True):
+    """
+    Decodes one value written by encode_value().
+
+    :param data: The encoded bytes.
+    :type data: bytes
+    :param pos: Offset of the value's type tag.
+    :type pos: int
+    :param allow_pickle: Unpickle pickled values. Must be False for bytes from an untrusted source, since
+                         unpickling can execute arbitrary code.
+    :type allow_pickle: bool
+    :return: The value and the offset just past it.
+    :rtype: tuple
+    :raises IndexError: If `data` ends before the value does.
+    :raises ValueError: If the bytes are not a valid encoding, or hold a pickled value that is not allowed.
+    """
+    tag = data[pos]
+    if tag == SHORT_STR:
+        end = pos + 2 + data[pos + 1]
+        if end > len(data):
+            raise IndexError("Truncated value.")
+        return data[pos + 2:end].decode('utf-8'), end
+    if tag == SMALL_INT:
+        return INT32.unpack_from(data, pos + 1)[0], pos + 5
+    if tag == STR or tag == BYTES or tag == BIG_INT or tag == PICKLED:
+        start = pos + 5
+        end = start + LENGTH.unpack_from(data, pos + 1)[0]
+        if end > len(data):
+            raise IndexError("Truncated value.")
+        if tag == STR:
+            return data[start:end].decode('utf-8'), end
+        if tag == BYTES:
+            return data[start:end], end
+        if tag == BIG_INT:
+            return int.from_bytes(data[start:end], 'little', signed=True), end
+        if not allow_pickle:
+            raise ValueError(f"Pickled value at offset {pos} is not allowed.")
+        try:
+            return pickle.loads(data[start:end]), end
+        except Exception as error:
+            raise ValueError(f"Invalid pickled value: {error}") from None
+    if tag == INT:
+        return INT64.unpack_from(data, pos + 1)[0], pos + 9
+    if tag == NONE:
+        return None, pos + 1
+    if tag == TRUE:
+        return True, pos + 1
+    if tag == FALSE:
+        return False, pos + 1
+    if tag == FLOAT:
+        return FLOAT64.unpack_from(data, pos + 1)[0], pos + 9
+    if tag == LIST or tag == TUPLE:
+        count = LENGTH.unpack_from(data, pos + 1)[0]
+        pos += 5
+        items = []
+        for _ in range(count):
+            item, pos = decode_value(data, pos, allow_pickle)
+            items.append(item)
+        return (items if tag == LIST else tuple(items)), pos
+    if tag == DICT:
+        count = LENGTH.unpack_from(data, pos + 1)[0]
+        pos += 5
+        result = {}
+        for _ in range(count):
+            key, pos = decode_value(data, pos, allow_pickle)
+            result[key], pos = decode_value(data, pos, allow_pickle)
+        return result, pos
+    raise ValueError(f"Unknown type tag {tag!r} at offset {pos}.")
+
+
+def read_all(read, chunk_size=READ_CHUNK_SIZE):
+    """
+    Reads a stream to its end.
+
+    :param read: Callable taking a byte count and returning up to that many bytes, or b'' at end of stream.
+    :type read: callable
+    :return: Everything the stream held.
+    :rtype: bytes
+    """
+    chunks = []
+    while True:
+        data = read(chunk_size)
+        if not data:
+            return b''.join(chunks)
+        chunks.append(data)
+
+
+def check_magic(data, magic):
+    """
+    Raises ValueError unless a snapshot starts with the codec's magic bytes.
+    """
+    if data[:MAGIC_SIZE] != magic:
+        raise ValueError(f"Expected a snapshot starting with {magic!r}.")
+
+
+class JsonCodec:
+    """
+    The original format: the snapshot is one JSON object and the log holds one JSON array per line.
+    Values are limited to JSON types, and non-string keys come back as strings.
+    """
+    name = 'json'
+    magic = b''  # Recognized by not starting with another codec's magic, so older files still load
+
+    @staticmethod
+    def dump(dictionary):
+        """
+        Encodes a whole dictionary as a snapshot.
+
+        :param dictionary: The data to encode.
+        :type dictionary: dict
+        :return: The snapshot bytes.
+        :rtype: bytes
+        """
+        return json.dumps(dictionary).encode('utf-8')
+
+    @staticmethod
+    def load(read):
+        """
+        Decodes a snapshot, streaming it so stores of any size can be reloaded.
+
+        :param read: Callable taking a byte count and returning up to that many bytes, or b'' at end of stream.
+        :type read: callable
+        :return: The decoded dictionary.
+        :rtype: dict
+        :raises ValueError: If the stream is not a valid snapshot.
+        """
+        return load_object(read)
+
+    @staticmethod
+    def encode_records(records):
+        """
+        Encodes change records for appending to the write-ahead log.
+
+        :param records: ['s', key, value] for a set or ['d', key] for a delete, in order.
+        :type records: list
+        :return: The bytes to append.
+        :rtype: bytes
+        """
+        encode = json.JSONEncoder(separators=(',', ':')).encode
+        return ''.join([encode(record) + '\n' for record in records]).encode('utf-8')
+
+    @staticmethod
+    def iter_records(data):
+        """
+        Decodes the complete records at the start of `data`, stopping before an incomplete one.
+
+        :param data: Write-ahead log bytes starting on a record boundary.
+        :type data: bytes
+        :return: Generator of (record, offset just past the record).
+        :rtype: generator
+        :raises ValueError: If a complete record is corrupt.
+        """
+        pos = 0
+        while True:
+            end = data.find(b'\n', pos)
+            if end < 0:
+                return
+            try:
+                record = json.loads(data[pos:end].decode('utf-8'))
+            except UnicodeDecodeError as error:
+                raise ValueError(f"Invalid log record: {error}") from None
+            pos = end + 1
+            yield record, pos
+
+
+class FramedCodec:
+    """
+    Base of the binary codecs. Log records are framed by their length and a CRC32, so a torn or
+    corrupt tail is detected without relying on the payload format. Subclasses implement dump(), load(),
+    encode_record() and decode_record(), which register_codec() checks.
+    """
+    name = None
+    magic = None
+
+    @staticmethod
+    def encode_record(record):
+        """
+        Encodes one change record into a frame payload.
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def decode_record(payload):
+        """
+        Decodes one frame payload back into a change record.
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def encode_records(cls, records):
+        """
+        Encodes change records for appending to the write-ahead log.
+
+        :param records: ['s', key, value] for a set or ['d', key] for a delete, in order.
+        :type records: list
+        :return: The bytes to append.
+        :rtype: bytes
+        """
+        out = bytearray()
+        for record in records:
+            payload = cls.encode_record(record)
+            out += FRAME.pack(len(payload), zlib.crc32(payload))
+            out += payload
+        return bytes(out)
+
+    @classmethod
+    def iter_records(cls, data):
+        """
+        Decodes the complete records at the start of `data`, stopping before an incomplete one.
+
+        :param data: Write-ahead log bytes starting on a record boundary.
+        :type data: bytes
+        :return: Generator of (record, offset just past the record).
+        :rtype: generator
+        :raises ValueError: If a complete record is corrupt.
+        """
+        pos = 0
+        while pos + FRAME.size <= len(data):
+            length, checksum = FRAME.unpack_from(data, pos)
+            end = pos + FRAME.size + length
+            if end > len(data):
+                return
+            payload = data[pos + FRAME.size:end]
+            if zlib.crc32(payload) != checksum:
+                raise ValueError(f"Checksum mismatch in log record at offset {pos}.")
+            yield cls.decode_record(payload), end
+            pos = end
+
+
+class BinaryCodec(FramedCodec):
+    """
+    A compact binary format: the snapshot is the magic followed by alternating encoded keys and values,
+    each a type tag plus a fixed-size number or a length-prefixed payload (see encode_value()).
+    Keeps ints, floats, bytes, tuples and non-string keys intact, and pickles any other type.
+    """
+    name = 'binary'
+    magic = b'KVB1'
+
+    @staticmethod
+    def dump(dictionary):
+        """
+        Encodes a whole dictionary as a snapshot.
+
+        :param dictionary: The data to encode.
+        :type dictionary: dict
+        :return: The snapshot bytes.
+        :rtype: bytes
+        """
+        out = bytearray(BinaryCodec.magic)
+        for key, value in dictionary.items():
+            encode_value(key, out)
+            encode_value(value, out)
+        return bytes(out)
+
+    @staticmethod
+    def load(read, chunk_size=READ_CHUNK_SIZE):
+        """
+        Decodes a snapshot block by block, so only the unparsed tail of the file is held besides the result.
+
+        :param read: Callable taking a byte count and returning up to that many bytes, or b'' at end of stream.
+        :type read: callable
+        :return: The decoded dictionary.
+        :rtype: dict
+        :raises ValueError: If the stream is not a valid snapshot.
+        """
+        buffer = read(max(chunk_size, MAGIC_SIZE))
+        check_magic(buffer, BinaryCodec.magic)
+        pos = MAGIC_SIZE
+        eof = False
+        result = {}
+        while True:
+            end = len(buffer)
+            try:
+                while pos < end:
+                    if buffer[pos] == SHORT_STR:  # Inlined for the usual string key
+                        next_pos = pos + 2 + buffer[pos + 1]
+                        if next_pos > end:
+                            raise IndexError("Truncated key.")
+                        key = buffer[pos + 2:next_pos].decode('utf-8')
+                    else:
+                        key, next_pos = decode_value(buffer, pos)
+                    if buffer[next_pos] == SHORT_STR:  # And for string values
+                        value_end = next_pos + 2 + buffer[next_pos + 1]
+                        if value_end > end:
+                            raise IndexError("Truncated value.")
+                        result[key] = buffer[next_pos + 2:value_end].decode('utf-8')
+                        pos = value_end
+                    else:
+                        result[key], pos = decode_value(buffer, next_pos)
+                if eof:
+                    return result
+            except INCOMPLETE:
+                if eof:
+                    raise ValueError(f"Snapshot truncated after {len(result)} keys.") from None
+            data = read(max(chunk_size, end - pos))  # Grow the window so a large value parses in O(n)
+            eof = not data
+            buffer = buffer[pos:] + data
+            pos = 0
+
+    @staticmethod
+    def encode_record(record):
+        out = bytearray()
+        encode_value(record, out)
+        return out
+
+    @staticmethod
+    def decode_record(payload):
+        try:
+            return decode_value(payload, 0)[0]
+        except INCOMPLETE:
+            raise ValueError("Truncated log record.") from None
+
+
+class PickleCodec(FramedCodec):
+    """
+    Pickle protocol 5: the fastest to encode and decode because both run in C, and keeps every picklable type.
+    Only load files you trust, since unpickling can run arbitrary code.
+    """
+    name = 'pickle'
+    magic = b'KVP5'
+
+    @staticmethod
+    def dump(dictionary):
+        """
+        Encodes a whole dictionary as a snapshot.
+
+        :param dictionary: The data to encode.
+        :type dictionary: dict
+        :return: The snapshot bytes.
+        :rtype: bytes
+        """
+        return PickleCodec.magic + pickle.dumps(dictionary, protocol=5)
+
+    @staticmethod
+    def load(read):
+        """
+        Decodes a snapshot.
+
+        :param read: Callable taking a byte count and returning up to that many bytes, or b'' at end of stream.
+        :type read: callable
+        :return: The decoded dictionary.
+        :rtype: dict
+        :raises ValueError: If the stream is not a valid snapshot.
+        """
+        data = read_all(read)
+        check_magic(data, PickleCodec.magic)
+        try:
+            return pickle.loads(memoryview(data)[MAGIC_SIZE:])
+        except Exception as error:
+            raise ValueError(f"Invalid pickle snapshot: {error}") from None
+
+    @staticmethod
+    def encode_record(record):
+        return pickle.dumps(record, protocol=5)
+
+    @staticmethod
+    def decode_record(payload):
+        try:
+            return pickle.loads(payload)
+        except Exception as error:
+            raise ValueError(f"Invalid log record: {error}") from None
+
+
+class MsgpackCodec(FramedCodec):
+    """
+    MessagePack, if the msgpack package is installed: compact and decoded in C, with the JSON value types
+    plus bytes. Tuples come back as lists.
+    """
+    name = 'msgpack'
+    magic = b'KVM1'
+
+    @staticmethod
+    def dump(dictionary):
+        """
+        Encodes a whole dictionary as a snapshot.
+
+        :param dictionary: The data to encode.
+        :type dictionary: dict
+        :return: The snapshot bytes.
+        :rtype: bytes
+        """
+        return MsgpackCodec.magic + msgpack.packb(dictionary, use_bin_type=True)
+
+    @staticmethod
+    def load(read):
+        """
+        Decodes a snapshot.
+
+        :param read: Callable taking a byte count and returning up to that many bytes, or b'' at end of stream.
+        :type read: callable
+        :return: The decoded dictionary.
+        :rtype: dict
+        :raises ValueError: If the stream is not a valid snapshot.
+        """
+        data = read_all(read)
+        check_magic(data, MsgpackCodec.magic)
+        try:
+            return msgpack.unpackb(memoryview(data)[MAGIC_SIZE:], raw=False, strict_map_key=False)
+        except Exception as error:
+            raise ValueError(f"Invalid msgpack snapshot: {error}") from None
+
+    @staticmethod
+    def encode_record(record):
+        return msgpack.packb(record, use_bin_type=True)
+
+    @staticmethod
+    def decode_record(payload):
+        try:
+            return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+        except Exception as error:
+            raise ValueError(f"Invalid log record: {error}") from None
+
+
+CODECS = {}
+
+
+def register_codec(codec):
+    """
+    Makes a codec available to get_codec() and detect_codec(), after checking that it implements dump(),
+    load(), encode_records() and iter_records(), the last two being inherited from FramedCodec by codecs
+    that implement encode_record() and decode_record() instead.
+
+    :param codec: The codec class, whose name is not registered yet.
+    :type codec: type
+    :return: The codec.
+    :rtype: type
+    :raises TypeError: If a method is missing, or left to the FramedCodec stub.
+    """
+    if issubclass(codec, FramedCodec):
+        required = ('dump', 'load', 'encode_record', 'decode_record')
+    else:
+        required = ('dump', 'load', 'encode_records', 'iter_records')
+    missing = [method for method in required
+               if not any(method in vars(base) for base in codec.__mro__ if base is not FramedCodec)]
+    if missing:
+        raise TypeError(f"Codec {codec.__name__} does not implement {', '.join(missing)}.")
+    if codec.name in CODECS:
+        raise ValueError(f"A codec named {codec.name} is already registered.")
+    CODECS[codec.name] = codec
+    return codec
+
+
+for codec in (JsonCodec, BinaryCodec, PickleCodec, MsgpackCodec):
+    register_codec(codec)
+
+
+def get_codec(name='json'):
+    """
+    Returns the codec to encode snapshots and log records with.
+
+    :param name: 'json', 'binary', 'pickle' or 'msgpack', or the name of another registered codec.
+    :type name: str
+    :return: The codec class.
+    :rtype: type
+    """
+    if name not in CODECS:
+        logger.error("Unknown codec %s.", name)
+        raise ValueError(f"Codec must be one of {tuple(CODECS)}.")
+    if name == 'msgpack' and msgpack is None:
+        raise ValueError("The msgpack codec needs the msgpack package.")
+    return CODECS[name]
+
+
+def detect_codec(head, default):
+    """
+    Identifies the codec a snapshot or log was written with from its first bytes,
+    so files keep loading after the configured codec changes.
+
+    :param head: The first MAGIC_SIZE bytes of the file.
+    :type head: bytes
+    :param default: The codec to assume for an empty file.
+    :type default: type
+    :return: The codec that wrote the file.
+    :rtype: type
+    """
+    if not head:
+        return default
+    for codec in CODECS.values():
+        if codec.magic and head[:MAGIC_SIZE] == codec.magic:
+            return codec
+    return JsonCodec
+
+
+if __name__ == '__main__':
+    import io
+
+    sample = {
+        'text': 'héllo', 'int': -5, 'big': 2 ** 100, 'float': 1.5, 'none': None, 'flags': [True, False],
+        'bytes': b'\x00\xff', 'tuple': (1, 'a'), 'nested': {'a': [1, {'b': 2}]}, 7: 'int key', 'set': {1, 2},
+    }
+    encoded = BinaryCodec.dump(sample)
+    assert BinaryCodec.load(io.BytesIO(encoded).read) == sample, "Binary snapshot did not round-trip"
+    assert BinaryCodec.load(io.BytesIO(encoded).read, chunk_size=3) == sample, "Chunked binary load failed"
+    assert PickleCodec.load(io.BytesIO(PickleCodec.dump(sample)).read) == sample, "Pickle snapshot did not round-trip"
+
+    try:
+        BinaryCodec.load(io.BytesIO(encoded[:-1]).read)
+        raise AssertionError("A truncated snapshot was accepted")
+    except ValueError:
+        pass
+
+    # Log records: a torn tail is left for the caller, a corrupt record raises
+    records = [['s', 'a', 1], ['d', 'a'], ['s', 'b', (1, 2)]]
+    for codec in (JsonCodec, BinaryCodec, PickleCodec):
+        data = codec.encode_records(records)
+        decoded = [record for record, end in codec.iter_records(data + data[:5])]
+        expected = records if codec is not JsonCodec else json.loads(json.dumps(records))
+        assert decoded == expected, f"{codec.name} log records did not round-trip"
+    corrupt = bytearray(BinaryCodec.encode_records(records))
+    corrupt[-1] ^= 0xff
+    try:
+        list(BinaryCodec.iter_records(bytes(corrupt)))
+        raise AssertionError("A corrupt record was accepted")
+    except ValueError:
+        pass
+
+    assert detect_codec(encoded[:MAGIC_SIZE], JsonCodec) is BinaryCodec, "Binary snapshot not detected"
+    assert detect_codec(b'{"a"', BinaryCodec) is JsonCodec, "JSON snapshot not detected"
+    assert detect_codec(b'', BinaryCodec) is BinaryCodec, "Empty file should use the default codec"
+
+    # A codec is only registered if it implements every method
+    class HalfCodec(FramedCodec):
+        name = 'half'
+        dump = load = staticmethod(lambda data: data)
+
+        @staticmethod
+        def encode_record(record):
+            return b''
+
+    try:
+        register_codec(HalfCodec)
+        raise AssertionError("A codec without decode_record was registered")
+    except TypeError:
+        pass
+    HalfCodec.decode_record = staticmethod(lambda payload: payload)
+    assert register_codec(HalfCodec) is get_codec('half'), "A complete codec was not registered"
+    del CODECS['half']
+
+    print("All assertions passed.")
@@ -0,0 +1,50 @@
+import io
+import sys
+import time
+
+from serialization import CODECS, msgpack
+
+KEY_COUNT = 1000000
+
+
+def datasets(key_count):
+    """
+    Builds the dictionaries to encode: string values, and numeric values mixing ints and floats.
+
+    :return: Maps a dataset name to its dictionary.
+    :rtype: dict
+    """
+    return {
+        'strings': {f'key {i}': f'value {i}' for i in range(key_count)},
+        'numbers': {f'key {i}': i * 0.5 if i % 2 else i for i in range(key_count)},
+    }
+
+
+def measure(codec, data):
+    """
+    Encodes and decodes a whole snapshot with one codec.
+
+    :return: Snapshot size in bytes, encode seconds and decode seconds.
+    :rtype: tuple
+    """
+    start = time.perf_counter()
+    encoded = codec.dump(data)
+    encode_time = time.perf_counter() - start
+    start = time.perf_counter()
+    decoded = codec.load(io.BytesIO(encoded).read)
+    decode_time = time.perf_counter() - start
+    assert len(decoded) == len(data), f"{codec.name} lost keys"
+    return len(encoded), encode_time, decode_time
+
+
+if __name__ == '__main__':
+    key_count = int(sys.argv[1]) if len(sys.argv) > 1 else KEY_COUNT
+    codecs = [codec for name, codec in CODECS.items() if name != 'msgpack' or msgpack is not None]
+    for dataset, data in datasets(key_count).items():
+        print(f'{dataset}: {key_count} keys')
+        json_size = None
+        for codec in codecs:
+            size, encode_time, decode_time = measure(codec, data)
+            json_size = json_size or size  # JSON is measured first
+            print(f'{codec.name:>8}: {size / 2 ** 20:6.1f} MiB ({size / json_size:4.0%} of JSON), '
+                  f'encode {encode_time:.2f} s, decode {decode_time:.2f} s')
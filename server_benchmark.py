@@ -0,0 +1,96 @@
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+from database_client import DatabaseClient
+from database_server import DatabaseServer
+from sync_database import SyncDatabase
+
+OPERATIONS = 20000  # Requests per measurement, split between the workers
+KEYS = 1000
+WRITE_RATIO = 0.1
+CONFIGURATIONS = [(1, 1), (8, 1), (8, 16), (32, 16)]  # (worker threads, pipeline depth)
+
+
+def serve(address, ready, stop):
+    """
+    Runs a server in a separate process so it does not share the benchmark's interpreter lock.
+    """
+    paths = dict(file_path=f'server_benchmark_{os.getpid()}.pkl', log_path=f'server_benchmark_{os.getpid()}.wal')
+    server = DatabaseServer(SyncDatabase('threading', persistence='log', **paths), address)
+    server.start()
+    ready.put(server.address)
+    stop.wait()
+    server.shutdown()
+    for path in paths.values():
+        os.remove(path)
+
+
+def percentile(samples, fraction):
+    """
+    Returns the value below which `fraction` of the sorted samples fall.
+    """
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def measure(address, workers, depth, operations):
+    """
+    Runs `workers` threads that each send batches of `depth` pipelined requests through one pooled client.
+    A request's latency is the round trip of the batch it was sent in.
+
+    :return: Requests per second, and the p50 and p99 latencies in seconds.
+    :rtype: tuple
+    """
+    client = DatabaseClient(address, pool_size=workers)
+    client.set_many({f'key {i}': 'x' * 100 for i in range(KEYS)})
+    batches = operations // (workers * depth)
+    latencies = [[] for _ in range(workers)]
+
+    def worker(index):
+        rng = random.Random(index)
+        samples = latencies[index]
+        for _ in range(batches):
+            pipeline = client.pipeline()
+            for _ in range(depth):
+                key = f'key {rng.randrange(KEYS)}'
+                if rng.random() < WRITE_RATIO:
+                    pipeline.set_value('y' * 100, key)
+                else:
+                    pipeline.get_value(key)
+            start = time.perf_counter()
+            pipeline.execute()
+            samples.extend([time.perf_counter() - start] * depth)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    client.close()
+    samples = sorted(sample for worker_samples in latencies for sample in worker_samples)
+    return len(samples) / elapsed, percentile(samples, 0.5), percentile(samples, 0.99)
+
+
+if __name__ == '__main__':
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else OPERATIONS
+    addresses = {'tcp': ('127.0.0.1', 0)}
+    if hasattr(socket, 'AF_UNIX'):
+        addresses['unix'] = f'server_benchmark_{os.getpid()}.sock'
+    print(f'{operations} requests per measurement, {WRITE_RATIO:.0%} writes over {KEYS} keys')
+    for transport, address in addresses.items():
+        ready, stop = multiprocessing.Queue(), multiprocessing.Event()
+        server = multiprocessing.Process(target=serve, args=(address, ready, stop))
+        server.start()
+        address = ready.get()
+        for workers, depth in CONFIGURATIONS:
+            rate, p50, p99 = measure(address, workers, depth, operations)
+            print(f'{transport:>4} {workers:3d} workers, depth {depth:3d}: {rate:9.0f} ops/s, '
+                  f'p50 {p50 * 1e6:7.0f} us, p99 {p99 * 1e6:7.0f} us')
+        stop.set()
+        server.join()
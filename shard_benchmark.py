@@ -0,0 +1,70 @@
+import contextlib
+import os
+import sys
+import threading
+import time
+
+from multi_threading_test import ThreadingTest
+from sharded_database import ShardedDatabase
+
+SHARD_COUNTS = (1, 2, 4, 8, 16)
+PRELOADED_KEYS = 2000  # Keys present before timing, so every write persists a realistic shard
+WRITER_THREADS = 8
+WRITES_PER_THREAD = 100
+
+
+class ShardedThreadingTest(ThreadingTest):
+    def __init__(self, shards):
+        """
+        Runs the ThreadingTest scenarios against a ShardedDatabase instead of a single SyncDatabase.
+
+        :param shards: The number of shards.
+        :type shards: int
+        """
+        self.threads_list = []
+        self.data_base = ShardedDatabase('threading', shards)
+
+    def preload(self, count):
+        """
+        Fills the database with `count` keys.
+        """
+        for i in range(count):
+            self.data_base.set_value('preloaded', f'preload {i}')
+
+    def test_disjoint_writers(self, threads, writes):
+        """
+        Starts `threads` writers that each update their own keys, interleaved with reads of those keys,
+        and waits for them to complete.
+
+        :return: The number of operations performed.
+        :rtype: int
+        """
+        def worker(index):
+            for i in range(writes):
+                self.data_base.set_value('complete', f'writer {index} key {i}')
+                self.data_base.get_value(f'writer {index} key {i}')
+
+        self.threads_list = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+        for thread in self.threads_list:
+            thread.start()
+        for thread in self.threads_list:
+            thread.join()
+        return threads * writes * 2
+
+
+if __name__ == '__main__':
+    shard_counts = [int(arg) for arg in sys.argv[1:]] or SHARD_COUNTS
+    print(f'{WRITER_THREADS} threads x {WRITES_PER_THREAD} writes + reads on disjoint keys, '
+          f'{PRELOADED_KEYS} preloaded keys')
+    for shards in shard_counts:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            test = ShardedThreadingTest(shards)
+            test.preload(PRELOADED_KEYS)
+            scenarios_start = time.perf_counter()
+            test.test_all()
+            scenarios_elapsed = time.perf_counter() - scenarios_start
+            start = time.perf_counter()
+            operations = test.test_disjoint_writers(WRITER_THREADS, WRITES_PER_THREAD)
+            elapsed = time.perf_counter() - start
+        print(f'{shards:>3} shards: {operations / elapsed:8.0f} ops/s on disjoint keys, '
+              f'ThreadingTest scenarios in {scenarios_elapsed * 1000:6.1f} ms')
@@ -0,0 +1,238 @@
+import os
+import zlib
+
+from file_database import FILE_PATH, LOG_PATH
+from sync_database import SyncDatabase
+from tracing import logger
+
+DEFAULT_SHARDS = 8
+
+
+def shard_path(path, index):
+    """
+    Returns the file path of one shard, e.g. 'database.3.pkl' for 'database.pkl'.
+
+    :param path: The unsharded file path.
+    :type path: str
+    :param index: The shard number.
+    :type index: int
+    :return: The shard's file path.
+    :rtype: str
+    """
+    root, extension = os.path.splitext(path)
+    return f'{root}.{index}{extension}'
+
+
+def shard_lock_name(path):
+    """
+    Returns the name of the system-wide lock of one shard, the same in every process opening the shard file
+    and different for every other file. It holds no path separators, so it is a valid lock file name and
+    win32 object name.
+
+    :param path: The shard's file path.
+    :type path: str
+    :rtype: str
+    """
+    return f'{os.path.basename(path)}.{zlib.crc32(os.path.abspath(path).encode()):08x}'
+
+
+class ShardedDatabase:
+    def __init__(self, mode, shards=DEFAULT_SHARDS, persistence='snapshot', backend=None, prefer_writers=True,
+                 file_path=FILE_PATH, log_path=LOG_PATH):
+        """
+        Initializes a database whose keys are hashed into independent shards. Each shard is a SyncDatabase
+        with its own reader-writer lock and its own files, so operations on keys in different shards never
+        wait for each other and a write only persists its own shard. In multiprocessing mode, each shard's
+        lock is named after its snapshot file (see shard_lock_name()), so shards never share a lock either.
+
+        :param mode: 'threading' or 'multiprocessing', as for SyncDatabase.
+        :type mode: str
+        :param shards: The number of shards.
+        :type shards: int
+        :param persistence: The FileDatabase persistence mode of every shard.
+        :type persistence: str
+        :param backend: The lock and file I/O backend name, or None for the platform's native one.
+        :type backend: str or None
+        :param prefer_writers: Queue new readers behind waiting writers within a shard.
+        :type prefer_writers: bool
+        :param file_path: The unsharded snapshot file name, from which the shard file names are derived.
+        :type file_path: str
+        :param log_path: The unsharded write-ahead log name, from which the shard log names are derived.
+        :type log_path: str
+        """
+        if shards < 1:
+            raise ValueError("A ShardedDatabase needs at least one shard.")
+        self.shards = [SyncDatabase(mode, backend, prefer_writers=prefer_writers, persistence=persistence,
+                                    file_path=shard_path(file_path, index), log_path=shard_path(log_path, index),
+                                    lock_name=shard_lock_name(shard_path(file_path, index)))
+                       for index in range(shards)]
+        logger.info("Initialized ShardedDatabase with %d shards in %s mode.", shards, mode)
+
+    def shard_for(self, key):
+        """
+        Returns the shard that owns a key. CRC32 is used instead of hash() so that every process,
+        whatever its hash seed, maps a key to the same shard.
+
+        :param key: The key.
+        :type key: str
+        :return: The owning shard.
+        :rtype: SyncDatabase
+        """
+        return self.shards[zlib.crc32(str(key).encode('utf-8')) % len(self.shards)]
+
+    def load(self):
+        """
+        Loads every shard from its files.
+        """
+        for shard in self.shards:
+            shard.get_write_access()
+            try:
+                shard.load()
+            finally:
+                shard.end_write()
+
+    def close(self):
+        """
+        Flushes and stops background work in every shard.
+        """
+        for shard in self.shards:
+            shard.close()
+
+    def set_value(self, val, key, ttl=None):
+        """
+        Writes a value with exclusive access to the key's shard only, expiring after `ttl` seconds if given.
+
+        :return: True if the operation is successful, False otherwise.
+        :rtype: bool
+        """
+        return self.shard_for(key).set_value(val, key, ttl)
+
+    def get_value(self, key):
+        """
+        Reads a value with shared access to the key's shard only.
+
+        :return: The value associated with the key if it exists, otherwise None.
+        :rtype: any or None
+        """
+        return self.shard_for(key).get_value(key)
+
+    def delete_value(self, key):
+        """
+        Deletes a key-value pair with exclusive access to the key's shard only.
+
+        :return: The value associated with the deleted key if it exists, otherwise None.
+        :rtype: any or None
+        """
+        return self.shard_for(key).delete_value(key)
+
+    def group_by_shard(self, entries, pairs=False):
+        """
+        Splits keys, or (key, value) pairs, into one list per shard.
+
+        :param entries: The keys or pairs.
+        :type entries: iterable
+        :param pairs: True if the entries are (key, value) pairs.
+        :type pairs: bool
+        :return: Maps each shard index holding any of the keys to its entries.
+        :rtype: dict
+        """
+        groups = {}
+        for entry in entries:
+            key = entry[0] if pairs else entry
+            groups.setdefault(zlib.crc32(str(key).encode('utf-8')) % len(self.shards), []).append(entry)
+        return groups
+
+    def set_many(self, items, ttl=None):
+        """
+        Writes many key-value pairs with one lock acquisition and one persist per shard involved.
+
+        :param items: A mapping of keys to values, or an iterable of (key, value) pairs.
+        :type items: dict or iterable
+        :param ttl: Seconds after which the keys expire, or None to keep them until deleted.
+        :type ttl: float or None
+        :return: True for each key that was set.
+        :rtype: dict
+        """
+        results = {}
+        pairs = list(items.items() if hasattr(items, 'items') else items)
+        for index, group in self.group_by_shard(pairs, pairs=True).items():
+            results.update(self.shards[index].set_many(group, ttl))
+        return results
+
+    def get_many(self, keys):
+        """
+        Reads many values with one lock acquisition per shard involved.
+
+        :return: For each key, its value if it exists, otherwise None.
+        :rtype: dict
+        """
+        results = {}
+        for index, group in self.group_by_shard(keys).items():
+            results.update(self.shards[index].get_many(group))
+        return results
+
+    def delete_many(self, keys):
+        """
+        Deletes many keys with one lock acquisition and one persist per shard involved.
+
+        :return: For each key, the deleted value if it existed, otherwise None.
+        :rtype: dict
+        """
+        results = {}
+        for index, group in self.group_by_shard(keys).items():
+            results.update(self.shards[index].delete_many(group))
+        return results
+
+
+if __name__ == '__main__':
+    db = ShardedDatabase('threading', shards=4)
+    for i in range(20):
+        assert db.set_value(i, f'key {i}') == True, f"Failed to set 'key {i}'"
+    assert all(len(shard.dict) < 20 for shard in db.shards), "Keys were not spread over the shards"
+    assert sum(len(shard.dict) for shard in db.shards) == 20, "Keys were lost between shards"
+    assert db.get_value('key 7') == 7, "Failed to retrieve 'key 7'"
+    assert db.delete_value('key 7') == 7, "Failed to delete 'key 7'"
+    assert db.get_value('key 7') is None, "Deleted key 'key 7' should return None"
+
+    # Batches are split by shard
+    batch = {f'batch {i}': i for i in range(10)}
+    assert db.set_many(batch) == {key: True for key in batch}, "Failed to set a batch"
+    assert db.get_many(batch) == batch, "Failed to get a batch"
+    assert db.delete_many(['batch 1', 'missing']) == {'batch 1': 1, 'missing': None}, "Failed to delete a batch"
+
+    # Each shard persisted only its own keys
+    reloaded = ShardedDatabase('threading', shards=4)
+    reloaded.load()
+    assert reloaded.get_value('key 3') == 3, "Shard files did not persist 'key 3'"
+    assert reloaded.get_value('key 7') is None, "Shard files resurrected 'key 7'"
+
+    # Across processes, a writer holding one shard does not block writers of another
+    import multiprocessing
+    import threading
+    shared = ShardedDatabase('multiprocessing', shards=2, file_path='sharded_processes.pkl')
+    holding, done = multiprocessing.Event(), multiprocessing.Event()
+
+    def hold_first_shard():
+        shared.shards[0].get_write_access()
+        holding.set()
+        done.wait()
+        shared.shards[0].end_write()
+
+    holder = multiprocessing.Process(target=hold_first_shard)
+    holder.start()
+    assert holding.wait(10), "The holder process did not take its lock"
+    second = threading.Thread(target=lambda: (shared.shards[1].get_write_access(), shared.shards[1].end_write()))
+    second.start()
+    second.join(5)
+    assert not second.is_alive(), "A writer of shard 1 waited for a writer of shard 0"
+    first = threading.Thread(target=lambda: (shared.shards[0].get_write_access(), shared.shards[0].end_write()))
+    first.start()
+    first.join(0.2)
+    assert first.is_alive(), "Two processes held the write lock of shard 0 together"
+    done.set()
+    holder.join()
+    first.join()
+    for index in range(2):
+        os.remove(shard_path('sharded_processes.pkl', index))
+
+    print("All assertions passed.")
@@ -0,0 +1,68 @@
+import multiprocessing
+import os
+import sys
+import time
+
+from shared_memory_database import SharedMemoryDatabase
+
+WRITES = 2000
+OPERATIONS = 50000
+
+
+def percentile(samples, fraction):
+    """
+    Returns the value below which `fraction` of the sorted samples fall.
+    """
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+def writer(name, writes, ready):
+    """
+    Publishes the time of each write, so the reader can tell how long the write took to become visible.
+    """
+    db = SharedMemoryDatabase(name)
+    ready.wait()
+    for i in range(writes):
+        db.set_value((i, time.perf_counter_ns()), 'clock')
+        time.sleep(0.0005)
+    db.close()
+
+
+if __name__ == '__main__':
+    writes = int(sys.argv[1]) if len(sys.argv) > 1 else WRITES
+    name = f'shared_memory_benchmark_{os.getpid()}'
+    db = SharedMemoryDatabase(name)
+
+    # Single-process throughput
+    start = time.perf_counter()
+    for i in range(OPERATIONS):
+        db.set_value(i, f'key {i % 1000}')
+    set_rate = OPERATIONS / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for i in range(OPERATIONS):
+        db.get_value(f'key {i % 1000}')
+    get_rate = OPERATIONS / (time.perf_counter() - start)
+    print(f'set: {set_rate:8.0f} ops/s  get: {get_rate:8.0f} ops/s (lock-free)')
+
+    # Cross-process visibility: poll until each write from the child process shows up
+    db.set_value((-1, 0), 'clock')
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target=writer, args=(name, writes, ready))
+    process.start()
+    ready.set()
+    delays = []
+    last = -1
+    while last < writes - 1:
+        sequence, written_at = db.get_value('clock')
+        if sequence != last:
+            delays.append(time.perf_counter_ns() - written_at)
+            last = sequence
+        elif not process.is_alive() and db.get_value('clock')[0] == last:  # Read again after its last write
+            sys.exit(f'The writer process exited after {last + 1} of {writes} writes.')
+    process.join()
+    delays.sort()
+    print(f'write-to-read visibility over {len(delays)} writes: p50 {percentile(delays, 0.5) / 1000:.1f} us  '
+          f'p99 {percentile(delays, 0.99) / 1000:.1f} us  (on {os.cpu_count()} CPUs)')
+
+    db.close()
+    db.unlink()
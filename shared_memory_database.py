@@ -0,0 +1,386 @@
+import os
+import pickle
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+from hash_index import HashIndex, key_hash, MAX_LOAD
+from platform_backend import get_backend
+from tracing import logger
+
+SHARED_MEMORY_NAME = 'shared_database'
+DEFAULT_CAPACITY = 1 << 16  # Index slots
+DEFAULT_DATA_SIZE = 64 * 1024 * 1024  # Bytes of record storage
+STALL_TIMEOUT = 1.0  # Seconds a reader waits for a writer mid-change before checking that the writer is alive
+
+MAGIC = b'SHMDB001'
+FIELD = struct.Struct('<Q')
+# Header fields, each a little-endian u64 after the 8-byte magic
+SEQUENCE = 8  # Odd while a writer is changing the index, incremented twice per change
+CAPACITY = 16
+DATA_SIZE = 24
+DATA_USED = 32
+COUNT = 40
+DELETED_SLOTS = 48
+INDEX_BASE = 64
+RECORD = struct.Struct('<II')  # Key length, value length; followed by the key and value bytes
+
+
+def untrack(memory):
+    """
+    Stops the multiprocessing resource tracker from unlinking a block when this process exits.
+    The tracker would otherwise destroy the block under every other attached process; it is
+    destroyed by an explicit SharedMemoryDatabase.unlink() instead.
+    """
+    if os.name != 'nt':
+        resource_tracker.unregister(memory._name, 'shared_memory')
+
+
+class RetryRead(Exception):
+    """
+    Raised inside a lock-free read that observed a half-finished write.
+    """
+
+
+class SharedMemoryDatabase:
+    def __init__(self, name=SHARED_MEMORY_NAME, capacity=DEFAULT_CAPACITY, data_size=DEFAULT_DATA_SIZE, backend=None):
+        """
+        Initializes a key-value store that lives in a named shared memory block, so every process that opens the
+        same name reads and writes the same live data without copying or re-parsing it.
+
+        The block holds a header, an open-addressing hash index and an append-only record area. Writers are
+        serialized by a named mutex. Readers take no lock: they check a sequence counter that writers make odd
+        while changing the index, and retry if it changed during the lookup. A writer that dies mid-change
+        leaves the counter odd and the index possibly half rewritten; readers waiting on it for STALL_TIMEOUT
+        seconds, and later writers, then raise ValueError instead of waiting forever.
+
+        :param name: The shared memory block name. The first process to use a name creates the block.
+        :type name: str
+        :param capacity: Number of index slots when creating the block, a power of two.
+        :type capacity: int
+        :param data_size: Bytes of record storage when creating the block.
+        :type data_size: int
+        :param backend: The lock backend name, or None for the platform's native one.
+        :type backend: str or None
+        """
+        self.name = name
+        self.backend_name = backend
+        self.lock = get_backend(backend).create_mutex(f'{name}.writer')
+        self.lock.acquire()
+        try:
+            self.owner = True
+            try:
+                self.memory = shared_memory.SharedMemory(
+                    name, create=True, size=INDEX_BASE + HashIndex.size(capacity) + data_size)
+            except FileExistsError:
+                self.owner = False
+                self.memory = shared_memory.SharedMemory(name)
+            untrack(self.memory)
+            self.buffer = self.memory.buf
+            if self.owner:
+                self.buffer[:INDEX_BASE] = bytes(INDEX_BASE)
+                self.set_field(CAPACITY, capacity)
+                self.set_field(DATA_SIZE, data_size)
+                self.buffer[:len(MAGIC)] = MAGIC
+            elif bytes(self.buffer[:len(MAGIC)]) != MAGIC:
+                raise ValueError(f"Shared memory block {name} is not a SharedMemoryDatabase.")
+        finally:
+            self.lock.release()
+        self.capacity = self.field(CAPACITY)
+        self.data_size = self.field(DATA_SIZE)
+        self.index = HashIndex(self.buffer, INDEX_BASE, self.capacity)
+        self.data_base = INDEX_BASE + HashIndex.size(self.capacity)
+        logger.info("SharedMemoryDatabase %s %s.", 'created' if self.owner else 'attached to', name)
+
+    def __getstate__(self):
+        """
+        Pickles only the block name, so a spawned process re-attaches to the same block.
+        """
+        return {'name': self.name, 'backend': self.backend_name}
+
+    def __setstate__(self, state):
+        """
+        Re-attaches to the block named in the pickled state.
+        """
+        self.__init__(state['name'], backend=state['backend'])
+
+    def field(self, offset):
+        """
+        Reads a header field.
+        """
+        return FIELD.unpack_from(self.buffer, offset)[0]
+
+    def set_field(self, offset, value):
+        """
+        Writes a header field.
+        """
+        FIELD.pack_into(self.buffer, offset, value)
+
+    def record(self, offset):
+        """
+        Returns the key and value bytes of the record at `offset` in the record area as memoryviews.
+        """
+        start = self.data_base + offset
+        key_length, value_length = RECORD.unpack_from(self.buffer, start)
+        start += RECORD.size
+        if start + key_length + value_length > len(self.buffer):
+            raise RetryRead()  # Only possible while the record area is being rewritten
+        return self.buffer[start:start + key_length], self.buffer[start + key_length:start + key_length + value_length]
+
+    def find(self, encoded_key, hash_value):
+        """
+        Returns the index slot holding a key, or -1.
+        """
+        return self.index.probe(hash_value, lambda offset: self.record(offset)[0] == encoded_key)
+
+    def get_value(self, key):
+        """
+        Retrieves the value associated with the specified key without taking any lock.
+
+        :param key: The key for which to retrieve the value.
+        :type key: str
+        :return: The value associated with the key if it exists, otherwise None.
+        :rtype: any or None
+        """
+        encoded_key = key.encode('utf-8')
+        hash_value = key_hash(encoded_key)
+        stalled = None
+        while True:
+            sequence = self.field(SEQUENCE)
+            if sequence & 1:
+                if stalled is None:
+                    stalled = time.monotonic()
+                elif time.monotonic() - stalled > STALL_TIMEOUT:
+                    self.wait_for_writer()
+                    stalled = None
+                time.sleep(0)  # A writer is mid-change
+                continue
+            try:
+                slot, _ = self.find(encoded_key, hash_value)
+                data = bytes(self.record(self.index.get(slot)[1])[1]) if slot >= 0 else None
+            except (RetryRead, struct.error, ValueError, IndexError):
+                data = RetryRead
+            if self.field(SEQUENCE) == sequence and data is not RetryRead:
+                break
+        return None if data is None else pickle.loads(data)
+
+    def wait_for_writer(self):
+        """
+        Waits for the writer holding the lock to finish. The lock is released when its holder dies, so if the
+        sequence is still odd once the lock is taken, the change will never be finished.
+
+        :raises ValueError: If a writer died mid-change.
+        """
+        self.lock.acquire()
+        try:
+            self.check_intact()
+        finally:
+            self.lock.release()
+
+    def check_intact(self):
+        """
+        Checks that no writer died mid-change. Called with the writer lock.
+
+        :raises ValueError: If the sequence is odd, so the index may be half rewritten.
+        """
+        if self.field(SEQUENCE) & 1:
+            logger.error("check_intact: A writer died while changing shared memory block %s.", self.name)
+            raise ValueError(f"Shared memory block {self.name} was left mid-change by a writer that died.")
+
+    def begin_change(self):
+        """
+        Makes the sequence counter odd so lock-free readers retry until end_change().
+        """
+        self.set_field(SEQUENCE, self.field(SEQUENCE) + 1)
+
+    def end_change(self):
+        """
+        Makes the sequence counter even again, publishing the change.
+        """
+        self.set_field(SEQUENCE, self.field(SEQUENCE) + 1)
+
+    def set_value(self, val, key):
+        """
+        Sets a value for a specified key, visible to every attached process as soon as it returns.
+
+        :param val: The value to store, any picklable object.
+        :type val: any
+        :param key: The key to associate with the value.
+        :type key: str
+        :return: True if the operation is successful, False otherwise.
+        :rtype: bool
+        """
+        encoded_key = key.encode('utf-8')
+        data = pickle.dumps(val, pickle.HIGHEST_PROTOCOL)
+        size = RECORD.size + len(encoded_key) + len(data)
+        hash_value = key_hash(encoded_key)
+        self.lock.acquire()
+        try:
+            self.check_intact()
+            if self.field(DATA_USED) + size > self.data_size:
+                self.compact()
+                if self.field(DATA_USED) + size > self.data_size:
+                    logger.error("set_value: No room for %s in shared memory block %s.", key, self.name)
+                    return False
+            slot, free = self.find(encoded_key, hash_value)
+            if slot < 0 and self.field(COUNT) + self.field(DELETED_SLOTS) + 1 > self.capacity * MAX_LOAD:
+                if self.field(COUNT) + 1 > self.capacity * MAX_LOAD:
+                    logger.error("set_value: Index of shared memory block %s is full.", self.name)
+                    return False
+                self.begin_change()
+                self.index.rebuild(self.index.entries())
+                self.set_field(DELETED_SLOTS, 0)
+                self.end_change()
+                slot, free = self.find(encoded_key, hash_value)
+
+            # Append the record first; it is invisible to readers until the index points at it
+            offset = self.field(DATA_USED)
+            start = self.data_base + offset
+            RECORD.pack_into(self.buffer, start, len(encoded_key), len(data))
+            start += RECORD.size
+            self.buffer[start:start + len(encoded_key)] = encoded_key
+            self.buffer[start + len(encoded_key):start + size - RECORD.size] = data
+            self.set_field(DATA_USED, offset + size)
+
+            self.begin_change()
+            if slot >= 0:
+                self.index.put(slot, hash_value, offset)
+            else:
+                if self.index.is_deleted(free):
+                    self.set_field(DELETED_SLOTS, self.field(DELETED_SLOTS) - 1)
+                self.index.put(free, hash_value, offset)
+                self.set_field(COUNT, self.field(COUNT) + 1)
+            self.end_change()
+            return True
+        finally:
+            self.lock.release()
+
+    def delete_value(self, key):
+        """
+        Deletes the key-value pair associated with the specified key.
+
+        :param key: The key of the key-value pair to delete.
+        :type key: str
+        :return: The value associated with the deleted key if it exists, otherwise None.
+        :rtype: any or None
+        """
+        encoded_key = key.encode('utf-8')
+        self.lock.acquire()
+        try:
+            self.check_intact()
+            slot, _ = self.find(encoded_key, key_hash(encoded_key))
+            if slot < 0:
+                return None
+            data = bytes(self.record(self.index.get(slot)[1])[1])
+            self.begin_change()
+            self.index.remove(slot)
+            self.set_field(COUNT, self.field(COUNT) - 1)
+            self.set_field(DELETED_SLOTS, self.field(DELETED_SLOTS) + 1)
+            self.end_change()
+        finally:
+            self.lock.release()
+        return pickle.loads(data)
+
+    def compact(self):
+        """
+        Rewrites the record area with only the live records, reclaiming space left by updates and deletes.
+        Must be called while holding the writer lock.
+        """
+        records = []
+        for hash_value, offset in self.index.entries():
+            start = self.data_base + offset
+            key_length, value_length = RECORD.unpack_from(self.buffer, start)
+            records.append((hash_value, bytes(self.buffer[start:start + RECORD.size + key_length + value_length])))
+        self.begin_change()
+        offset = 0
+        relocated = []
+        for hash_value, record in records:
+            self.buffer[self.data_base + offset:self.data_base + offset + len(record)] = record
+            relocated.append((hash_value, offset))
+            offset += len(record)
+        self.index.rebuild(relocated)
+        self.set_field(DATA_USED, offset)
+        self.set_field(DELETED_SLOTS, 0)
+        self.end_change()
+        logger.info("compact: Kept %d records, %d bytes in use.", len(records), offset)
+
+    def __len__(self):
+        """
+        Returns the number of live keys.
+        """
+        return self.field(COUNT)
+
+    def close(self):
+        """
+        Detaches this process from the shared memory block.
+        """
+        self.buffer = None
+        self.index = None
+        self.memory.close()
+
+    def unlink(self):
+        """
+        Destroys the shared memory block once every process has closed it.
+        """
+        if os.name != 'nt':
+            resource_tracker.register(self.memory._name, 'shared_memory')  # unlink() unregisters it again
+        self.memory.unlink()
+
+
+if __name__ == '__main__':
+    from multiprocessing_test import ProcessTest
+
+    test_name = f'shared_database_test_{os.getpid()}'
+    db = SharedMemoryDatabase(test_name, capacity=16, data_size=4096)
+
+    # Test set, update, get and delete
+    assert db.set_value(10, 'a') == True, "Failed to set key 'a'"
+    assert db.get_value('a') == 10, "Failed to get value for key 'a'"
+    assert db.set_value((1, 2), 'a') == True, "Failed to update key 'a'"
+    assert db.get_value('a') == (1, 2), "Non-JSON values must round trip"
+    assert db.get_value('b') is None, "Non-existent key 'b' should return None"
+    assert db.delete_value('a') == (1, 2), "Failed to delete key 'a'"
+    assert db.get_value('a') is None, "Key 'a' should be deleted and return None"
+
+    # Updates past the end of the record area are compacted away
+    for i in range(500):
+        assert db.set_value('x' * 20, 'churn'), "Compaction did not reclaim space"
+    assert len(db) == 1, "Expected one live key"
+
+    # A second handle on the same name sees the same live data
+    other = SharedMemoryDatabase(test_name)
+    assert other.get_value('churn') == 'x' * 20, "Attached handle does not see the data"
+    other.close()
+
+    # Writes made by child processes are visible to the parent without reloading anything
+    test = ProcessTest()
+    test.data_base = db
+    test.test_all()
+    for key in ('test 3', 'test 4', 'test 6', 'test 7'):
+        assert db.get_value(key) is not None, f"Parent does not see the children's write to {key!r}"
+
+    db.close()
+    db.unlink()
+
+    # A writer dying mid-change makes readers and writers fail instead of waiting forever
+    import multiprocessing
+    broken = SharedMemoryDatabase(f'{test_name}_broken', capacity=16, data_size=4096)
+    broken.set_value(1, 'a')
+
+    def die_mid_change():
+        broken.lock.acquire()
+        broken.begin_change()
+        os._exit(1)
+
+    writer = multiprocessing.Process(target=die_mid_change)
+    writer.start()
+    writer.join()
+    for operation in (lambda: broken.get_value('a'), lambda: broken.set_value(2, 'a')):
+        try:
+            operation()
+            raise AssertionError("An operation went ahead on a half-changed block")
+        except ValueError:
+            pass
+    broken.close()
+    broken.unlink()
+    print("All assertions passed.")
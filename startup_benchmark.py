@@ -0,0 +1,81 @@
+import multiprocessing
+import os
+import sys
+import time
+
+from file_database import FileDatabase
+from load_benchmark import peak_rss
+
+KEY_COUNT = 200000
+VALUE_SIZE = 100
+PATHS = {
+    'snapshot json': dict(persistence='snapshot', file_path='startup_benchmark.json'),
+    'snapshot binary': dict(persistence='snapshot', codec='binary', file_path='startup_benchmark.bin'),
+    'mmap (lazy)': dict(persistence='mmap', file_path='startup_benchmark.dat'),
+}
+
+
+def write_datasets(key_count, value_size, modes):
+    """
+    Writes the same keys in each persistence format, the mmap store through FileDatabase.export_mmap().
+    """
+    items = {f'key {i}': f'{i:>{value_size}}' for i in range(key_count)}
+    source = None
+    for mode in modes:
+        settings = PATHS[mode]
+        if settings['persistence'] == 'mmap':
+            if source is None:
+                source = FileDatabase('snapshot', file_path='startup_benchmark_source.json')
+                source.dict = items
+            source.export_mmap(settings['file_path'])
+        else:
+            db = FileDatabase(**settings)
+            db.set_many(items)  # One save of the whole dictionary
+            db.io.close(db.handle)
+    if source is not None:
+        source.io.close(source.handle)
+        os.remove('startup_benchmark_source.json')
+
+
+def data_files(mode):
+    """
+    Returns the files a mode keeps its data in.
+    """
+    path = PATHS[mode]['file_path']
+    return [path, os.path.splitext(path)[0] + '.idx'] if PATHS[mode]['persistence'] == 'mmap' else [path]
+
+
+def open_worker(mode, key, results):
+    """
+    Opens a database the way a freshly started worker process does and reads one key.
+    """
+    baseline = peak_rss()
+    start = time.perf_counter()
+    db = FileDatabase(**PATHS[mode])
+    db.load()
+    opened = time.perf_counter()
+    val = db.get_value(key)
+    elapsed = time.perf_counter() - opened
+    results.put((opened - start, elapsed, val is not None, baseline, peak_rss()))
+
+
+if __name__ == '__main__':
+    key_count = int(sys.argv[1]) if len(sys.argv) > 1 else KEY_COUNT
+    value_size = int(sys.argv[2]) if len(sys.argv) > 2 else VALUE_SIZE
+    modes = sys.argv[3:] or list(PATHS)  # e.g. only 'mmap (lazy)' for stores too large to parse
+    write_datasets(key_count, value_size, modes)
+    print(f'{key_count} keys of {value_size} byte values')
+
+    results = multiprocessing.Queue()
+    for mode in modes:
+        size = sum(os.path.getsize(path) for path in data_files(mode))
+        process = multiprocessing.Process(target=open_worker, args=(mode, f'key {key_count // 2}', results))
+        process.start()
+        open_time, read_time, found, baseline, peak = results.get()
+        process.join()
+        assert found, f"{mode} did not find the key"
+        memory = '' if peak is None else f', peak RSS +{(peak - baseline) / 2 ** 20:7.1f} MiB'
+        print(f'{mode:>16}: {size / 2 ** 20:8.1f} MiB on disk, open {open_time * 1000:9.2f} ms, '
+              f'first read {read_time * 1e6:7.0f} us{memory}')
+        for path in data_files(mode):
+            os.remove(path)
@@ -0,0 +1,175 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+
+from metrics import Histogram
+from sync_database import SyncDatabase
+
+SUBSCRIBERS = 1000
+UPDATES = 100  # Changes of the watched key per fan-out measurement
+UPDATE_INTERVAL = 0.01  # Seconds between them
+POLLERS = 16  # Threads polling get_value() in the idle cost comparison
+WRITES = 2000
+
+
+def open_database():
+    """
+    Returns a SyncDatabase writing to files of this process, and a function removing them.
+    """
+    paths = dict(file_path=f'subscription_benchmark_{os.getpid()}.pkl',
+                 log_path=f'subscription_benchmark_{os.getpid()}.wal')
+    db = SyncDatabase('threading', persistence='log', **paths)
+
+    def remove():
+        db.close()
+        db.io.close(db.handle)
+        db.io.close(db.log_handle)
+        for path in paths.values():
+            os.remove(path)
+
+    return db, remove
+
+
+def write_updates(db):
+    """
+    Sets the watched key UPDATES times, each value being its commit time, then a final None to stop consumers.
+    """
+    for _ in range(UPDATES):
+        db.set_value(time.perf_counter_ns(), 'watched')
+        time.sleep(UPDATE_INTERVAL)
+    db.set_value(None, 'watched')
+
+
+def fan_out(mode, subscribers):
+    """
+    Delivers every update of one key to `subscribers` subscriptions consumed by callbacks, by one thread
+    each blocking in get(), or by one coroutine each in a single event loop.
+
+    :return: Delivered events per second, and the latency histogram from commit to consumption in ns.
+    :rtype: tuple
+    """
+    db, remove = open_database()
+    latencies = Histogram()
+
+    def consume(event):
+        if event[2] is not None:
+            latencies.record(time.perf_counter_ns() - event[2])
+
+    start = time.perf_counter()
+    if mode == 'callback':
+        subscriptions = [db.subscribe(keys=['watched'], callback=consume, coalesce=False)
+                         for _ in range(subscribers)]
+        write_updates(db)
+        while subscriptions[-1].delivered < UPDATES + 1:
+            time.sleep(0.001)
+    elif mode == 'queue':
+        subscriptions = [db.subscribe(keys=['watched'], coalesce=False) for _ in range(subscribers)]
+
+        def worker(subscription):
+            for event in subscription:
+                if event[2] is None:
+                    return
+                consume(event)
+
+        threads = [threading.Thread(target=worker, args=(subscription,)) for subscription in subscriptions]
+        for thread in threads:
+            thread.start()
+        write_updates(db)
+        for thread in threads:
+            thread.join()
+    else:
+        subscriptions = [db.subscribe(keys=['watched'], coalesce=False) for _ in range(subscribers)]
+
+        async def worker(subscription):
+            async for event in subscription:
+                if event[2] is None:
+                    return
+                consume(event)
+
+        async def main():
+            writer = asyncio.get_running_loop().run_in_executor(None, write_updates, db)
+            await asyncio.gather(*(worker(subscription) for subscription in subscriptions))
+            await writer
+
+        asyncio.run(main())
+    elapsed = time.perf_counter() - start
+    for subscription in subscriptions:
+        subscription.close()
+    remove()
+    return latencies.count / elapsed, latencies.snapshot()
+
+
+def coalescing(subscribers):
+    """
+    Changes one key as fast as possible while subscribers are busy, then lets them catch up.
+
+    :return: Events queued per subscription, and whether each got the final value.
+    :rtype: tuple
+    """
+    db, remove = open_database()
+    subscriptions = [db.subscribe(keys=['hot']) for _ in range(subscribers)]
+    for i in range(WRITES):
+        db.set_value(i, 'hot')
+    while subscriptions[-1].delivered < WRITES:
+        time.sleep(0.01)
+    queued = [subscription.get_all() for subscription in subscriptions]
+    for subscription in subscriptions:
+        subscription.close()
+    remove()
+    return sum(len(events) for events in queued) / subscribers, all(events == [('s', 'hot', WRITES - 1)]
+                                                                     for events in queued)
+
+
+def write_rate(watchers):
+    """
+    Measures set_value() throughput while POLLERS threads poll a key, SUBSCRIBERS idle subscriptions watch
+    it, or nothing watches it.
+
+    :rtype: float
+    """
+    db, remove = open_database()
+    db.set_value(0, 'status')
+    stop = threading.Event()
+    threads, subscriptions = [], []
+    if watchers == 'polling':
+        def poll():
+            while not stop.is_set():
+                db.get_value('status')
+                time.sleep(0)
+
+        threads = [threading.Thread(target=poll) for _ in range(POLLERS)]
+        for thread in threads:
+            thread.start()
+    elif watchers == 'subscribed':
+        subscriptions = [db.subscribe(keys=['status']) for _ in range(SUBSCRIBERS)]
+    start = time.perf_counter()
+    for i in range(WRITES):
+        db.set_value(i, f'other {i}')  # Writes to other keys, so subscribers stay idle
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for thread in threads:
+        thread.join()
+    for subscription in subscriptions:
+        subscription.close()
+    remove()
+    return WRITES / elapsed
+
+
+if __name__ == '__main__':
+    subscribers = int(sys.argv[1]) if len(sys.argv) > 1 else SUBSCRIBERS
+    print(f'{subscribers} subscribers of one key, {UPDATES} updates {UPDATE_INTERVAL * 1000:.0f} ms apart')
+    for mode in ('callback', 'queue', 'async'):
+        rate, latency = fan_out(mode, subscribers)
+        print(f'{mode:>8}: {rate:9.0f} events/s delivered, commit to consumer p50 {latency["p50"] / 1e6:6.2f} ms, '
+              f'p99 {latency["p99"] / 1e6:6.2f} ms, max {latency["max"] / 1e6:6.2f} ms')
+
+    queued, latest = coalescing(subscribers)
+    print(f'coalescing: {WRITES} rapid updates left {queued:.1f} queued events per subscriber, '
+          f'{"all" if latest else "not all"} holding the latest value')
+
+    for watchers in ('nothing', 'polling', 'subscribed'):
+        label = {'nothing': 'no watchers', 'polling': f'{POLLERS} polling threads',
+                 'subscribed': f'{SUBSCRIBERS} idle subscriptions'}[watchers]
+        print(f'{label:>26}: {write_rate(watchers):8.0f} writes/s')
@@ -0,0 +1,384 @@
+import asyncio
+import threading
+from collections import deque
+
+from change_feed import FEED_BATCH, POLL_TIMEOUT
+from tracing import logger, tracer
+
+GAP = 'g'  # The kind of event telling subscribers that changes were lost
+GAP_KEY = object()  # Where a coalescing subscription queues its gap event, apart from every key
+
+
+def wake(events):
+    """
+    Sets asyncio events, in their event loop.
+    """
+    for event in events:
+        event.set()
+
+
+class Subscription:
+    def __init__(self, hub, keys=None, prefix=None, callback=None, coalesce=True):
+        """
+        Receives the set and delete events of some keys, as ('s', key, value) and ('d', key) records, from the
+        SubscriptionHub of a database, either by calling `callback` from the hub's thread, or by queueing them
+        for get(), iteration or async iteration. Waiting for an event takes no database lock.
+
+        Without `coalesce`, every event is delivered in commit order. With it, a queued event is replaced in
+        place by a later event of the same key that arrives before it is taken, so a slow consumer receives the
+        latest state of each key instead of every intermediate update, and the queue never holds more events
+        than there are matching keys. Each key's events still come in commit order, but events of different
+        keys come in the order the keys first changed since the queue was last emptied, which is not the order
+        of their latest commits.
+
+        If the hub falls behind the changes the feed keeps, the lost events are replaced by a (GAP, count)
+        event, `count` being the number of lost commits. The watched keys may have changed meanwhile, so
+        a consumer receiving it must read them again.
+
+        :param hub: The hub that delivers the events.
+        :type hub: SubscriptionHub
+        :param keys: The keys to watch, or None.
+        :type keys: iterable or None
+        :param prefix: Watch every string key starting with this, or None. '' watches every key.
+        :type prefix: str or None
+        :param callback: Called with each event from the hub's thread, instead of queueing it. It must be quick,
+                         since it delays the delivery to every other subscription.
+        :type callback: callable or None
+        :param coalesce: Replace queued events of a key by its later events.
+        :type coalesce: bool
+        """
+        if keys is None and prefix is None:
+            raise ValueError("Subscribe to keys, a prefix or both.")
+        self.hub = hub
+        self.keys = None if keys is None else frozenset(keys)
+        self.prefix = prefix
+        self.callback = callback
+        self.coalesce = coalesce
+        self.pending = {} if coalesce else deque()  # Key -> latest event, in the order keys first changed
+        self.ready = threading.Condition()
+        self.loop = None  # The event loop and event of a coroutine waiting in __anext__()
+        self.wakeup = None
+        self.closed = False
+        self.delivered = 0
+        self.coalesced = 0
+
+    def deliver(self, record):
+        """
+        Passes on one event. Called from the hub's thread.
+
+        :return: The event loop and event of a waiting coroutine, which the caller must wake, or None.
+        :rtype: tuple or None
+        """
+        self.delivered += 1
+        if self.callback is not None:
+            try:
+                self.callback(record)
+            except Exception:
+                logger.exception("deliver: A subscription callback failed on %r.", record[1])
+            return None
+        with self.ready:
+            if self.coalesce:
+                key = record[1]
+                if record[0] == GAP:
+                    key = GAP_KEY
+                    if key in self.pending:
+                        record = (GAP, self.pending[key][1] + record[1])
+                if key in self.pending:
+                    self.coalesced += 1
+                self.pending[key] = record
+            else:
+                self.pending.append(record)
+            self.ready.notify()
+            if self.wakeup is None:
+                return None
+            waiting = self.loop, self.wakeup
+            self.loop = self.wakeup = None  # Woken once, however many events arrive before it runs
+            return waiting
+
+    def take(self):
+        """
+        Removes and returns the oldest queued event. Called holding the condition, with events queued.
+        """
+        if self.coalesce:
+            key = next(iter(self.pending))
+            return self.pending.pop(key)
+        return self.pending.popleft()
+
+    def get(self, timeout=None):
+        """
+        Waits for the next event.
+
+        :param timeout: Seconds to wait, or None to wait until an event arrives or the subscription is closed.
+        :type timeout: float or None
+        :return: The event, or None on timeout or once closed.
+        :rtype: tuple or None
+        """
+        with self.ready:
+            if not self.ready.wait_for(lambda: self.pending or self.closed, timeout) or not self.pending:
+                return None
+            return self.take()
+
+    def get_all(self):
+        """
+        Removes and returns every queued event without waiting.
+
+        :rtype: list
+        """
+        with self.ready:
+            events = list(self.pending.values()) if self.coalesce else list(self.pending)
+            self.pending.clear()
+            return events
+
+    def __iter__(self):
+        """
+        Yields events as they arrive, until the subscription is closed.
+        """
+        while True:
+            event = self.get()
+            if event is None:
+                return
+            yield event
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        """
+        Suspends the coroutine until the next event, without blocking the event loop or holding a thread.
+        """
+        while True:
+            with self.ready:
+                if self.pending:
+                    return self.take()
+                if self.closed:
+                    raise StopAsyncIteration
+                self.loop = asyncio.get_running_loop()
+                self.wakeup = wakeup = asyncio.Event()
+            try:
+                await wakeup.wait()
+            finally:
+                with self.ready:
+                    if self.wakeup is wakeup:
+                        self.loop = self.wakeup = None
+
+    def close(self):
+        """
+        Stops the delivery of events. Waiting consumers return, events already queued can still be taken.
+        """
+        self.hub.remove(self)
+        with self.ready:
+            self.closed = True
+            self.ready.notify_all()
+            loop, wakeup = self.loop, self.wakeup
+        if wakeup is not None:
+            loop.call_soon_threadsafe(wakeup.set)
+
+
+class SubscriptionHub:
+    def __init__(self, feed):
+        """
+        Delivers the changes of a ChangeFeed to subscriptions from a background thread, which reads the feed
+        without taking the database lock, so writers only pay for appending to the feed however many
+        subscriptions there are.
+
+        Subscriptions are indexed by key and by prefix, so matching a change costs one lookup for its key
+        plus one per distinct prefix length, not one test per subscription.
+
+        :param feed: The feed to follow from its current sequence.
+        :type feed: ChangeFeed
+        """
+        self.feed = feed
+        self.sequence = feed.sequence
+        self.by_key = {}  # Key -> subscriptions watching it
+        self.by_prefix = {}  # Prefix -> subscriptions watching it
+        self.prefix_lengths = {}  # Length -> number of distinct prefixes of that length
+        self.lock = threading.Lock()
+        self.lost = 0  # Batches dropped from the feed before they could be delivered
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='subscription-hub', daemon=True)
+        self.thread.start()
+
+    def subscribe(self, keys=None, prefix=None, callback=None, coalesce=True):
+        """
+        Creates a subscription, see Subscription.
+
+        :rtype: Subscription
+        """
+        subscription = Subscription(self, keys, prefix, callback, coalesce)
+        with self.lock:
+            for key in subscription.keys or ():
+                self.by_key.setdefault(key, set()).add(subscription)
+            if prefix is not None:
+                watchers = self.by_prefix.setdefault(prefix, set())
+                if not watchers:
+                    self.prefix_lengths[len(prefix)] = self.prefix_lengths.get(len(prefix), 0) + 1
+                watchers.add(subscription)
+        return subscription
+
+    def remove(self, subscription):
+        """
+        Unregisters a subscription.
+        """
+        with self.lock:
+            for key in subscription.keys or ():
+                watchers = self.by_key.get(key)
+                if watchers is not None:
+                    watchers.discard(subscription)
+                    if not watchers:
+                        del self.by_key[key]
+            prefix = subscription.prefix
+            watchers = self.by_prefix.get(prefix) if prefix is not None else None
+            if watchers is not None and subscription in watchers:
+                watchers.discard(subscription)
+                if not watchers:
+                    del self.by_prefix[prefix]
+                    self.prefix_lengths[len(prefix)] -= 1
+                    if not self.prefix_lengths[len(prefix)]:
+                        del self.prefix_lengths[len(prefix)]
+
+    def matching(self, key):
+        """
+        Returns the subscriptions watching a key. Called holding the lock.
+
+        :rtype: set
+        """
+        matched = set(self.by_key.get(key, ()))
+        if isinstance(key, str):
+            for length in self.prefix_lengths:
+                watchers = self.by_prefix.get(key[:length]) if length <= len(key) else None
+                if watchers:
+                    matched |= watchers
+        return matched
+
+    def dispatch(self, batches):
+        """
+        Delivers the events of change batches to the subscriptions watching their keys.
+        """
+        delivered = 0
+        waiting = {}  # Event loop -> events of its coroutines to set, with one call per loop
+        for _, _, records in batches:
+            for record in records:
+                with self.lock:
+                    subscriptions = self.matching(record[1])
+                for subscription in subscriptions:
+                    wakeup = subscription.deliver(record)
+                    if wakeup is not None:
+                        waiting.setdefault(wakeup[0], []).append(wakeup[1])
+                delivered += len(subscriptions)
+        self.wake_all(waiting)
+        if tracer.enabled:
+            logger.info("dispatch: Delivered %d events from %d batches.", delivered, len(batches))
+
+    def notify_gap(self, lost):
+        """
+        Delivers a (GAP, lost) event to every subscription, since any of their keys may have changed.
+        """
+        with self.lock:
+            subscriptions = set().union(*self.by_key.values(), *self.by_prefix.values())
+        waiting = {}
+        for subscription in subscriptions:
+            wakeup = subscription.deliver((GAP, lost))
+            if wakeup is not None:
+                waiting.setdefault(wakeup[0], []).append(wakeup[1])
+        self.wake_all(waiting)
+
+    def wake_all(self, waiting):
+        """
+        Wakes waiting coroutines with one call per event loop.
+
+        :param waiting: Event loop -> events of its coroutines to set.
+        :type waiting: dict
+        """
+        for loop, events in waiting.items():
+            try:
+                loop.call_soon_threadsafe(wake, events)
+            except RuntimeError:  # The loop was closed while its coroutines waited
+                pass
+
+    def run(self):
+        """
+        Background loop following the feed.
+        """
+        while not self.stopped.is_set():
+            batches = self.feed.read(self.sequence, POLL_TIMEOUT, FEED_BATCH)
+            if batches is None:
+                # Fell behind the batches the feed keeps: their events are lost, tell every subscription
+                # and continue with new ones
+                sequence = self.feed.sequence
+                lost = sequence - self.sequence
+                self.lost += lost
+                logger.error("run: Subscriptions missed %d change batches.", lost)
+                self.notify_gap(lost)
+                self.sequence = sequence
+            elif batches:
+                self.dispatch(batches)
+                self.sequence = batches[-1][0]
+
+    def close(self):
+        """
+        Stops delivering events and closes every subscription.
+        """
+        self.stopped.set()
+        self.thread.join()
+        with self.lock:
+            subscriptions = set().union(*self.by_key.values(), *self.by_prefix.values())
+        for subscription in subscriptions:
+            subscription.close()
+
+
+if __name__ == '__main__':
+    import time
+    from change_feed import ChangeFeed
+
+    feed = ChangeFeed()
+    hub = SubscriptionHub(feed)
+    received = []
+    by_callback = hub.subscribe(keys=['a'], callback=received.append)
+    by_queue = hub.subscribe(prefix='user:')
+    every = hub.subscribe(prefix='', coalesce=False)
+    feed.append([('s', 'a', 1), ('s', 'user:1', 'x'), ('s', 'other', 0)])
+    feed.append([('s', 'user:1', 'y'), ('d', 'user:2'), ('s', 'user:1', 'z')])
+    deadline = time.monotonic() + 5
+    while every.delivered < 6 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert received == [('s', 'a', 1)], "The callback got the wrong events"
+    assert by_queue.get_all() == [('s', 'user:1', 'z'), ('d', 'user:2')], "Updates were not coalesced"
+    assert by_queue.coalesced == 2 and by_queue.get(timeout=0.01) is None, "Wrong coalescing count"
+    assert len(every.get_all()) == 6, "An uncoalesced subscription lost events"
+
+    # Async iteration suspends the coroutine until an event arrives
+    async def consume():
+        events = []
+        async for event in by_queue:
+            events.append(event)
+            if len(events) == 2:
+                by_queue.close()
+        return events
+
+    def produce():
+        time.sleep(0.05)
+        feed.append([('s', 'user:3', 1)])
+        feed.append([('s', 'user:4', 2)])
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    assert asyncio.run(consume()) == [('s', 'user:3', 1), ('s', 'user:4', 2)], "Async iteration missed events"
+    producer.join()
+    assert 'user:' not in hub.by_prefix and 0 in hub.prefix_lengths, "A closed subscription stayed registered"
+
+    # Events lost to a hub fallen behind the feed are replaced by a gap event
+    gap_feed = ChangeFeed(capacity=2)
+    gap_hub = SubscriptionHub(gap_feed)
+    watcher = gap_hub.subscribe(keys=['y'])
+    with gap_hub.lock:  # Holds the hub in its first dispatch while the feed moves on
+        gap_feed.append([('s', 'x', 0)])
+        time.sleep(0.05)
+        for i in range(10):
+            gap_feed.append([('s', 'y', i)])
+    assert watcher.get(timeout=5) == (GAP, 10) and gap_hub.lost == 10, "Subscribers were not told of the gap"
+    gap_hub.close()
+
+    hub.close()
+    assert len(every.get_all()) == 2 and every.get() is None, "A closed subscription kept waiting"
+    assert by_callback.closed and not hub.by_key, "Closing the hub did not close its subscriptions"
+    print("All assertions passed.")
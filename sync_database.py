@@ -1,104 +1,629 @@
-import win32event
-import win32api
-import win32con
 import logging
-from file_database import FileDatabase
+import time
+from file_database import FileDatabase, FILE_PATH, LOG_PATH
+from dict_database import is_hashable
+from tracing import logger, tracer, configure_tracing
+from metrics import metrics
+from rwlock import ReadWriteLock, SemaphoreReadWriteLock
+from mvcc import VersionStore, DELETED
+from indexes import MISSING
+from transaction import Transaction, TransactionConflict, run_transaction, MAX_RETRIES
+from ttl import Reaper, REAP_INTERVAL
+from change_feed import ChangeFeed, FEED_CAPACITY, FEED_BATCH, POLL_TIMEOUT
+from subscriptions import SubscriptionHub
 
 MAX_READERS = 10
-logging.basicConfig(filename='sync_database.log', level=logging.DEBUG)
+REAP_BATCH = 10000  # Expired keys deleted per write lock acquisition, so the reaper never stalls writers for long
+MAX_STAMPS = 1 << 16  # Keys stamped individually for transactions; the older half is pruned past this
 
 class SyncDatabase(FileDatabase):
-    def __init__(self, mode):
+    def __init__(self, mode, backend=None, lock=None, prefer_writers=True, persistence='snapshot',
+                 file_path=FILE_PATH, log_path=LOG_PATH, durability='none', codec='json',
+                 cache_bytes=None, cache_policy='lru', reap_interval=REAP_INTERVAL, engine='dict', lock_name=None):
         """
         Initializes an instance of the SyncDatabase class, extending FileDatabase.
-        Uses win32event objects for synchronization with threading or multiprocessing.
+        Synchronizes readers and writers across threads or processes with a reader-writer lock.
+
+        :param mode: 'threading' to synchronize threads, 'multiprocessing' to also synchronize processes.
+        :type mode: str
+        :param backend: The lock and file I/O backend name ('win32' or 'posix'), or None for the platform's native one.
+        :type backend: str or None
+        :param lock: 'rwlock' for a counter and condition reader-writer lock with constant-time writer acquisition,
+                     'semaphores' for the original scheme where a writer collects all MAX_READERS semaphore units,
+                     'mvcc' (threading mode only) for multi-version reads: writers still take the 'rwlock' lock
+                     to serialize with each other and publish each change as a new version, while readers take
+                     no lock and read the versions committed when they started (see mvcc.py).
+                     None picks 'rwlock' in threading mode and 'semaphores' in multiprocessing mode, whose named
+                     system-wide objects synchronize any process opening the database. In multiprocessing mode,
+                     'rwlock' only synchronizes this process with the children it starts afterwards.
+        :type lock: str or None
+        :param prefer_writers: With 'rwlock', queue new readers behind waiting writers so writers cannot starve.
+        :type prefer_writers: bool
+        :param persistence: The FileDatabase persistence mode.
+        :type persistence: str
+        :param file_path: The snapshot file.
+        :type file_path: str
+        :param log_path: The write-ahead log file, used in log mode.
+        :type log_path: str
+        :param durability: The FileDatabase durability mode. With 'group', writers wait for their sync after
+                           releasing the write lock, so writers queued behind them are covered by the same sync.
+        :type durability: str
+        :param codec: The FileDatabase serialization codec.
+        :type codec: str
+        :param cache_bytes: The FileDatabase mmap mode cache budget in bytes, or None for no cache.
+        :type cache_bytes: int or None
+        :param cache_policy: The cache eviction policy, 'lru' or 'arc'.
+        :type cache_policy: str
+        :param reap_interval: Seconds between runs of the background thread deleting expired keys, started by
+                              the first set with a TTL, or None to leave reaping to reap_expired() calls.
+        :type reap_interval: float or None
+        :param engine: The DictDatabase storage engine, 'dict' or 'arena'.
+        :type engine: str
+        :param lock_name: With 'semaphores' in multiprocessing mode, the name of the system-wide lock, which every
+                          process opening the same database must share, or None for the original fixed name.
+        :type lock_name: str or None
         """
-        super().__init__()
+        super().__init__(persistence, backend=backend, file_path=file_path, log_path=log_path, durability=durability,
+                         codec=codec, cache_bytes=cache_bytes, cache_policy=cache_policy, engine=engine)
         self.mode = mode
-        logging.info(f"Initializing SyncDatabase in {mode} mode.")
-
-        if self.mode == 'threading':
-            self.sem_lock = win32event.CreateMutex(None, False, None)
-            self.sem = win32event.CreateSemaphore(None, MAX_READERS, MAX_READERS, None)
-        elif self.mode == 'multiprocessing':
-            # Create a named global mutex
-            self.sem_lock = win32event.CreateMutex(None, False, "Global\\MyGlobalMutex")
-            if not self.sem_lock:
-                raise Exception("Failed to create or open the global mutex.")
-            self.sem = win32event.CreateSemaphore(None, MAX_READERS, MAX_READERS, "Global\\MyGlobalSemaphore")
-            if not self.sem:
-                raise Exception("Failed to create or open the global semaphore.")
+        self.reap_interval = reap_interval
+        self.reaper = None
+        if lock is None:
+            lock = 'semaphores' if mode == 'multiprocessing' else 'rwlock'
+        logger.info("Initializing SyncDatabase in %s mode with %s locking.", mode, lock)
+
+        self.versions = None
+        self.feed = None  # The ChangeFeed of committed changes, created by enable_feed()
+        self.hub = None  # The SubscriptionHub delivering the feed to subscribe() callers
+        self.stamps = None  # Key -> commit count when it last changed, from the first transactional read on
+        self.stamp_watermark = 0  # The stamp of every key missing from stamps, no older than its last change
+        self.commits = 0
+        if lock == 'rwlock':
+            self.lock = ReadWriteLock(mode, prefer_writers, MAX_READERS)
+        elif lock == 'semaphores':
+            self.lock = SemaphoreReadWriteLock(self.backend, mode, MAX_READERS, lock_name)
+        elif lock == 'mvcc':
+            if mode != 'threading':
+                raise ValueError("MVCC reads need threading mode, since the versions live in this process.")
+            self.lock = ReadWriteLock(mode, prefer_writers)  # Only writers take it
+            self.versions = VersionStore(self.dict.items())
         else:
-            logging.error("Invalid mode specified.")
-            raise ValueError("Mode must be either 'threading' or 'multiprocessing'.")
+            logger.error("Invalid lock specified.")
+            raise ValueError("Lock must be 'rwlock', 'semaphores' or 'mvcc'.")
+
+    def get_write_access(self):
+        """
+        Requests exclusive write access, blocking additional read access.
+        """
+        if metrics.enabled:
+            start = time.perf_counter_ns()
+            self.lock.acquire_write()
+            metrics.record('lock_write_wait', time.perf_counter_ns() - start)
+            metrics.start_hold('lock_write_hold')
+            return
+        self.lock.acquire_write()
+
+    def end_write(self):
+        """
+        Ends exclusive write access, allowing read access.
+        """
+        if metrics.enabled:
+            metrics.end_hold('lock_write_hold')
+        self.lock.release_write()
+
+    def load(self):
+        """
+        Loads the dictionary state from the files. With MVCC reads, the loaded state becomes the first version.
+        """
+        if self.versions is None:
+            return super().load()
+        self.get_write_access()
+        try:
+            super().load()
+            self.versions = VersionStore(self.dict.items())
+        finally:
+            self.end_write()
+
+    def publish(self, changes):
+        """
+        Stamps changed keys for transaction validation and publishes the changes as one new version for MVCC
+        readers. Called with write access, after the changes were applied.
+
+        :param changes: (key, value) pairs, with the value DELETED for a delete.
+        :type changes: list
+        """
+        if not changes:
+            return
+        if self.versions is not None:
+            self.versions.commit(changes)  # Before the stamps, so a stamp is never newer than the value read
+        if self.feed is not None:
+            self.feed.append([('d', key) if val is DELETED else ('s', key, val) for key, val in changes])
+        self.commits += 1
+        stamps = self.stamps
+        if stamps is None:
+            return
+        for key, _ in changes:
+            stamps.pop(key, None)  # Inserted again at the end, so the stamps stay ordered oldest first
+            stamps[key] = self.commits
+        if len(stamps) > MAX_STAMPS:
+            self.prune_stamps()
+
+    def prune_stamps(self):
+        """
+        Drops the older half of the stamps, raising the watermark to the newest one dropped. A transaction that
+        read one of those keys before then sees a newer stamp and conflicts, which is safe: a stamp only has to
+        change whenever its key does. Called with write access.
+        """
+        stamps = list(self.stamps.items())
+        cut = len(stamps) - MAX_STAMPS // 2
+        self.stamp_watermark = stamps[cut - 1][1]
+        self.stamps = dict(stamps[cut:])
+        logger.info("prune_stamps: Kept %d stamps, watermark at commit %d.", len(self.stamps), self.stamp_watermark)
+
+    def enable_stamps(self):
+        """
+        Starts stamping changed keys, so that writes cost nothing extra until a transaction reads. Keys changed
+        before then share the current commit count as their stamp.
+        """
+        self.get_write_access()
+        try:
+            if self.stamps is None:
+                self.stamp_watermark = self.commits
+                self.stamps = {}
+        finally:
+            self.end_write()
+
+    def stamp(self, key):
+        """
+        Returns the stamp of a key's last change, or the watermark if it is not stamped individually.
+        """
+        stamps, watermark = self.stamps, self.stamp_watermark
+        return stamps.get(key, watermark) if stamps is not None else watermark
+
+    def apply_set(self, val, key, ttl=None):
+        """
+        Sets and persists a value, then publishes it. Called with write access.
+        """
+        response, ticket = super().apply_set(val, key, ttl)
+        if response:
+            self.publish([(key, val)])
+        return response, ticket
+
+    def apply_delete(self, key, default=None):
+        """
+        Deletes a key and persists the deletion, then publishes it. Called with write access.
+        """
+        val, ticket = super().apply_delete(key, MISSING)
+        if val is MISSING:
+            return default, ticket
+        self.publish([(key, DELETED)])
+        return val, ticket
+
+    def apply_set_many(self, items, ttl=None):
+        """
+        Sets and persists many key-value pairs, then publishes them as one change. Called with write access.
+        """
+        items = list(items.items() if hasattr(items, 'items') else items)
+        results, ticket = super().apply_set_many(items, ttl)
+        self.publish([(key, val) for key, val in items if is_hashable(key) and key in results])
+        return results, ticket
 
-    def catch_all_semaphores(self):
+    def apply_delete_many(self, keys, default=None):
         """
-        Acquires all reader semaphores, blocking additional read access.
+        Deletes many keys and persists the deletions, then publishes them as one change. Called with write access.
         """
-        win32event.WaitForSingleObject(self.sem_lock, win32event.INFINITE)
-        for _ in range(MAX_READERS):
-            win32event.WaitForSingleObject(self.sem, win32event.INFINITE)
-            print(f'sem number {_ + 1} acquired')
+        results, ticket = super().apply_delete_many(keys, MISSING)
+        self.publish([(key, DELETED) for key, val in results.items() if val is not MISSING])
+        if default is not MISSING:
+            results = {key: default if val is MISSING else val for key, val in results.items()}
+        return results, ticket
 
-    def release_all_semaphores(self):
+    def apply_records(self, records):
         """
-        Releases all reader semaphores, allowing read access.
+        Applies and persists a batch of sets and deletes, then publishes them as one change. Called with write access.
         """
-        for _ in range(MAX_READERS):
-            win32event.ReleaseSemaphore(self.sem, 1)
-            print('sem released')
-        win32event.ReleaseMutex(self.sem_lock)
+        applied, ticket = super().apply_records(records)
+        self.publish([(record[1], record[2]) if record[0] == 's' else (record[1], DELETED) for record in applied])
+        return applied, ticket
 
-    def set_value(self, val, key):
+    def begin(self):
+        """
+        Starts a transaction: read and write through it, then call its commit().
+
+        :rtype: Transaction
+        """
+        return Transaction(self)
+
+    def transact(self, function, retries=MAX_RETRIES):
+        """
+        Runs `function(transaction)` and commits the transaction, starting again if it conflicts.
+
+        :return: The result of the last call of `function`.
+        :rtype: any
+        :raises TransactionConflict: If it still conflicts after `retries` retries.
+        """
+        return run_transaction(self, function, retries)
+
+    def read_stamped(self, key):
+        """
+        Reads a value together with the stamp of its key's last change, for a transaction.
+
+        :return: The value or None, and the stamp.
+        :rtype: tuple
+        """
+        if self.stamps is None:
+            self.enable_stamps()
+        if self.versions is not None:
+            stamp = self.stamp(key)  # Read first, so the value is at least as new as the stamp
+            return self.read_version(key), stamp
+        self.get_read_access()
+        try:
+            return super().get_value(key), self.stamp(key)
+        finally:
+            self.end_read()
+
+    def commit_transaction(self, reads, records):
+        """
+        Validates a transaction's reads and applies its writes as one batch, under a single write lock
+        acquisition and with a single persist, then waits for durability outside the lock.
+
+        :param reads: The stamp each read key had when the transaction read it.
+        :type reads: dict
+        :param records: ['s', key, value] for a set or ['d', key] for a delete.
+        :type records: list
+        :return: The number of changes applied.
+        :rtype: int
+        :raises TransactionConflict: If a read key changed since, in which case nothing is applied.
+        """
+        self.get_write_access()
+        try:
+            conflicts = [key for key, stamp in reads.items() if self.stamp(key) != stamp]
+            if conflicts:
+                raise TransactionConflict(conflicts)
+            applied, ticket = self.apply_records(records)
+        finally:
+            self.end_write()
+        self.wait_durable(ticket)
+        return len(applied)
+
+    def set_value(self, val, key, ttl=None):
         """
         Writes a value to the database with exclusive access.
         """
-        self.catch_all_semaphores()
-        logging.info(f"Attempting to set {key} to {val}.")
-        response = super().set_value(val, key)
-        logging.debug(f'Write - {key}: {val}')
-        self.release_all_semaphores()
+        self.get_write_access()
+        try:
+            response, ticket = self.apply_set(val, key, ttl)
+        finally:
+            self.end_write()
+        self.wait_durable(ticket)  # Outside the lock, so concurrent writers can share one sync
         return response
 
     def get_value(self, key):
         """
-        Reads a value from the database with shared read access.
+        Reads a value from the database with shared read access, or with MVCC reads, the newest committed
+        version without any lock.
         """
-        logging.info(f"Attempting to get value for {key}.")
+        if self.versions is not None:
+            return self.read_version(key)
         self.get_read_access()
-        val = super().get_value(key)
-        logging.debug(f'Read - {key}: {val}')
-        self.end_read()
+        try:
+            val = super().get_value(key)
+        finally:
+            self.end_read()
+        return val
+
+    def read_version(self, key):
+        """
+        Reads the newest committed version of a key without any lock, treating it as missing once expired.
+        """
+        val = self.versions.get(key)
+        if val is not None and self.expiry is not None and self.expiry.expired(key, time.monotonic()):
+            return None
         return val
 
+    def set_many(self, items, ttl=None):
+        """
+        Writes many key-value pairs under a single exclusive lock acquisition and a single persist.
+
+        :param items: A mapping of keys to values, or an iterable of (key, value) pairs.
+        :type items: dict or iterable
+        :param ttl: Seconds after which the keys expire, or None to keep them until deleted.
+        :type ttl: float or None
+        :return: True for each key that was set.
+        :rtype: dict
+        """
+        self.get_write_access()
+        try:
+            results, ticket = self.apply_set_many(items, ttl)
+        finally:
+            self.end_write()
+        self.wait_durable(ticket)
+        return results
+
+    def get_many(self, keys):
+        """
+        Reads many values under a single shared lock acquisition, so they are consistent with each other.
+
+        With MVCC reads, they are read from one snapshot instead.
+
+        :param keys: The keys to retrieve.
+        :type keys: iterable
+        :return: For each key, its value if it exists, otherwise None.
+        :rtype: dict
+        """
+        versions = self.versions
+        if versions is not None:
+            snapshot = versions.begin()
+            try:
+                results = {key: versions.read(key, snapshot) for key in keys}
+            finally:
+                versions.end(snapshot)
+            if self.expiry is not None:
+                expired, now = self.expiry.expired, time.monotonic()
+                for key in results:
+                    if expired(key, now):
+                        results[key] = None
+            return results
+        self.get_read_access()
+        try:
+            return super().get_many(keys)
+        finally:
+            self.end_read()
+
+    def delete_many(self, keys):
+        """
+        Deletes many keys under a single exclusive lock acquisition and a single persist.
+
+        :param keys: The keys to delete.
+        :type keys: iterable
+        :return: For each key, the deleted value if it existed, otherwise None.
+        :rtype: dict
+        """
+        self.get_write_access()
+        try:
+            results, ticket = self.apply_delete_many(keys)
+        finally:
+            self.end_write()
+        self.wait_durable(ticket)
+        return results
+
+    def enable_feed(self, capacity=FEED_CAPACITY):
+        """
+        Starts recording every committed change in a ChangeFeed, for replicas (see replication.py).
+        Changes committed before are only in the snapshots of feed_snapshot().
+
+        :param capacity: The number of batches kept for readers catching up.
+        :type capacity: int
+        :return: The feed.
+        :rtype: ChangeFeed
+        :raises ValueError: In multiprocessing mode, where other processes' changes would be missing.
+        """
+        if self.mode != 'threading':
+            raise ValueError("A change feed needs threading mode, since it only sees this process's commits.")
+        self.get_write_access()
+        try:
+            if self.feed is None:
+                self.feed = ChangeFeed(capacity)
+                logger.info("enable_feed: Recording committed changes.")
+            return self.feed
+        finally:
+            self.end_write()
+
+    def feed_snapshot(self):
+        """
+        Returns every key-value pair together with the feed sequence they are current at, with shared read
+        access, so a replica can load them and then follow the feed from that sequence.
+
+        :return: The feed's epoch, the sequence and a dict of every stored key-value pair.
+        :rtype: tuple
+        """
+        if self.feed is None:
+            self.enable_feed()
+        self.get_read_access()
+        try:
+            return self.feed.epoch, self.feed.sequence, dict(self.dict.items())
+        finally:
+            self.end_read()
+
+    def read_feed(self, after, timeout=POLL_TIMEOUT, limit=FEED_BATCH):
+        """
+        Returns the change batches committed after sequence `after`, waiting up to `timeout` seconds for
+        one. Takes no database lock.
+
+        :return: The feed's epoch (None if the feed is not enabled), and the (sequence, commit time in ns,
+                 records) batches, or None instead of the batches if the reader must start again from
+                 feed_snapshot() because it fell too far behind. A reader must start again too if the epoch
+                 is not the one of its snapshot, the feed having been replaced since.
+        :rtype: tuple
+        """
+        if self.feed is None:
+            return None, None
+        feed = self.feed
+        return feed.epoch, feed.read(after, timeout, limit)
+
+    def subscribe(self, keys=None, prefix=None, callback=None, coalesce=True):
+        """
+        Watches keys for changes instead of polling them with get_value(). The committed sets and deletes of
+        the keys, or of the string keys starting with `prefix`, arrive as ('s', key, value) and ('d', key)
+        events through `callback` or from the subscription's get(), iteration or async iteration (see
+        subscriptions.py for their order, and for the gap event after changes were lost). Waiting subscribers
+        take no lock, so they cost readers and writers nothing while idle.
+
+        :param keys: The keys to watch, or None.
+        :type keys: iterable or None
+        :param prefix: Watch every string key starting with this, or None. '' watches every key.
+        :type prefix: str or None
+        :param callback: Called with each event from the delivering thread, instead of queueing it.
+        :type callback: callable or None
+        :param coalesce: Replace a queued event of a key by its later events, keeping only the latest. Events
+                         then come in the order their keys first changed, otherwise in commit order.
+        :type coalesce: bool
+        :return: The subscription. Close it to stop receiving events.
+        :rtype: Subscription
+        :raises ValueError: In multiprocessing mode, see enable_feed().
+        """
+        if self.hub is None:
+            feed = self.enable_feed()
+            self.get_write_access()
+            try:
+                if self.hub is None:
+                    self.hub = SubscriptionHub(feed)  # Follows the feed from here, before any event is missed
+            finally:
+                self.end_write()
+        return self.hub.subscribe(keys, prefix, callback, coalesce)
+
+    def start_expiry(self):
+        """
+        Creates the timer wheel tracking key deadlines and starts the background reaper. Called with write access.
+        """
+        expiry = super().start_expiry()
+        if self.reap_interval is not None:
+            self.reaper = Reaper(self.reap_expired, self.reap_interval, REAP_BATCH)
+        return expiry
+
+    def reap_expired(self, limit=None):
+        """
+        Deletes the keys whose deadline has passed under a single exclusive lock acquisition and a single
+        persist, then waits for durability outside the lock.
+
+        :param limit: Stop after about this many keys, leaving the rest for the next call.
+        :type limit: int or None
+        :return: The number of keys deleted.
+        :rtype: int
+        """
+        if self.expiry is None:
+            return 0
+        self.get_write_access()
+        try:
+            keys = self.expiry.advance(time.monotonic(), limit)
+            results, ticket = self.apply_delete_many(keys) if keys else ({}, None)
+        finally:
+            self.end_write()
+        self.wait_durable(ticket)
+        if tracer.enabled:
+            logger.info("reap_expired: Deleted %d expired keys.", sum(val is not None for val in results.values()))
+        return len(keys)
+
+    def close(self):
+        """
+        Stops the background reaper and closes every subscription, then flushes pending changes and stops
+        background checkpointing and flushing.
+        """
+        if self.reaper is not None:
+            self.reaper.close()
+            self.reaper = None
+        if self.hub is not None:
+            self.hub.close()
+            self.hub = None
+        super().close()
+
+    def enable_indexes(self):
+        """
+        Builds the ordered key index with exclusive access, if it does not exist yet.
+        """
+        if self.indexes is not None:
+            return self.indexes
+        self.get_write_access()
+        try:
+            return super().enable_indexes()
+        finally:
+            self.end_write()
+
+    def scan(self, start=None, stop=None, prefix=None, limit=None):
+        """
+        Returns key-value pairs in key order with shared read access, so writers cannot change the index
+        during the scan. With MVCC reads, scans take the read lock too.
+        """
+        self.enable_indexes()
+        self.get_read_access()
+        try:
+            return super().scan(start, stop, prefix, limit)
+        finally:
+            self.end_read()
+
+    def create_index(self, name, field):
+        """
+        Creates a secondary index with exclusive access.
+        """
+        self.enable_indexes()
+        self.get_write_access()
+        try:
+            super().create_index(name, field)
+        finally:
+            self.end_write()
+
+    def drop_index(self, name):
+        """
+        Removes a secondary index with exclusive access.
+        """
+        self.enable_indexes()
+        self.get_write_access()
+        try:
+            super().drop_index(name)
+        finally:
+            self.end_write()
+
+    def find(self, name, value, limit=None):
+        """
+        Returns the key-value pairs whose indexed field equals `value`, with shared read access.
+        """
+        self.enable_indexes()
+        self.get_read_access()
+        try:
+            return super().find(name, value, limit)
+        finally:
+            self.end_read()
+
+    def find_range(self, name, start=None, stop=None, limit=None):
+        """
+        Returns the key-value pairs whose indexed field lies in a range, with shared read access.
+        """
+        self.enable_indexes()
+        self.get_read_access()
+        try:
+            return super().find_range(name, start, stop, limit)
+        finally:
+            self.end_read()
+
     def get_read_access(self):
         """
         Requests read access.
         """
-        logging.info("Requesting read access.")
-        win32event.WaitForSingleObject(self.sem, win32event.INFINITE)
+        if tracer.enabled:
+            logger.debug("Requesting read access.")
+        if metrics.enabled:
+            start = time.perf_counter_ns()
+            self.lock.acquire_read()
+            metrics.record('lock_read_wait', time.perf_counter_ns() - start)
+            metrics.start_hold('lock_read_hold')
+            return
+        self.lock.acquire_read()
 
     def end_read(self):
         """
         Ends read access.
         """
-        logging.info("Ending read access.")
-        win32event.ReleaseSemaphore(self.sem, 1)
+        if tracer.enabled:
+            logger.debug("Ending read access.")
+        if metrics.enabled:
+            metrics.end_hold('lock_read_hold')
+        self.lock.release_read()
 
     def delete_value(self, key):
         """
         Deletes a key-value pair with exclusive access.
         """
-        self.catch_all_semaphores()
-        logging.info(f"Attempting to delete {key}.")
-        val = super().delete_value(key)
-        logging.debug(f'Deleted - {key}: {val}')
-        self.release_all_semaphores()
+        self.get_write_access()
+        try:
+            val, ticket = self.apply_delete(key)
+        finally:
+            self.end_write()
+        self.wait_durable(ticket)
         return val
 
 
 if __name__ == '__main__':
+    configure_tracing(logging.DEBUG, filename='sync_database.log')
     # Set up a SyncDatabase in threading mode for testing
     db = SyncDatabase('threading')
     # Assertions and testing in threading mode
@@ -113,6 +638,151 @@ if __name__ == '__main__':
     assert db_multiprocess.get_value('another_key') == 200, "Failed to retrieve 'another_key'"
     assert db_multiprocess.delete_value('another_key') == 200, "Failed to delete 'another_key'"
     assert db_multiprocess.get_value('another_key') is None, "Deleted key 'another_key' should return None"
+    assert isinstance(db_multiprocess.lock, SemaphoreReadWriteLock), "Processes must share named locks by default"
+
+    # Batches take the lock once
+    assert db.set_many({'batch 1': 1, 'batch 2': 2}) == {'batch 1': True, 'batch 2': True}, "Failed to set a batch"
+    assert db.get_many(['batch 1', 'batch 2']) == {'batch 1': 1, 'batch 2': 2}, "Failed to get a batch"
+    assert db.delete_many(['batch 1', 'batch 2']) == {'batch 1': 1, 'batch 2': 2}, "Failed to delete a batch"
+
+    # Group commit: concurrent writers share syncs
+    import os
+    import threading
+    db_group = SyncDatabase('threading', persistence='log', durability='group')
+    writers = [threading.Thread(target=db_group.set_value, args=(i, f'group {i}')) for i in range(8)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    assert db_group.committer.durable == 8, "Group commit writers returned before their change was synced"
+
+    # The original semaphore scheme is still available
+    db_semaphores = SyncDatabase('threading', lock='semaphores')
+    assert db_semaphores.set_value(300, 'third_key') == True, "Failed to set 'third_key'"
+    assert db_semaphores.get_value('third_key') == 300, "Failed to retrieve 'third_key'"
+
+    # MVCC reads: readers do not wait for a writer holding the lock, and see only committed versions
+    db_mvcc = SyncDatabase('threading', lock='mvcc', file_path='mvcc_database.pkl')
+    db_mvcc.load()
+    db_mvcc.set_many({'left': 1, 'right': 1})
+    db_mvcc.get_write_access()  # A writer in the middle of a slow save
+    reader = threading.Thread(target=lambda: snapshots.append(db_mvcc.get_many(['left', 'right'])))
+    snapshots = []
+    reader.start()
+    reader.join(timeout=5)
+    db_mvcc.end_write()
+    assert snapshots == [{'left': 1, 'right': 1}], "An MVCC reader waited for the writer"
+    assert db_mvcc.delete_value('left') == 1 and db_mvcc.get_value('left') is None, "MVCC read a deleted key"
+    assert db_mvcc.get_value('right') == 1, "MVCC lost key 'right'"
+    try:
+        SyncDatabase('multiprocessing', lock='mvcc')
+        raise AssertionError("MVCC was accepted in multiprocessing mode")
+    except ValueError:
+        pass
+
+    # Transactions: reads are validated at commit and writes are applied together
+    transaction = db.begin()
+    transaction.write('account 1', 100)
+    transaction.write('account 2', 0)
+    assert transaction.commit() == 2, "Failed to commit a transaction"
+
+    def transfer(transaction):
+        balance = transaction.read('account 1')
+        transaction.write('account 1', balance - 10)
+        transaction.write('account 2', transaction.read('account 2') + 10)
+
+    db.transact(transfer)
+    assert db.get_many(['account 1', 'account 2']) == {'account 1': 90, 'account 2': 10}, "Transfer was not applied"
+    stale = db.begin()
+    stale.write('account 1', stale.read('account 1') + 1)
+    db.set_value(0, 'account 1')  # Another writer commits first
+    try:
+        stale.commit()
+        raise AssertionError("A stale transaction committed")
+    except TransactionConflict as conflict:
+        assert conflict.keys == ['account 1'], "Wrong conflicting keys reported"
+    assert db.get_value('account 1') == 0, "A conflicting transaction changed the database"
+    assert db_group.stamps is None, "Writes outside transactions were stamped"
+
+    # Stamps are pruned behind a watermark: a transaction that read a pruned key conflicts rather than miss a change
+    pruned = db.begin()
+    pruned.write('account 2', pruned.read('account 2') + 1)
+    db.set_many({f'stamped {i}': i for i in range(MAX_STAMPS)})
+    assert len(db.stamps) <= MAX_STAMPS and 'account 2' not in db.stamps, "Stamps were not pruned"
+    try:
+        pruned.commit()
+        raise AssertionError("A transaction committed after its read key was pruned")
+    except TransactionConflict:
+        pass
+    db.set_value(5, 'account 2')
+    current = db.begin()
+    current.write('account 2', current.read('account 2') + 1)
+    db.set_value(1, 'stamped 1')
+    assert current.commit() == 1 and db.get_value('account 2') == 6, "An unrelated change caused a conflict"
+    transfers = [threading.Thread(target=db_mvcc.transact, args=(transfer,)) for _ in range(8)]
+    db_mvcc.set_many({'account 1': 100, 'account 2': 0})
+    for thread in transfers:
+        thread.start()
+    for thread in transfers:
+        thread.join()
+    assert db_mvcc.get_many(['account 1', 'account 2']) == {'account 1': 20, 'account 2': 80}, "Lost a transfer"
+
+    os.remove('mvcc_database.pkl')
+
+    # Scans and secondary indexes run under the read lock while writers keep them up to date
+    db.create_index('owner', 'owner')
+    scan_writers = [threading.Thread(target=db.set_value, args=({'owner': i % 3}, f'item {i:03d}')) for i in range(60)]
+    for thread in scan_writers:
+        thread.start()
+    for thread in scan_writers:
+        thread.join()
+    assert [key for key, _ in db.scan(prefix='item ')] == [f'item {i:03d}' for i in range(60)], "Wrong prefix scan"
+    assert len(db.find('owner', 1)) == 20, "Secondary index missed concurrent writes"
+    assert db.find_range('owner', 2, limit=3) == [(f'item {i:03d}', {'owner': 2}) for i in (2, 5, 8)], "Bad range"
+
+    # TTLs: expired keys read as missing at once, and the background reaper deletes them in one batch
+    db_ttl = SyncDatabase('threading', lock='mvcc', file_path='ttl_database.pkl', reap_interval=0.1)
+    db_ttl.set_many({f'session {i}': i for i in range(100)}, ttl=0.2)
+    db_ttl.set_value('kept', 'session 0')  # No longer expires
+    assert db_ttl.get_value('session 1') == 1 and db_ttl.reaper is not None, "TTL key expired early"
+    time.sleep(0.3)
+    assert db_ttl.get_value('session 1') is None, "MVCC read an expired key"
+    time.sleep(0.3)
+    assert list(db_ttl.dict) == ['session 0'], "The reaper did not delete the expired keys"
+    db_ttl.close()
+    assert db_ttl.reaper is None, "The reaper was not stopped"
+    os.remove('ttl_database.pkl')
+
+    # Subscriptions: watchers receive committed changes in order, without polling or taking the lock
+    watched = db.subscribe(prefix='room:', coalesce=False)
+    db.set_value('hello', 'room:1')
+    db.set_many({'room:1': 'bye', 'room:2': 'hi', 'other': 0})
+    db.delete_value('room:2')
+    db.set_value(None, 'room:3')
+    db.delete_value('room:3')  # Deleting a key holding None is a change too
+    assert db.set_many([(['room:4'], 0)]) == {}, "An unhashable key was set"
+    events = [watched.get(timeout=5) for _ in range(6)]
+    assert events == [('s', 'room:1', 'hello'), ('s', 'room:1', 'bye'), ('s', 'room:2', 'hi'), ('d', 'room:2'),
+                      ('s', 'room:3', None), ('d', 'room:3')], "Wrong events delivered"
+    watched.close()
+
+    # Metrics: lock waits and holds, serialization, writes and syncs are recorded once enabled
+    from metrics import enable_metrics, disable_metrics
+    enable_metrics()
+    db_metrics = SyncDatabase('threading', persistence='log', durability='fsync', file_path='metrics_database.pkl',
+                              log_path='metrics_database.wal')
+    db_metrics.set_value(400, 'fourth_key')
+    db_metrics.get_value('fourth_key')
+    disable_metrics()
+    recorded = metrics.snapshot()
+    for name in ('lock_write_wait', 'lock_write_hold', 'lock_read_wait', 'lock_read_hold', 'serialize', 'write',
+                 'fsync', 'write_bytes'):
+        assert recorded['histograms'][name]['count'] >= 1, f"Metric {name} was not recorded"
+    assert recorded['counters']['log_appends'] == 1, "The log append was not counted"
+    db_metrics.io.close(db_metrics.handle)
+    db_metrics.io.close(db_metrics.log_handle)
+    os.remove('metrics_database.pkl')
+    os.remove('metrics_database.wal')
 
-    logging.info("All assertions passed in both threading and multiprocessing modes.")
+    logger.info("All assertions passed in both threading and multiprocessing modes.")
     print("All assertions passed in both threading and multiprocessing modes.")
@@ -0,0 +1,106 @@
+import logging
+import logging.handlers
+import queue
+import sys
+
+logger = logging.getLogger('database')
+logger.addHandler(logging.NullHandler())  # Silent until configure_tracing() is called
+logger.setLevel(logging.WARNING)
+
+
+class Tracer:
+    def __init__(self):
+        """
+        Holds the switch the key/value hot paths check before doing any tracing work, so that with tracing off
+        an operation costs one attribute lookup instead of a logger call and string formatting.
+        """
+        self.enabled = False
+        self.handlers = []
+        self.listener = None
+
+
+tracer = Tracer()
+
+
+def configure_tracing(level=logging.INFO, filename=None, echo=False, use_queue=False):
+    """
+    Turns on tracing of database operations.
+
+    :param level: The lowest level to record. Operations are traced at INFO and DEBUG.
+    :type level: int
+    :param filename: A log file to append records to, or None.
+    :type filename: str or None
+    :param echo: If True, also print every message to stdout, as the databases used to do unconditionally.
+    :type echo: bool
+    :param use_queue: If True, the calling thread only enqueues records and a background thread formats
+                      and writes them, keeping file and console I/O off the operation's critical path.
+    :type use_queue: bool
+    :return: None
+    :rtype: None
+    """
+    stop_tracing()
+    handlers = []
+    if filename is not None:
+        file_handler = logging.FileHandler(filename)
+        file_handler.setFormatter(logging.Formatter('%(levelname)s:%(name)s:%(message)s'))
+        handlers.append(file_handler)
+    if echo:
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(logging.Formatter('%(message)s'))
+        handlers.append(stream_handler)
+    if use_queue and handlers:
+        records = queue.SimpleQueue()
+        tracer.listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+        tracer.listener.start()
+        handlers = [logging.handlers.QueueHandler(records)]
+    for handler in handlers:
+        logger.addHandler(handler)
+    tracer.handlers = handlers
+    logger.setLevel(level)
+    tracer.enabled = logger.isEnabledFor(logging.INFO) and (bool(handlers) or logger.propagate)
+
+
+def stop_tracing():
+    """
+    Turns tracing off again, flushing and closing any handlers added by configure_tracing().
+
+    :return: None
+    :rtype: None
+    """
+    tracer.enabled = False
+    logger.setLevel(logging.WARNING)
+    if tracer.listener is not None:
+        tracer.listener.stop()  # Drains the queue before returning
+        for handler in tracer.listener.handlers:
+            handler.close()
+        tracer.listener = None
+    for handler in tracer.handlers:
+        logger.removeHandler(handler)
+        handler.close()
+    tracer.handlers = []
+
+
+if __name__ == '__main__':
+    import io
+    import contextlib
+
+    assert not tracer.enabled, "Tracing must be off by default"
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        configure_tracing(echo=True)
+        assert tracer.enabled, "configure_tracing() did not enable tracing"
+        logger.info("set_value: Set %s = %s", 'a', 1)
+        logger.debug("not recorded at INFO level")
+        stop_tracing()
+    assert output.getvalue() == "set_value: Set a = 1\n", f"Unexpected trace output {output.getvalue()!r}"
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        configure_tracing(logging.DEBUG, echo=True, use_queue=True)
+        logger.debug("queued %d", 1)
+        stop_tracing()
+    assert output.getvalue() == "queued 1\n", "Queued records were not written on stop"
+    assert not tracer.enabled, "stop_tracing() did not disable tracing"
+
+    print("All assertions passed.")
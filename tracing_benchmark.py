@@ -0,0 +1,56 @@
+import contextlib
+import logging
+import os
+import sys
+import time
+
+from dict_database import DictDatabase
+from tracing import configure_tracing, stop_tracing
+
+OPERATIONS = 100000
+TRACE_FILE = 'tracing_benchmark.log'
+
+
+def measure(operations):
+    """
+    Times set, get and delete on a DictDatabase.
+
+    :return: Operations per second for each operation.
+    :rtype: dict
+    """
+    db = DictDatabase()
+    keys = [f'key {i}' for i in range(operations)]
+    rates = {}
+    start = time.perf_counter()
+    for i, key in enumerate(keys):
+        db.set_value(i, key)
+    rates['set'] = operations / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for key in keys:
+        db.get_value(key)
+    rates['get'] = operations / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for key in keys:
+        db.delete_value(key)
+    rates['delete'] = operations / (time.perf_counter() - start)
+    return rates
+
+
+if __name__ == '__main__':
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else OPERATIONS
+    configurations = {
+        # What every operation used to cost: a DEBUG file handler plus a print per message
+        'before (DEBUG file + print)': dict(level=logging.DEBUG, filename=TRACE_FILE, echo=True),
+        'DEBUG file, async queue': dict(level=logging.DEBUG, filename=TRACE_FILE, use_queue=True),
+        'after (silent default)': None,
+    }
+    print(f'{operations} operations per measurement')
+    for name, settings in configurations.items():
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            if settings is not None:
+                configure_tracing(**settings)
+            rates = measure(operations)
+            stop_tracing()
+        print(f'{name:>28}: ' + '  '.join(f'{operation} {rate:10.0f} ops/s' for operation, rate in rates.items()))
+    if os.path.exists(TRACE_FILE):
+        os.remove(TRACE_FILE)
@@ -0,0 +1,100 @@
+from tracing import logger, tracer
+
+MAX_RETRIES = 10
+_DELETED = object()  # A buffered delete
+
+
+class TransactionConflict(Exception):
+    """
+    Raised when a transaction cannot commit because a key it read was changed by another commit since.
+    """
+
+    def __init__(self, keys):
+        super().__init__(f"Keys changed since they were read: {sorted(map(repr, keys))}")
+        self.keys = keys
+
+
+class Transaction:
+    def __init__(self, database):
+        """
+        Collects reads and writes against a SyncDatabase to commit them atomically. Nothing is locked while
+        the transaction runs: each read remembers the version stamp of its key, writes are buffered, and
+        commit() checks under one short write lock that no stamp has moved before applying every write as a
+        single persisted batch (optimistic concurrency control).
+
+        :param database: The database, which keeps a version stamp per key.
+        :type database: SyncDatabase
+        """
+        self.database = database
+        self.reads = {}  # Key -> stamp when first read
+        self.writes = {}  # Key -> buffered value, or _DELETED
+        self.done = False
+
+    def read(self, key):
+        """
+        Reads a key, seeing this transaction's own buffered writes.
+
+        :return: The value, or None if the key does not exist.
+        :rtype: any or None
+        """
+        if key in self.writes:
+            val = self.writes[key]
+            return None if val is _DELETED else val
+        val, stamp = self.database.read_stamped(key)
+        self.reads.setdefault(key, stamp)  # A repeated read is validated against the first one
+        return val
+
+    def write(self, key, val):
+        """
+        Buffers a set until commit.
+        """
+        hash(key)  # Fail now rather than at commit for keys that cannot be stored
+        self.writes[key] = val
+
+    def delete(self, key):
+        """
+        Buffers a delete until commit.
+        """
+        self.writes[key] = _DELETED
+
+    def commit(self):
+        """
+        Validates the reads and applies the writes as one atomic, durable batch.
+
+        :return: The number of changes applied.
+        :rtype: int
+        :raises TransactionConflict: If a key read by the transaction was changed by another commit. Nothing
+                                     is applied, and the transaction can be retried from the start.
+        """
+        if self.done:
+            raise RuntimeError("The transaction was already committed.")
+        self.done = True
+        records = [['d', key] if val is _DELETED else ['s', key, val] for key, val in self.writes.items()]
+        return self.database.commit_transaction(self.reads, records)
+
+
+def run_transaction(database, function, retries=MAX_RETRIES):
+    """
+    Runs `function(transaction)` and commits, starting again on a conflict.
+
+    :param database: The database.
+    :type database: SyncDatabase
+    :param function: Reads and writes through the transaction it is given; its result is returned.
+    :type function: callable
+    :param retries: How many times to start again after a conflict.
+    :type retries: int
+    :return: The result of the last call of `function`.
+    :rtype: any
+    :raises TransactionConflict: If the last attempt still conflicted.
+    """
+    for attempt in range(retries + 1):
+        transaction = Transaction(database)
+        result = function(transaction)
+        try:
+            transaction.commit()
+            return result
+        except TransactionConflict as conflict:
+            if attempt == retries:
+                raise
+            if tracer.enabled:
+                logger.info("run_transaction: Retrying after a conflict on %d keys.", len(conflict.keys))
@@ -0,0 +1,77 @@
+import os
+import sys
+import threading
+import time
+
+from sync_database import SyncDatabase
+
+WORKERS = 4
+UPDATES = 200  # Read-modify-write rounds per worker
+KEYS_PER_UPDATE = 4
+PRELOADED_KEYS = 2000
+CONFIGURATIONS = [('snapshot', 'rwlock'), ('log', 'rwlock'), ('log', 'mvcc')]
+
+
+def measure(persistence, lock, style, shared_keys):
+    """
+    Runs WORKERS threads that each increment KEYS_PER_UPDATE counters UPDATES times, either with one
+    get_value and one set_value per key, each taking the lock and persisting on its own, or with one
+    transaction per round. Workers update their own keys, or the same keys when `shared_keys` is set.
+
+    :return: Rounds per second, and attempts per round (above 1 when transactions conflicted).
+    :rtype: tuple
+    """
+    paths = dict(file_path=f'transaction_benchmark_{os.getpid()}.pkl',
+                 log_path=f'transaction_benchmark_{os.getpid()}.wal')
+    db = SyncDatabase('threading', lock=lock, persistence=persistence, **paths)
+    db.set_many({f'key {i}': 0 for i in range(PRELOADED_KEYS)})
+    attempts = [0] * WORKERS
+
+    def worker(index):
+        base = 0 if shared_keys else index * KEYS_PER_UPDATE
+        keys = [f'key {base + i}' for i in range(KEYS_PER_UPDATE)]
+
+        def update(transaction):
+            attempts[index] += 1
+            for key in keys:
+                transaction.write(key, transaction.read(key) + 1)
+
+        for _ in range(UPDATES):
+            if style == 'transaction':
+                db.transact(update, retries=1000)
+            else:
+                attempts[index] += 1
+                for key in keys:
+                    db.set_value(db.get_value(key) + 1, key)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(WORKERS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if style == 'transaction':
+        expected = WORKERS * UPDATES if shared_keys else UPDATES
+        assert db.get_value('key 0') == expected, "A transaction lost an update"
+    db.close()
+    db.io.close(db.handle)
+    if db.log_handle is not None:
+        db.io.close(db.log_handle)
+    for path in paths.values():
+        if os.path.exists(path):
+            os.remove(path)
+    return WORKERS * UPDATES / elapsed, sum(attempts) / (WORKERS * UPDATES)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        UPDATES = int(sys.argv[1])
+    print(f'{WORKERS} threads x {UPDATES} rounds of {KEYS_PER_UPDATE} read-modify-writes, {PRELOADED_KEYS} keys')
+    for persistence, lock in CONFIGURATIONS:
+        for shared_keys in (False, True):
+            contention = 'same keys' if shared_keys else 'own keys'
+            for style in ('per-key', 'transaction'):
+                rate, attempts = measure(persistence, lock, style, shared_keys)
+                print(f'{persistence:>8} {lock:>6} {contention:>9} {style:>11}: {rate:8.0f} rounds/s, '
+                      f'{attempts:5.2f} attempts per round')
@@ -0,0 +1,213 @@
+import threading
+import time
+
+from tracing import logger
+
+TICK = 0.1  # Seconds per tick of the finest wheel, the precision of expiry times
+SLOTS = 64  # Slots per wheel
+LEVELS = 4  # Wheels; together they cover SLOTS ** LEVELS ticks (about 19 days), later deadlines wait in overflow
+REAP_INTERVAL = 1.0
+
+
+class TimerWheel:
+    def __init__(self, now=None, tick=TICK, slots=SLOTS, levels=LEVELS):
+        """
+        Tracks key deadlines in hierarchical timing wheels. Wheel 0 has one slot per tick; each slot of wheel n
+        covers a whole turn of wheel n - 1, and its keys are spread over wheel n - 1 when that turn begins.
+        Scheduling and cancelling cost O(1), and advancing the time only visits the slots that come due, so
+        the cost of expiry depends on how many keys expire, not on how many carry a deadline.
+
+        :param now: The current time.monotonic() value, by default read now.
+        :type now: float or None
+        :param tick: Seconds per tick. Deadlines are rounded up to a whole tick.
+        :type tick: float
+        :param slots: Slots per wheel.
+        :type slots: int
+        :param levels: Number of wheels.
+        :type levels: int
+        """
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.wheels = [[set() for _ in range(slots)] for _ in range(levels)]
+        self.overflow = set()  # Keys due after the last wheel's span
+        self.positions = {}  # Key -> (level or -1 for overflow, slot, deadline tick)
+        self.current = int((time.monotonic() if now is None else now) / tick)  # The last tick processed
+
+    def __len__(self):
+        return len(self.positions)
+
+    def schedule(self, key, deadline):
+        """
+        Sets or moves the deadline of a key.
+
+        :param deadline: The time.monotonic() value at which the key expires.
+        :type deadline: float
+        """
+        self.cancel(key)
+        due = max(-int(-deadline // self.tick), self.current + 1)  # Rounded up, and never in the past
+        self.place(key, due)
+
+    def place(self, key, due):
+        """
+        Puts a key in the slot of the finest wheel whose turn still reaches its deadline tick.
+
+        :return: False if the deadline has been reached already, in which case the key is not placed.
+        :rtype: bool
+        """
+        delta = due - self.current
+        if delta <= 0:
+            return False
+        span = 1
+        for level, wheel in enumerate(self.wheels):
+            if delta < span * self.slots:
+                slot = (due // span) % self.slots
+                wheel[slot].add(key)
+                self.positions[key] = (level, slot, due)
+                return True
+            span *= self.slots
+        self.overflow.add(key)
+        self.positions[key] = (-1, 0, due)
+        return True
+
+    def cancel(self, key):
+        """
+        Removes the deadline of a key, if it has one.
+        """
+        position = self.positions.pop(key, None)
+        if position is None:
+            return
+        level, slot, _ = position
+        if level < 0:
+            self.overflow.discard(key)
+        else:
+            self.wheels[level][slot].discard(key)
+
+    def deadline(self, key):
+        """
+        Returns the time.monotonic() value at which a key expires, or None if it has no deadline.
+        """
+        position = self.positions.get(key)
+        return None if position is None else position[2] * self.tick
+
+    def expired(self, key, now):
+        """
+        Returns True if a key's deadline has passed, whether or not advance() has reached it yet.
+        """
+        position = self.positions.get(key)
+        return position is not None and position[2] * self.tick <= now
+
+    def advance(self, now, limit=None):
+        """
+        Moves the time forward tick by tick, collecting the keys that come due.
+
+        :param now: The current time.monotonic() value.
+        :type now: float
+        :param limit: Stop once at least this many keys are due, leaving later ticks for the next call.
+        :type limit: int or None
+        :return: The keys whose deadline has passed. Their deadlines are removed.
+        :rtype: list
+        """
+        target = int(now / self.tick)
+        due = []
+        while self.current < target and (limit is None or len(due) < limit):
+            self.current += 1
+            span = 1
+            for level in range(1, self.levels + 1):
+                span *= self.slots
+                if self.current % span:
+                    break
+                # A turn of the wheel below begins: spread the keys of its slot over the finer wheels
+                if level == self.levels:
+                    keys, self.overflow = self.overflow, set()
+                else:
+                    slot = (self.current // span) % self.slots
+                    keys, self.wheels[level][slot] = self.wheels[level][slot], set()
+                for key in keys:
+                    if not self.place(key, self.positions.pop(key)[2]):
+                        due.append(key)
+            slot = self.current % self.slots
+            keys, self.wheels[0][slot] = self.wheels[0][slot], set()
+            for key in keys:
+                del self.positions[key]
+            due.extend(keys)
+        return due
+
+
+class Reaper:
+    def __init__(self, reap, interval=REAP_INTERVAL, batch=None):
+        """
+        Calls `reap(batch)` from a background thread every `interval` seconds to delete expired keys, and
+        again right away while it returns a full batch, so a backlog is cleared one batch at a time.
+
+        :param reap: Deletes up to about `batch` expired keys and returns how many it deleted.
+        :type reap: callable
+        :param interval: Seconds between runs.
+        :type interval: float
+        :param batch: The most keys to delete per call, or None for all expired keys at once.
+        :type batch: int or None
+        """
+        self.reap = reap
+        self.interval = interval
+        self.batch = batch
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='ttl-reaper', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """
+        Background loop reaping expired keys.
+        """
+        while not self.stopped.wait(self.interval):
+            try:
+                reaped = self.reap(self.batch)
+                while self.batch is not None and reaped >= self.batch and not self.stopped.is_set():
+                    reaped = self.reap(self.batch)
+            except Exception as error:  # Keep reaping: the keys that are still due are retried next time
+                logger.error("run: Failed to reap expired keys: %r", error)
+
+    def close(self):
+        """
+        Stops the background thread.
+        """
+        self.stopped.set()
+        self.thread.join()
+
+
+if __name__ == '__main__':
+    wheel = TimerWheel(now=0.0, tick=1.0, slots=4, levels=2)  # Spans 16 ticks, then overflow
+    for key, deadline in (('a', 1), ('b', 3), ('c', 6), ('d', 15), ('e', 40), ('f', 5)):
+        wheel.schedule(key, deadline)
+    wheel.schedule('f', 7)  # Moved
+    wheel.cancel('b')
+    assert wheel.expired('a', 1.0) and not wheel.expired('c', 5.9), "Wrong lazy expiry check"
+    assert wheel.advance(2.5) == ['a'], "Expected only 'a' due after 2.5 ticks"
+    assert sorted(wheel.advance(7.0)) == ['c', 'f'], "Keys did not cascade down in time"
+    assert wheel.advance(14.9) == [], "A key expired early"
+    assert wheel.advance(15.0) == ['d'], "Expected 'd' at tick 15"
+    assert wheel.advance(39.0) == [] and wheel.advance(40.0) == ['e'], "Overflow key expired at the wrong tick"
+    assert len(wheel) == 0 and not any(slot for level in wheel.wheels for slot in level), "Slots not emptied"
+
+    # Batches can be capped, leaving the rest for the next call
+    for i in range(100):
+        wheel.schedule(i, 41 + i % 3)
+    first = wheel.advance(50.0, limit=10)
+    assert len(first) >= 10 and len(first) + len(wheel.advance(50.0)) == 100, "A capped advance lost keys"
+
+    # The reaper survives a failing run
+    calls = []
+
+    def reap(batch):
+        calls.append(batch)
+        if len(calls) == 1:
+            raise ValueError("Failed once")
+        return 0
+
+    reaper = Reaper(reap, 0.01, 10)
+    deadline = time.monotonic() + 5
+    while len(calls) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(calls) >= 2 and reaper.thread.is_alive(), "The reaper stopped after a failure"
+    reaper.close()
+
+    print("All assertions passed.")
@@ -0,0 +1,110 @@
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+from dict_database import DictDatabase
+from sync_database import SyncDatabase
+from ttl import TimerWheel, TICK
+
+KEY_COUNT = 1000000
+SPREAD = 3600.0  # Deadlines are spread over this many seconds
+EXPIRED_KEYS = 2000  # Keys expired at once in the reaping comparison
+
+
+def set_rate(key_count, ttl):
+    """
+    Returns sets per second into a DictDatabase, with or without a TTL on every key.
+    """
+    db = DictDatabase()
+    start = time.perf_counter()
+    for i in range(key_count):
+        db.set_value(i, f'key {i}', ttl)
+    return key_count / (time.perf_counter() - start)
+
+
+def wheel_costs(key_count):
+    """
+    Schedules `key_count` deadlines spread over SPREAD seconds, then advances the wheel through all of them in
+    simulated time, one reaper interval at a time.
+
+    :return: Microseconds per schedule, bytes per scheduled key, and microseconds per expired key and per tick.
+    :rtype: tuple
+    """
+    rng = random.Random(1)
+    deadlines = [rng.uniform(1.0, SPREAD) for _ in range(key_count)]
+    tracemalloc.start()
+    wheel = TimerWheel(now=0.0)
+    for key, deadline in enumerate(deadlines):
+        wheel.schedule(key, deadline)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    wheel = TimerWheel(now=0.0)  # Timed again without tracing allocations
+    for key, deadline in enumerate(deadlines):
+        wheel.schedule(key, deadline)
+    scheduled = time.perf_counter() - start
+
+    expired = 0
+    start = time.perf_counter()
+    now = 0.0
+    while now < SPREAD + 1:
+        now += 1.0
+        expired += len(wheel.advance(now))
+    advanced = time.perf_counter() - start
+    assert expired == key_count, "The wheel lost keys"
+    ticks = (SPREAD + 1) / TICK
+    return scheduled / key_count * 1e6, memory / key_count, advanced / key_count * 1e6, advanced / ticks * 1e6
+
+
+def reap_times(persistence, expired_keys):
+    """
+    Deletes `expired_keys` stale keys from a SyncDatabase once one delete_value call per key, as callers had
+    to, and once with a single reap_expired() call.
+
+    :return: Seconds for each.
+    :rtype: tuple
+    """
+    paths = dict(file_path=f'ttl_benchmark_{os.getpid()}.pkl', log_path=f'ttl_benchmark_{os.getpid()}.wal')
+    db = SyncDatabase('threading', persistence=persistence, reap_interval=None, **paths)
+    db.set_many({f'live {i}': i for i in range(expired_keys)})
+    keys = [f'stale {i}' for i in range(expired_keys)]
+
+    db.set_many({key: 0 for key in keys})
+    start = time.perf_counter()
+    for key in keys:
+        db.delete_value(key)
+    one_by_one = time.perf_counter() - start
+
+    db.set_many({key: 0 for key in keys}, ttl=TICK)
+    time.sleep(2 * TICK)
+    start = time.perf_counter()
+    assert db.reap_expired() == expired_keys, "Not every expired key was reaped"
+    reaped = time.perf_counter() - start
+
+    db.close()
+    db.io.close(db.handle)
+    if db.log_handle is not None:
+        db.io.close(db.log_handle)
+    for path in paths.values():
+        if os.path.exists(path):
+            os.remove(path)
+    return one_by_one, reaped
+
+
+if __name__ == '__main__':
+    key_count = int(sys.argv[1]) if len(sys.argv) > 1 else KEY_COUNT
+
+    plain, with_ttl = set_rate(key_count // 4, None), set_rate(key_count // 4, 60.0)
+    print(f'DictDatabase sets: {plain:9.0f}/s without TTL, {with_ttl:9.0f}/s with a TTL')
+
+    schedule, memory, per_key, per_tick = wheel_costs(key_count)
+    print(f'{key_count} deadlines over {SPREAD:.0f} s: schedule {schedule:5.2f} us, {memory:5.0f} bytes per key, '
+          f'expiry {per_key:5.2f} us per key, {per_tick:6.2f} us per {TICK} s tick')
+
+    for persistence in ('snapshot', 'log'):
+        one_by_one, reaped = reap_times(persistence, EXPIRED_KEYS)
+        print(f'{persistence:>8}: {EXPIRED_KEYS} stale keys, delete_value each {one_by_one * 1000:8.1f} ms, '
+              f'reap_expired {reaped * 1000:6.1f} ms ({one_by_one / reaped:5.0f}x)')